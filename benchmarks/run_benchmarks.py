@@ -0,0 +1,207 @@
+# !/usr/bin/env python
+"""
+SEED Platform (TM), Copyright (c) Alliance for Sustainable Energy, LLC, and other contributors.
+See also https://github.com/SEED-platform/seed/blob/main/LICENSE.md
+"""
+
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import redirect_stdout
+from pathlib import Path
+from typing import Any, Callable
+
+import geopandas as gpd
+import numpy as np
+
+from benchmarks.stubs import stub_mapquest, stub_overpass
+from benchmarks.synthetic import (
+    DEFAULT_DENSITY,
+    generate_footprints,
+    generate_locations,
+    synthetic_area,
+    write_osm_extract,
+    write_quadkeys,
+)
+from utils.geocode_addresses import MapQuestGeocoder, geocode_addresses
+from utils.load_quadkey import load_quadkey, quadkey_cache_file
+from utils.match_footprints import match_footprints
+from utils.normalize_address import _normalize_address_memoized, normalize_addresses
+from utils.open_street_map import process_dataframe_for_osm_buildings
+from utils.osm_index import OSMBuildingIndex, set_osm_index
+from utils.output_writers import SUPPORTED_OUTPUT_FORMATS, CoveredBuildingsWriter, pa
+from utils.quadkey_helpers import quadkeys
+from utils.tile_planner import plan_quadkeys
+from utils.ubid import add_ubid_to_geodataframe, encode_ubids
+
+COLUMNS = [
+    "address", "city", "state", "postal_code", "side_of_street", "neighborhood", "county",
+    "country", "latitude", "longitude", "quality", "footprint_match", "proximity_to_geocoding_coord", "height", "ubid",
+    "geometry"]  # fmt: off
+FLOAT_COLUMNS = ["latitude", "longitude", "proximity_to_geocoding_coord", "height"]
+
+
+def measure(results: list[dict], stage: str, size: int, func: Callable[..., Any], *args, **kwargs) -> Any:
+    """Time a stage, then run it again to measure its peak memory, and return the result of the first run
+
+    Peak memory is measured separately since tracing allocations slows the stage down. It only counts
+    memory allocated through Python (including numpy arrays), not by GEOS or GDAL.
+    """
+    # the workflow prints its progress, which would only add noise
+    with redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        seconds = time.perf_counter() - start
+
+        tracemalloc.start()
+        func(*args, **kwargs)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    results.append(
+        {
+            "stage": stage,
+            "size": size,
+            "seconds": round(seconds, 4),
+            "per_second": round(size / seconds, 1) if seconds > 0 else None,
+            "peak_memory_mb": round(peak / 1e6, 2),
+        }
+    )
+    print(f"{stage:<32} {size:>9,} {seconds:>9.3f}s {size / seconds:>12,.0f}/s {peak / 1e6:>9.1f} MB")
+    return result
+
+
+def _normalize(streets: list[str]) -> list:
+    # only measure the first normalization of each address, not the memoized results
+    _normalize_address_memoized.cache_clear()
+    return normalize_addresses(streets, max_workers=1)
+
+
+def _load_quadkeys(quadkey_list: list[int], save_directory: Path, cached: bool) -> dict[int, gpd.GeoDataFrame]:
+    if not cached:
+        for quadkey in quadkey_list:
+            quadkey_cache_file(quadkey, save_directory).unlink(missing_ok=True)
+    return {quadkey: load_quadkey(quadkey, save_directory) for quadkey in quadkey_list}
+
+
+def _match(longitudes: np.ndarray, latitudes: np.ndarray, loaded: dict[int, gpd.GeoDataFrame]) -> list[tuple[np.ndarray, Any]]:
+    matches = []
+    for quadkey, positions in plan_quadkeys(quadkeys(longitudes, latitudes)):
+        points = gpd.GeoDataFrame(crs="epsg:4326", geometry=gpd.points_from_xy(longitudes[positions], latitudes[positions]))
+        matches.append((positions, match_footprints(points, quadkey, loaded.get)))
+    return matches
+
+
+def _add_ubids(footprints: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
+    return add_ubid_to_geodataframe(footprints.copy())
+
+
+def _write(data: list[dict], output_format: str, directory: Path):
+    (directory / output_format).mkdir(parents=True, exist_ok=True)
+    with CoveredBuildingsWriter(directory / output_format, "covered-buildings", COLUMNS, FLOAT_COLUMNS, formats=[output_format]) as writer:
+        writer.write(data)
+
+
+def _osm_buildings(footprints: gpd.GeoDataFrame, way_ids: np.ndarray):
+    with stub_overpass(footprints):
+        return process_dataframe_for_osm_buildings(gpd.GeoDataFrame({"id": np.arange(len(way_ids)), "osm_id": way_ids}), method="osm_id")
+
+
+def _osm_buildings_bulk(footprints: gpd.GeoDataFrame, longitudes: np.ndarray, latitudes: np.ndarray):
+    rows = gpd.GeoDataFrame({"id": np.arange(len(longitudes)), "latitude": latitudes, "longitude": longitudes})
+    with stub_overpass(footprints):
+        return process_dataframe_for_osm_buildings(rows, method="lat_long", bulk=True)
+
+
+def _osm_buildings_indexed(index: "OSMBuildingIndex", way_ids: np.ndarray):
+    set_osm_index(index)
+    try:
+        return process_dataframe_for_osm_buildings(gpd.GeoDataFrame({"id": np.arange(len(way_ids)), "osm_id": way_ids}), method="osm_id")
+    finally:
+        set_osm_index(None)
+
+
+def benchmark(sizes: list[int], density: float, work_directory: Path) -> list[dict]:
+    """Benchmark each stage of the workflow against synthetic footprints and addresses, without any network requests"""
+    results = []
+    quadkey_directory = work_directory / "quadkeys"
+    print("Generating synthetic footprints", file=sys.stderr)
+    footprints = generate_footprints(synthetic_area(), density)
+    quadkey_list = write_quadkeys(footprints, quadkey_directory)
+
+    print(f"{'stage':<32} {'size':>9} {'time':>10} {'throughput':>14} {'peak memory':>12}")
+    measure(results, "load_quadkey (geojsonl)", len(footprints), _load_quadkeys, quadkey_list, quadkey_directory, False)
+    if pa is not None:
+        measure(results, "load_quadkey (parquet cache)", len(footprints), _load_quadkeys, quadkey_list, quadkey_directory, True)
+    with redirect_stdout(io.StringIO()):
+        loaded = _load_quadkeys(quadkey_list, quadkey_directory, True)
+    # build the spatial indexes up front, so that the first size doesn't include them
+    indexed = sum(quadkey_footprints.sindex.size for quadkey_footprints in loaded.values())
+    print(f"Indexed {indexed:,} footprints", file=sys.stderr)
+    write_osm_extract(footprints, work_directory / "extract.osm")
+    with redirect_stdout(io.StringIO()):
+        osm_index = OSMBuildingIndex(work_directory / "extract.osm")
+
+    for size in sizes:
+        locations, longitudes, latitudes = generate_locations(footprints, size)
+        streets = [location["street"] for location in locations]
+
+        measure(results, "normalize_address", size, _normalize, streets)
+
+        # the batches are sent as fast as possible, to measure the client rather than the rate limit
+        geocoder = MapQuestGeocoder("benchmark", requests_per_second=1e9)
+        with stub_mapquest(dict(zip(streets, zip(longitudes.tolist(), latitudes.tolist())))):
+            data = measure(results, "geocode_addresses (stub)", size, geocode_addresses, locations, geocoder=geocoder)
+
+        matches = measure(results, "match_footprints", size, _match, longitudes, latitudes, loaded)
+        for positions, matched in matches:
+            for i, match in zip(positions, matched.itertuples(index=False)):
+                data[i] |= match._asdict()
+        geometries = np.array([datum["geometry"] for datum in data], dtype=object)
+
+        ubids = measure(results, "encode_ubids", size, encode_ubids, geometries)
+        for datum, ubid in zip(data, ubids):
+            datum["ubid"] = ubid
+        sample = footprints.iloc[:size]
+        measure(results, "add_ubid_to_geodataframe", len(sample), _add_ubids, sample)
+
+        for output_format in SUPPORTED_OUTPUT_FORMATS:
+            if output_format in ["parquet", "fgb"] and pa is None:
+                continue
+            measure(results, f"write {output_format}", size, _write, data, output_format, work_directory / "output")
+
+        way_ids = np.arange(1, min(size, len(footprints)) + 1)
+        measure(results, "osm buildings (stub overpass)", len(way_ids), _osm_buildings, footprints, way_ids)
+        measure(results, "osm buildings (local index)", len(way_ids), _osm_buildings_indexed, osm_index, way_ids)
+        measure(results, "osm bulk (stub overpass)", size, _osm_buildings_bulk, footprints, longitudes, latitudes)
+
+    return results
+
+
+def main():
+    BENCHMARK_SIZES = [int(size) for size in os.getenv("BENCHMARK_SIZES", "1000,10000").split(",")]
+    BENCHMARK_DENSITY = float(os.getenv("BENCHMARK_DENSITY", DEFAULT_DENSITY))
+    BENCHMARK_REPORT = os.getenv("BENCHMARK_REPORT")
+
+    with tempfile.TemporaryDirectory() as work_directory:
+        results = benchmark(BENCHMARK_SIZES, BENCHMARK_DENSITY, Path(work_directory))
+
+    if BENCHMARK_REPORT:
+        report = {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "density": BENCHMARK_DENSITY,
+            "results": results,
+        }
+        with open(BENCHMARK_REPORT, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
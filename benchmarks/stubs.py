@@ -0,0 +1,135 @@
+# !/usr/bin/env python
+"""
+SEED Platform (TM), Copyright (c) Alliance for Sustainable Energy, LLC, and other contributors.
+See also https://github.com/SEED-platform/seed/blob/main/LICENSE.md
+"""
+
+import json
+import re
+from collections.abc import Iterator
+from contextlib import contextmanager
+from unittest import mock
+
+import geopandas as gpd
+import numpy as np
+import requests
+import shapely
+
+from utils.osm_client import OSMClient, set_osm_client
+from utils.quadkey_helpers import search_bounds
+
+
+def _response(body: dict, status_code: int = 200) -> requests.Response:
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = json.dumps(body).encode()
+    return response
+
+
+@contextmanager
+def stub_mapquest(coordinates: dict[str, tuple[float, float]]) -> Iterator[None]:
+    """Answer MapQuest batch geocoding requests with the (longitude, latitude) of each street, without any network requests"""
+
+    def post(session, url, **kwargs):
+        results = []
+        for location in kwargs["json"]["locations"]:
+            longitude, latitude = coordinates[location["street"]]
+            result = {
+                "street": location["street"],
+                "adminArea1": "US",
+                "adminArea1Type": "Country",
+                "adminArea3": location["state"],
+                "adminArea3Type": "State",
+                "adminArea4": "Denver",
+                "adminArea4Type": "County",
+                "adminArea5": location["city"],
+                "adminArea5Type": "City",
+                "postalCode": "80202",
+                "geocodeQualityCode": "P1AAA",
+                "sideOfStreet": "L",
+                "displayLatLng": {"lat": latitude, "lng": longitude},
+            }
+            results.append({"providedLocation": location, "locations": [result]})
+        return _response({"results": results})
+
+    with mock.patch.object(requests.Session, "post", post):
+        yield
+
+
+class StubOverpass:
+    """Answers the Overpass queries of `utils.open_street_map` with the footprints as OSM building ways
+
+    The way of the footprint at position `i` has the id `i + 1`, and its nodes have the ids `10 * (i + 1) + k`.
+    """
+
+    def __init__(self, footprints: gpd.GeoDataFrame):
+        self.footprints = footprints.reset_index(drop=True)
+        self.rings = [np.asarray(ring.coords) for ring in self.footprints.geometry.exterior]
+        centroids = self.footprints.geometry.centroid
+        self.centers = list(zip(centroids.y.tolist(), centroids.x.tolist()))
+        self.heights = self.footprints["height"].tolist()
+        self.requests = 0
+
+    def _way(self, way_id: int, geometry: bool = False) -> dict:
+        position = way_id - 1
+        ring = self.rings[position]
+        # the last node closes the ring, like OSM ways
+        nodes = [10 * way_id + k for k in range(len(ring) - 1)]
+        way = {
+            "type": "way",
+            "id": way_id,
+            "center": {"lat": self.centers[position][0], "lon": self.centers[position][1]},
+            "nodes": [*nodes, nodes[0]],
+            "tags": {"building": "yes", "height": str(self.heights[position])},
+        }
+        if geometry:
+            way["geometry"] = [{"lat": float(latitude), "lon": float(longitude)} for longitude, latitude in ring]
+        return way
+
+    def _node(self, node_id: int) -> dict:
+        longitude, latitude = self.rings[node_id // 10 - 1][node_id % 10]
+        return {"type": "node", "id": node_id, "lat": float(latitude), "lon": float(longitude)}
+
+    def _ways_around(self, distance: float, latitude: float, longitude: float) -> list[dict]:
+        point = shapely.Point(longitude, latitude)
+        candidates = self.footprints.sindex.query(shapely.box(*search_bounds(longitude, latitude, distance)), predicate="intersects")
+        # closest first, like Overpass
+        candidates = candidates[np.argsort(shapely.distance(self.footprints.geometry.to_numpy()[candidates], point), kind="stable")]
+        return [self._way(int(position) + 1) for position in candidates]
+
+    def request(self, method, url, data=None, **kwargs) -> requests.Response:
+        self.requests += 1
+        if match := re.search(r"way\(id:([\d,]+)\)", data):
+            way_ids = [int(way_id) for way_id in match.group(1).split(",") if 0 < int(way_id) <= len(self.rings)]
+            if "geom" in data:
+                return _response({"elements": [self._way(way_id, geometry=True) for way_id in way_ids]})
+            return _response({"elements": [{"type": "way", "id": way_id} for way_id in way_ids]})
+        if match := re.search(r"way\((\d+)\)", data):
+            return _response({"elements": [self._way(int(match.group(1)))]})
+        if match := re.search(r"node\((\d+)\)", data):
+            return _response({"elements": [self._node(int(match.group(1)))]})
+        if match := re.search(r"node\(id:([\d,]+)\)", data):
+            return _response({"elements": [self._node(int(node_id)) for node_id in sorted(set(match.group(1).split(",")), key=int)]})
+        if match := re.search(r'way\["building"\]\(([-\d.e]+),([-\d.e]+),([-\d.e]+),([-\d.e]+)\)', data):
+            south, west, north, east = map(float, match.groups())
+            positions = self.footprints.sindex.query(shapely.box(west, south, east, north), predicate="intersects")
+            return _response({"elements": [self._way(int(position) + 1, geometry=True) for position in sorted(positions)]})
+        if match := re.search(r"way\(around:([\d.]+),([-\d.]+),([-\d.]+)\)", data):
+            return _response({"elements": self._ways_around(*map(float, match.groups()))})
+        return _response({"remark": f"Unsupported query: {data}"}, 400)
+
+
+@contextmanager
+def stub_overpass(footprints: gpd.GeoDataFrame) -> Iterator[StubOverpass]:
+    """Answer Overpass requests from the footprints, without any network requests, see `StubOverpass`
+
+    The shared OpenStreetMap client is replaced by one without a cache or rate limits while the stub is active,
+    so that every query reaches the stub as fast as possible.
+    """
+    overpass = StubOverpass(footprints)
+    set_osm_client(OSMClient(requests_per_second={"nominatim": 1e9, "overpass": 1e9}))
+    try:
+        with mock.patch.object(requests.Session, "request", overpass.request):
+            yield overpass
+    finally:
+        set_osm_client(None)
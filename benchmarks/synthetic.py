@@ -0,0 +1,147 @@
+# !/usr/bin/env python
+"""
+SEED Platform (TM), Copyright (c) Alliance for Sustainable Energy, LLC, and other contributors.
+See also https://github.com/SEED-platform/seed/blob/main/LICENSE.md
+"""
+
+import gzip
+from pathlib import Path
+
+import geopandas as gpd
+import mercantile
+import numpy as np
+import shapely
+
+from utils.common import Location
+from utils.quadkey_helpers import METERS_PER_DEGREE, QUADKEY_ZOOM, quadkeys
+
+# Downtown Denver, the synthetic area is centered on the nearest quadkey corner so that it covers 4 quadkeys
+DEFAULT_CENTER = (-104.99, 39.74)
+
+# Width and height of the synthetic area in degrees
+DEFAULT_SPAN = 0.1
+
+# Footprints per square kilometer, about the density of a city's residential neighborhoods
+DEFAULT_DENSITY = 1_000
+
+STREET_NAMES = ["Colfax", "Broadway", "Lincoln", "Grant", "Logan", "Pennsylvania", "Washington", "Clarkson", "14th", "17th"]
+STREET_TYPES = ["St", "Street", "Ave", "Avenue", "Blvd", "Pkwy", "Way"]
+DIRECTIONS = ["", "", "N ", "S ", "E ", "W ", "North ", "East "]
+UNITS = ["", "", "", " Apt 2", " Unit B", " Ste 300", " #4"]
+
+
+def synthetic_area(center: tuple[float, float] = DEFAULT_CENTER, span: float = DEFAULT_SPAN) -> tuple[float, float, float, float]:
+    """Return the (west, south, east, north) bounds of a `span` degree square centered on the quadkey corner closest to `center`"""
+    bounds = mercantile.bounds(mercantile.tile(*center, QUADKEY_ZOOM))
+    longitude = bounds.east if center[0] - bounds.west > bounds.east - center[0] else bounds.west
+    latitude = bounds.north if center[1] - bounds.south > bounds.north - center[1] else bounds.south
+    return longitude - span / 2, latitude - span / 2, longitude + span / 2, latitude + span / 2
+
+
+def generate_footprints(area: tuple[float, float, float, float], density: float = DEFAULT_DENSITY, seed: int = 0) -> gpd.GeoDataFrame:
+    """Generate rotated rectangular footprints of 8 to 40 meters a side, uniformly spread over the area
+
+    Like the Microsoft Building Footprints, about a third of the footprints have an unknown height of -1.
+    """
+    rng = np.random.default_rng(seed)
+    west, south, east, north = area
+    meters_per_longitude = METERS_PER_DEGREE * np.cos(np.radians((south + north) / 2))
+    square_kilometers = (east - west) * meters_per_longitude * (north - south) * METERS_PER_DEGREE / 1e6
+    count = int(density * square_kilometers)
+
+    longitudes = rng.uniform(west, east, count)
+    latitudes = rng.uniform(south, north, count)
+    half_widths = rng.uniform(4, 20, count)
+    half_lengths = rng.uniform(4, 20, count)
+    angles = rng.uniform(0, np.pi / 2, count)
+
+    # rotate the corners in meters, then convert them to degrees around each center
+    corners = np.array([[-1, -1], [1, -1], [1, 1], [-1, 1], [-1, -1]], dtype=float)
+    x = corners[:, 0] * half_widths[:, None]
+    y = corners[:, 1] * half_lengths[:, None]
+    cos, sin = np.cos(angles)[:, None], np.sin(angles)[:, None]
+    coordinates = np.stack(
+        [
+            longitudes[:, None] + (x * cos - y * sin) / meters_per_longitude,
+            latitudes[:, None] + (x * sin + y * cos) / METERS_PER_DEGREE,
+        ],
+        axis=-1,
+    )
+
+    heights = np.round(rng.uniform(3, 60, count), 2)
+    heights[rng.random(count) < 1 / 3] = -1
+    return gpd.GeoDataFrame({"height": heights}, geometry=shapely.polygons(coordinates), crs="epsg:4326")
+
+
+def write_quadkeys(footprints: gpd.GeoDataFrame, save_directory: Path) -> list[int]:
+    """Save the footprints as quadkey files, in the same format as `update_quadkeys` downloads them, and return the quadkeys"""
+    save_directory.mkdir(parents=True, exist_ok=True)
+    centroids = footprints.geometry.centroid
+    footprint_quadkeys = quadkeys(centroids.x.to_numpy(), centroids.y.to_numpy())
+    geometries = shapely.to_geojson(footprints.geometry.to_numpy())
+    heights = footprints["height"].to_numpy()
+
+    for quadkey in np.unique(footprint_quadkeys).tolist():
+        with gzip.open(save_directory / f"{quadkey}.geojsonl.gz", "wt") as f:
+            for position in np.flatnonzero(footprint_quadkeys == quadkey):
+                f.write(
+                    f'{{"type":"Feature","properties":{{"height":{heights[position]},"confidence":-1.0}},"geometry":{geometries[position]}}}\n'
+                )
+
+    return np.unique(footprint_quadkeys).tolist()
+
+
+def write_osm_extract(footprints: gpd.GeoDataFrame, osm_file: Path):
+    """Save the footprints as building ways of an OpenStreetMap extract (.osm), with the same IDs as `benchmarks.stubs.StubOverpass`"""
+    rings = [np.asarray(ring.coords) for ring in footprints.geometry.exterior]
+    heights = footprints["height"].tolist()
+    with open(osm_file, "w") as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n<osm version="0.6" generator="CBL benchmarks">\n')
+        for position, ring in enumerate(rings):
+            f.writelines(
+                f'<node id="{10 * (position + 1) + k}" version="1" lat="{latitude:.7f}" lon="{longitude:.7f}"/>\n'
+                for k, (longitude, latitude) in enumerate(ring[:-1])
+            )
+        for position, ring in enumerate(rings):
+            way_id = position + 1
+            nodes = "".join(f'<nd ref="{10 * way_id + k}"/>' for k in [*range(len(ring) - 1), 0])
+            f.write(f'<way id="{way_id}" version="1">{nodes}<tag k="building" v="yes"/><tag k="height" v="{heights[position]}"/></way>\n')
+        f.write("</osm>\n")
+
+
+def generate_locations(footprints: gpd.GeoDataFrame, count: int, seed: int = 1) -> tuple[list[Location], np.ndarray, np.ndarray]:
+    """Generate addresses with unique, inconsistently formatted streets, and their geocoded coordinates
+
+    About 70% of the coordinates fall within a footprint, 25% are 25 to 80 meters from a footprint's center, and the
+    rest are anywhere in the footprints' area, where most don't have a footprint within range.
+
+    Returns:
+        tuple[list[Location], np.ndarray, np.ndarray]: Locations, and the longitude and latitude of each
+    """
+    rng = np.random.default_rng(seed)
+    centroids = footprints.geometry.centroid
+    positions = rng.integers(0, len(footprints), count)
+    longitudes = centroids.x.to_numpy()[positions]
+    latitudes = centroids.y.to_numpy()[positions]
+
+    # move some coordinates away from their footprint, and scatter others
+    kind = rng.random(count)
+    near = (kind >= 0.7) & (kind < 0.95)
+    distances = rng.uniform(25, 80, near.sum())
+    angles = rng.uniform(0, 2 * np.pi, near.sum())
+    longitudes[near] += distances * np.cos(angles) / (METERS_PER_DEGREE * np.cos(np.radians(latitudes[near])))
+    latitudes[near] += distances * np.sin(angles) / METERS_PER_DEGREE
+    scattered = kind >= 0.95
+    west, south, east, north = footprints.total_bounds
+    longitudes[scattered] = rng.uniform(west, east, scattered.sum())
+    latitudes[scattered] = rng.uniform(south, north, scattered.sum())
+
+    locations = [
+        {
+            "street": f"{100 + i} {rng.choice(DIRECTIONS)}{rng.choice(STREET_NAMES)} {rng.choice(STREET_TYPES)}{rng.choice(UNITS)}",
+            "city": "Denver",
+            "state": "CO",
+        }
+        for i in range(count)
+    ]
+    return locations, longitudes, latitudes
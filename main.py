@@ -4,26 +4,28 @@ SEED Platform (TM), Copyright (c) Alliance for Sustainable Energy, LLC, and othe
 See also https://github.com/SEED-platform/seed/blob/main/LICENSE.md
 """
 
-import gzip
 import json
 import os
 import sys
 import warnings
 from pathlib import Path
-from typing import Any
 
-import geopandas as gpd
-import mercantile
-import pandas as pd
 from dotenv import load_dotenv
-from shapely.geometry import Point
 
-from utils.common import Location
-from utils.geocode_addresses import geocode_addresses
-from utils.normalize_address import normalize_address
-from utils.ubid import bounding_box, centroid, encode_ubid
-from utils.update_dataset_links import update_dataset_links
-from utils.update_quadkeys import update_quadkeys
+from utils.checkpoint import Checkpoint
+from utils.delta_store import DeltaStore
+from utils.geocode_addresses import DEFAULT_GEOCODE_WORKERS, DEFAULT_REQUESTS_PER_SECOND, MapQuestGeocoder
+from utils.geocode_cache import GeocodeCache
+from utils.local_geocoder import LocalGeocoder
+from utils.manifest import DEFAULT_TTL
+from utils.match_footprints import DEFAULT_MAX_DISTANCE
+from utils.metrics import metrics
+from utils.output_writers import SUPPORTED_OUTPUT_FORMATS, CoveredBuildingsWriter
+from utils.pipeline import process_batches
+from utils.read_locations import read_locations
+from utils.tile_planner import DEFAULT_MAX_LOADED_QUADKEYS, QuadkeyCache
+from utils.update_dataset_links import dataset_version, update_dataset_links
+from utils.update_quadkeys import DEFAULT_MAX_WORKERS
 
 warnings.filterwarnings("ignore", category=RuntimeWarning)
 warnings.filterwarnings("ignore", category=UserWarning)
@@ -31,91 +33,137 @@ load_dotenv()
 
 
 def main():
-    MAPQUEST_API_KEY = os.getenv("MAPQUEST_API_KEY")
-    if not MAPQUEST_API_KEY:
-        sys.exit("Missing MapQuest API key")
-
-    if not os.path.exists("locations.json"):
-        sys.exit("Missing locations.json file")
+    GEOCODER = os.getenv("GEOCODER", "mapquest").lower()
+    if GEOCODER == "mapquest":
+        MAPQUEST_API_KEY = os.getenv("MAPQUEST_API_KEY")
+        if not MAPQUEST_API_KEY:
+            sys.exit("Missing MapQuest API key")
+    elif GEOCODER == "local":
+        LOCAL_ADDRESSES_FILE = os.getenv("LOCAL_ADDRESSES_FILE")
+        if not LOCAL_ADDRESSES_FILE or not os.path.exists(LOCAL_ADDRESSES_FILE):
+            sys.exit("Missing LOCAL_ADDRESSES_FILE address points file")
+    else:
+        sys.exit(f"Unknown geocoder: {GEOCODER}, must be one of ['mapquest', 'local']")
+
+    LOCATIONS_FILE = os.getenv("LOCATIONS_FILE", "locations.json")
+    if not os.path.exists(LOCATIONS_FILE):
+        sys.exit(f"Missing {LOCATIONS_FILE} file")
+
+    BATCH_SIZE = int(os.getenv("BATCH_SIZE")) if os.getenv("BATCH_SIZE") else None
+
+    MAX_DISTANCE = float(os.getenv("MAX_FOOTPRINT_DISTANCE", DEFAULT_MAX_DISTANCE))
+    MAX_LOADED_QUADKEYS = int(os.getenv("MAX_LOADED_QUADKEYS", DEFAULT_MAX_LOADED_QUADKEYS))
+    DOWNLOAD_WORKERS = int(os.getenv("DOWNLOAD_WORKERS", DEFAULT_MAX_WORKERS))
+    DOWNLOAD_TTL = float(os.getenv("DOWNLOAD_TTL", DEFAULT_TTL))
+    NORMALIZE_WORKERS = int(os.getenv("NORMALIZE_WORKERS")) if os.getenv("NORMALIZE_WORKERS") else None
+    MATCH_WORKERS = int(os.getenv("MATCH_WORKERS", "1"))
+    GEOCODE_WORKERS = int(os.getenv("GEOCODE_WORKERS", DEFAULT_GEOCODE_WORKERS))
+    GEOCODE_RATE_LIMIT = float(os.getenv("GEOCODE_RATE_LIMIT", DEFAULT_REQUESTS_PER_SECOND))
+    # Only cache geocoding results if the provider's terms of service allow it
+    GEOCODE_CACHE = os.getenv("GEOCODE_CACHE", "false").lower() == "true"
+    GEOCODE_CACHE_TTL = float(os.getenv("GEOCODE_CACHE_TTL")) if os.getenv("GEOCODE_CACHE_TTL") else None
+
+    OUTPUT_FORMATS = [output_format.strip() for output_format in os.getenv("OUTPUT_FORMATS", "csv,geojson").lower().split(",")]
+    for output_format in OUTPUT_FORMATS:
+        if output_format not in SUPPORTED_OUTPUT_FORMATS:
+            sys.exit(f"Unknown output format: {output_format}, must be one of {SUPPORTED_OUTPUT_FORMATS}")
+    COORDINATE_PRECISION = int(os.getenv("COORDINATE_PRECISION")) if os.getenv("COORDINATE_PRECISION") else None
+
+    # Only process the addresses that are new or changed since the previous run
+    DELTA = os.getenv("DELTA", "false").lower() == "true"
+
+    # Save the results of each stage so that an interrupted run resumes where it stopped
+    CHECKPOINT_DIRECTORY = os.getenv("CHECKPOINT_DIRECTORY")
+
+    # Save the time, items processed, HTTP requests, cache hits, and memory of each stage
+    METRICS_FILE = os.getenv("METRICS_FILE")
+    TRACE_FILE = os.getenv("TRACE_FILE")
+    metrics.reset(trace=bool(TRACE_FILE))
 
     quadkey_path = Path("data/quadkeys")
     if not quadkey_path.exists():
         quadkey_path.mkdir(parents=True, exist_ok=True)
 
-    with open("locations.json") as f:
-        locations: list[Location] = json.load(f)
-
-    for loc in locations:
-        loc["street"] = normalize_address(loc["street"])
-
-    data = geocode_addresses(locations, MAPQUEST_API_KEY)
-
-    # TODO confirm high quality geocoding results, and that all results have latitude/longitude properties
-
-    # Find all quadkeys that the coordinates fall within
-    quadkeys = set()
-    for datum in data:
-        tile = mercantile.tile(datum["longitude"], datum["latitude"], 9)
-        quadkey = int(mercantile.quadkey(tile))
-        quadkeys.add(quadkey)
-        datum["quadkey"] = quadkey
+    if GEOCODER == "local":
+        geocoder = LocalGeocoder(Path(LOCAL_ADDRESSES_FILE))
+    else:
+        geocoder = MapQuestGeocoder(MAPQUEST_API_KEY, GEOCODE_WORKERS, GEOCODE_RATE_LIMIT)
 
-    # Download quadkey dataset links
-    update_dataset_links()
-
-    # Download quadkeys
-    update_quadkeys(list(quadkeys))
-
-    # Loop properties and load quadkeys as necessary
-    loaded_quadkeys: dict[int, Any] = {}
-    for datum in data:
-        quadkey = datum["quadkey"]
-        if quadkey not in loaded_quadkeys:
-            print(f"Loading {quadkey}")
-
-            with gzip.open(f"data/quadkeys/{quadkey}.geojsonl.gz", "rb") as f:
-                loaded_quadkeys[quadkey] = gpd.read_file(f)
-                print(f"  {len(loaded_quadkeys[quadkey])} footprints in quadkey")
-
-        geojson = loaded_quadkeys[quadkey]
-        point = Point(datum["longitude"], datum["latitude"])
-        point_gdf = gpd.GeoDataFrame(crs="epsg:4326", geometry=[point])
-
-        # intersections have `geometry`, `index_right`, and `height`
-        intersections = gpd.sjoin(point_gdf, geojson)
-        if len(intersections) >= 1:
-            footprint = geojson.iloc[intersections.iloc[0].index_right]
-            datum["footprint_match"] = "intersection"
-        else:
-            footprint = geojson.iloc[geojson.distance(point).sort_values().index[0]]
-            datum["footprint_match"] = "closest"
-        datum["geometry"] = footprint.geometry
-        datum["height"] = footprint.height if footprint.height != -1 else None
-
-        # Determine UBIDs from footprints
-        datum["ubid"] = encode_ubid(datum["geometry"])
-
-    # Save covered building list as csv and GeoJSON
     columns = [
         "address", "city", "state", "postal_code", "side_of_street", "neighborhood", "county",
-        "country", "latitude", "longitude", "quality", "footprint_match", "height", "ubid",
+        "country", "latitude", "longitude", "quality", "footprint_match", "proximity_to_geocoding_coord", "height", "ubid",
         "geometry"]  # fmt: off
-    gdf = gpd.GeoDataFrame(data=data, columns=columns)
-    gdf.to_csv("data/covered-buildings.csv", index=False)
-    gdf.to_file("data/covered-buildings.geojson", driver="GeoJSON")
-
-    # Save a custom GeoJSON with 3 layers: UBID bounding boxes, footprints, then UBID centroids
-    bounding_boxes = gpd.GeoDataFrame(
-        data=[{"UBID Bounding Box": datum["address"], "geometry": bounding_box(datum["ubid"])} for datum in data],
-        columns=["UBID Bounding Box", "geometry"],
-    )
-    centroids = gpd.GeoDataFrame(
-        data=[{"UBID Centroid": datum["address"], "geometry": centroid(datum["ubid"])} for datum in data],
-        columns=["UBID Centroid", "geometry"],
+
+    # Download quadkey dataset links
+    with metrics.stage("update_dataset_links"):
+        update_dataset_links(ttl=DOWNLOAD_TTL)
+
+    # Process the locations in batches, reading each batch only when the previous one is done, and write
+    # each batch to the covered building list as soon as it's processed
+    cache = GeocodeCache(provider=geocoder.provider, ttl=GEOCODE_CACHE_TTL) if GEOCODE_CACHE else None
+    footprints_version = dataset_version()
+    checkpoint = None
+    if CHECKPOINT_DIRECTORY:
+        locations_stat = os.stat(LOCATIONS_FILE)
+        fingerprint = {
+            "locations_file": os.path.abspath(LOCATIONS_FILE),
+            "size": locations_stat.st_size,
+            "modified": locations_stat.st_mtime_ns,
+            "batch_size": BATCH_SIZE,
+            "geocoder": geocoder.provider,
+            "max_distance": MAX_DISTANCE,
+            # the saved batches only cover changed addresses in delta mode, and are stale once the footprints are updated
+            "delta": DELTA,
+            "footprints_version": footprints_version,
+        }
+        checkpoint = Checkpoint(Path(CHECKPOINT_DIRECTORY), fingerprint)
+    delta = None
+    if DELTA:
+        # previous results are stale once the footprints are updated, or the matching settings change
+        delta = DeltaStore(version=json.dumps([footprints_version, geocoder.provider, MAX_DISTANCE]))
+    writer = CoveredBuildingsWriter(
+        Path("data"),
+        "covered-buildings",
+        columns,
+        ["latitude", "longitude", "proximity_to_geocoding_coord", "height"],
+        formats=OUTPUT_FORMATS,
+        precision=COORDINATE_PRECISION,
     )
-    gdf_ubid = pd.concat([bounding_boxes, gdf, centroids])
-    with open("data/covered-buildings-ubid.geojson", "w") as f:
-        f.write(gdf_ubid.to_json(drop_id=True, na="drop"))
+    try:
+        for data in process_batches(
+            read_locations(Path(LOCATIONS_FILE), BATCH_SIZE),
+            geocoder,
+            cache=cache,
+            footprint_cache=QuadkeyCache(MAX_LOADED_QUADKEYS),
+            max_distance=MAX_DISTANCE,
+            normalize_workers=NORMALIZE_WORKERS,
+            match_workers=MATCH_WORKERS,
+            download_workers=DOWNLOAD_WORKERS,
+            download_ttl=DOWNLOAD_TTL,
+            checkpoint=checkpoint,
+            delta=delta,
+        ):
+            with metrics.stage("write", len(data)):
+                writer.write(data)
+
+        # the run is complete, so the next run starts over, and only keeps the results of the current addresses
+        if checkpoint is not None:
+            checkpoint.clear()
+        if delta is not None:
+            delta.prune()
+    finally:
+        with metrics.stage("write"):
+            writer.close()
+        if delta is not None:
+            delta.close()
+        if cache is not None:
+            cache.close()
+
+        # also save the metrics of failed runs, to see where they stopped
+        if METRICS_FILE:
+            metrics.save_report(Path(METRICS_FILE))
+        if TRACE_FILE:
+            metrics.save_trace(Path(TRACE_FILE))
 
 
 if __name__ == "__main__":
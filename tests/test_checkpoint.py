@@ -0,0 +1,62 @@
+# !/usr/bin/env python
+"""
+SEED Platform (TM), Copyright (c) Alliance for Sustainable Energy, LLC, and other contributors.
+See also https://github.com/SEED-platform/seed/blob/main/LICENSE.md
+"""
+
+import pytest
+import shapely
+
+from utils.checkpoint import Checkpoint
+
+# Shaped like the fingerprint of `main`
+FINGERPRINT = {
+    "locations_file": "/data/locations.json",
+    "size": 1234,
+    "modified": 1_700_000_000_000_000_000,
+    "batch_size": 100,
+    "geocoder": "mapquest",
+    "max_distance": 50.0,
+    "delta": False,
+    "footprints_version": "abc123",
+}
+
+GEOCODED = [{"address": "100 main st", "latitude": 39.7, "longitude": -104.9, "geometry": shapely.box(-104.91, 39.69, -104.89, 39.71)}]
+
+
+def test_resumes_saved_stages(tmp_path):
+    checkpoint = Checkpoint(tmp_path, FINGERPRINT)
+    checkpoint.save(0, "normalized", ["100 main st"])
+    checkpoint.save(0, "geocoded", GEOCODED)
+
+    resumed = Checkpoint(tmp_path, dict(FINGERPRINT))
+
+    assert resumed.load(0, "normalized") == ["100 main st"]
+    [datum] = resumed.load(0, "geocoded")
+    assert datum.pop("geometry").equals_exact(GEOCODED[0]["geometry"], 0)
+    assert datum == {key: value for key, value in GEOCODED[0].items() if key != "geometry"}
+    assert resumed.load(0, "quadkeys") is None
+    assert resumed.load(1, "normalized") is None
+
+
+@pytest.mark.parametrize(("setting", "value"), [("max_distance", 25.0), ("footprints_version", "def456"), ("delta", True)])
+def test_ignores_checkpoint_of_different_run(tmp_path, setting, value):
+    checkpoint = Checkpoint(tmp_path, FINGERPRINT)
+    checkpoint.save(0, "normalized", ["100 main st"])
+    checkpoint.save(0, "geocoded", GEOCODED)
+
+    changed = Checkpoint(tmp_path, FINGERPRINT | {setting: value})
+
+    assert changed.load(0, "normalized") is None
+    assert changed.load(0, "geocoded") is None
+    # the stale stages are deleted, so the original settings don't resume them either
+    assert Checkpoint(tmp_path, FINGERPRINT).load(0, "normalized") is None
+
+
+def test_clear(tmp_path):
+    checkpoint = Checkpoint(tmp_path, FINGERPRINT)
+    checkpoint.save(0, "matched", GEOCODED)
+
+    checkpoint.clear()
+
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,55 @@
+# !/usr/bin/env python
+"""
+SEED Platform (TM), Copyright (c) Alliance for Sustainable Energy, LLC, and other contributors.
+See also https://github.com/SEED-platform/seed/blob/main/LICENSE.md
+"""
+
+import shapely
+
+from utils.delta_store import DeltaStore, address_hash
+
+LOCATION = {"street": "100 main st", "city": "Denver", "state": "CO"}
+RESULT = {"quality": "P1AAA", "latitude": 39.7, "longitude": -104.9, "ubid": "85FQP422+2V-1-1-1-1", "geometry": shapely.box(0, 0, 1, 1)}
+
+
+def test_reuses_results_of_unchanged_addresses(tmp_path):
+    with DeltaStore(tmp_path / "delta.sqlite", version="v1") as store:
+        store.set_many([address_hash(LOCATION)], [RESULT])
+
+    with DeltaStore(tmp_path / "delta.sqlite", version="v1") as store:
+        # the same address, formatted differently, is unchanged
+        unchanged = address_hash({"street": " 100 Main St", "city": "DENVER", "state": "co "})
+        changed = address_hash(LOCATION | {"street": "200 main st"})
+        [hit, miss] = store.get_many([unchanged, changed])
+
+    assert hit.pop("geometry").equals_exact(RESULT["geometry"], 0)
+    assert hit == {key: value for key, value in RESULT.items() if key != "geometry"}
+    assert miss is None
+
+
+def test_ignores_results_of_other_versions(tmp_path):
+    with DeltaStore(tmp_path / "delta.sqlite", version="v1") as store:
+        store.set_many([address_hash(LOCATION)], [RESULT])
+
+    with DeltaStore(tmp_path / "delta.sqlite", version="v2") as store:
+        assert store.get_many([address_hash(LOCATION)]) == [None]
+
+
+def test_retries_failed_results(tmp_path):
+    locations = [LOCATION | {"street": f"{number}00 main st"} for number in range(1, 4)]
+    keys = [address_hash(location) for location in locations]
+    with DeltaStore(tmp_path / "delta.sqlite") as store:
+        store.set_many(keys, [{"quality": "Not Found"}, {"quality": "Ambiguous"}, {"quality": "A5XAX"}])
+        assert store.get_many(keys) == [None, None, {"quality": "A5XAX"}]
+
+
+def test_prune_removes_addresses_not_seen_by_the_run(tmp_path):
+    kept = address_hash(LOCATION)
+    removed = address_hash(LOCATION | {"street": "200 main st"})
+    with DeltaStore(tmp_path / "delta.sqlite") as store:
+        store.set_many([kept, removed], [{"quality": "P1AAA"}, {"quality": "P1AAA"}])
+
+    with DeltaStore(tmp_path / "delta.sqlite") as store:
+        store.get_many([kept])
+        store.prune()
+        assert store.get_many([kept, removed]) == [{"quality": "P1AAA"}, None]
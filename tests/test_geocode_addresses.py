@@ -0,0 +1,29 @@
+import pytest
+import requests
+
+from utils import geocode_addresses
+from utils.rate_limiter import RateLimiter
+
+
+class StubSession:
+    def __init__(self, status_code: int):
+        self.status_code = status_code
+        self.posts = 0
+
+    def post(self, *_args, **_kwargs) -> requests.Response:
+        self.posts += 1
+        response = requests.Response()
+        response.status_code = self.status_code
+        response._content = b'{"results": []}'
+        return response
+
+
+@pytest.mark.parametrize("status_code", geocode_addresses.RETRY_STATUSES)
+def test_geocode_batch_raises_once_retries_are_used_up(status_code, monkeypatch):
+    monkeypatch.setattr(geocode_addresses.time, "sleep", lambda _seconds: None)
+    session = StubSession(status_code)
+
+    with pytest.raises(requests.HTTPError, match=f"status {status_code}"):
+        geocode_addresses._geocode_batch(session, [{"street": "1 Main St"}], "key", RateLimiter(1000))
+
+    assert session.posts == geocode_addresses.MAX_ATTEMPTS
@@ -0,0 +1,86 @@
+# !/usr/bin/env python
+"""
+SEED Platform (TM), Copyright (c) Alliance for Sustainable Energy, LLC, and other contributors.
+See also https://github.com/SEED-platform/seed/blob/main/LICENSE.md
+"""
+
+from utils import geocode_cache
+from utils.geocode_addresses import Geocoder, geocode_addresses
+from utils.geocode_cache import GeocodeCache, location_key
+
+
+class CountingGeocoder(Geocoder):
+    """Geocodes every street to a point, except the streets in `ambiguous`, and counts the locations it geocodes"""
+
+    provider = "stub"
+
+    def __init__(self, ambiguous: list[str] = []):
+        self.ambiguous = ambiguous
+        self.geocoded = []
+
+    def geocode(self, locations):
+        self.geocoded.extend(location["street"] for location in locations)
+        return [
+            {"quality": "Ambiguous"} if location["street"] in self.ambiguous else {"quality": "P1AAA", "address": location["street"]}
+            for location in locations
+        ]
+
+
+def locations(*streets: str) -> list[dict]:
+    return [{"street": street, "city": "Denver", "state": "CO"} for street in streets]
+
+
+def test_only_geocodes_misses_once_each(tmp_path):
+    geocoder = CountingGeocoder()
+    with GeocodeCache(tmp_path / "cache.sqlite", provider=geocoder.provider) as cache:
+        first = geocode_addresses(locations("100 main st", "200 main st", "100 main st"), cache=cache, geocoder=geocoder)
+        assert geocoder.geocoded == ["100 main st", "200 main st"]
+
+        second = geocode_addresses(locations("200 main st", "300 main st", "100 main st"), cache=cache, geocoder=geocoder)
+        assert geocoder.geocoded == ["100 main st", "200 main st", "300 main st"]
+
+    assert [result["address"] for result in first] == ["100 main st", "200 main st", "100 main st"]
+    assert [result["address"] for result in second] == ["200 main st", "300 main st", "100 main st"]
+
+
+def test_normalizes_locations(tmp_path):
+    geocoder = CountingGeocoder()
+    with GeocodeCache(tmp_path / "cache.sqlite", provider=geocoder.provider) as cache:
+        geocode_addresses(locations("100 main st"), cache=cache, geocoder=geocoder)
+        same = {"street": " 100 Main St", "city": "DENVER ", "state": "co"}
+        [result] = geocode_addresses([same], cache=cache, geocoder=geocoder)
+
+    assert location_key(same) == ("100 main st", "denver", "co")
+    assert geocoder.geocoded == ["100 main st"]
+    assert result["address"] == "100 main st"
+
+
+def test_geocodes_retry_qualities_again(tmp_path):
+    geocoder = CountingGeocoder(ambiguous=["100 main st"])
+    with GeocodeCache(tmp_path / "cache.sqlite", provider=geocoder.provider) as cache:
+        geocode_addresses(locations("100 main st", "200 main st"), cache=cache, geocoder=geocoder)
+        [ambiguous, _] = geocode_addresses(locations("100 main st", "200 main st"), cache=cache, geocoder=geocoder)
+
+    assert geocoder.geocoded == ["100 main st", "200 main st", "100 main st"]
+    assert ambiguous == {"quality": "Ambiguous"}
+
+    # without retry qualities, the ambiguous result is reused too
+    with GeocodeCache(tmp_path / "cache.sqlite", provider=geocoder.provider, retry_qualities=[]) as cache:
+        [ambiguous] = geocode_addresses(locations("100 main st"), cache=cache, geocoder=geocoder)
+
+    assert geocoder.geocoded == ["100 main st", "200 main st", "100 main st"]
+    assert ambiguous == {"quality": "Ambiguous"}
+
+
+def test_separates_providers_and_expires_results(tmp_path, monkeypatch):
+    with GeocodeCache(tmp_path / "cache.sqlite", provider="stub") as cache:
+        cache.set_many(locations("100 main st"), [{"quality": "P1AAA"}])
+
+    with GeocodeCache(tmp_path / "cache.sqlite", provider="other") as cache:
+        assert cache.get_many(locations("100 main st")) == [None]
+
+    with GeocodeCache(tmp_path / "cache.sqlite", provider="stub", ttl=60) as cache:
+        assert cache.get_many(locations("100 main st")) == [{"quality": "P1AAA"}]
+        now = geocode_cache.time.time()
+        monkeypatch.setattr(geocode_cache.time, "time", lambda: now + 61)
+        assert cache.get_many(locations("100 main st")) == [None]
@@ -0,0 +1,66 @@
+# !/usr/bin/env python
+"""
+SEED Platform (TM), Copyright (c) Alliance for Sustainable Energy, LLC, and other contributors.
+See also https://github.com/SEED-platform/seed/blob/main/LICENSE.md
+"""
+
+from unittest import mock
+
+import geopandas as gpd
+import pytest
+import requests
+
+from benchmarks.stubs import _response, stub_overpass
+from benchmarks.synthetic import generate_footprints, synthetic_area, write_osm_extract
+from utils.open_street_map import process_dataframe_for_osm_buildings
+from utils.osm_client import NOMINATIM_URL
+from utils.osm_index import OSMBuildingIndex, set_osm_index
+
+
+@pytest.fixture()
+def footprints(tmp_path):
+    footprints = generate_footprints(synthetic_area(span=0.005), density=200)
+    write_osm_extract(footprints, tmp_path / "extract.osm")
+    set_osm_index(OSMBuildingIndex(tmp_path / "extract.osm"))
+    yield footprints
+    set_osm_index(None)
+
+
+def test_index_lookup_outside_every_building(footprints):
+    inside = footprints.geometry.iloc[0].representative_point()
+    rows = gpd.GeoDataFrame({"id": [0, 1], "latitude": [inside.y, 0.0], "longitude": [inside.x, 0.0]})
+
+    results, errors = process_dataframe_for_osm_buildings(rows, method="lat_long")
+
+    assert [result["orig_row_id"] for result in results] == [0, 1]
+    assert results[0]["osm_id"] == 1
+    assert results[0]["osm_building_id"] == 1
+    assert results[0]["ubid"] is not None
+    assert "osm_id" not in results[1]
+    assert results[1]["osm_building_id"] == "Building ID not found for the given place ID."
+    assert results[1]["ubid"] is None
+    assert len(errors) == 1
+    assert errors[0].startswith("No building found for row")
+
+
+def test_failed_reverse_geocoding(footprints):
+    set_osm_index(None)
+    inside = footprints.geometry.iloc[0].representative_point()
+    rows = gpd.GeoDataFrame({"id": [0], "latitude": [inside.y], "longitude": [inside.x]})
+
+    with stub_overpass(footprints) as overpass:
+
+        def request(_session, method, url, **kwargs) -> requests.Response:
+            if url == NOMINATIM_URL:
+                return _response({}, 503)
+            return overpass.request(method, url, **kwargs)
+
+        with mock.patch.object(requests.Session, "request", request):
+            results, errors = process_dataframe_for_osm_buildings(rows, method="lat_long")
+
+    assert results[0]["orig_row_id"] == 0
+    assert "osm_id" not in results[0]
+    assert results[0]["osm_building_id"] == "Building ID not found for the given place ID."
+    assert results[0]["ubid"] is None
+    assert len(errors) == 1
+    assert errors[0].startswith("Error: Failed to reverse geocode row")
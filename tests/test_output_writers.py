@@ -0,0 +1,119 @@
+# !/usr/bin/env python
+"""
+SEED Platform (TM), Copyright (c) Alliance for Sustainable Energy, LLC, and other contributors.
+See also https://github.com/SEED-platform/seed/blob/main/LICENSE.md
+"""
+
+from pathlib import Path
+from typing import Optional
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pytest
+import shapely
+from geopandas import GeoDataFrame
+from geopandas.testing import assert_geodataframe_equal
+
+from utils.output_writers import CoveredBuildingsWriter, round_coordinates
+from utils.ubid import bounding_box, centroid, encode_ubid
+
+COLUMNS = ["address", "latitude", "longitude", "quality", "height", "ubid", "geometry"]
+FLOAT_COLUMNS = ["latitude", "longitude", "height"]
+
+
+def covered_buildings(count: int, seed: int = 0) -> list[dict]:
+    """Footprints with coordinates of full precision, and an address without a footprint every third row"""
+    rng = np.random.default_rng(seed)
+    data = []
+    for i in range(count):
+        longitude, latitude = rng.uniform(-105, -104.9), rng.uniform(39.7, 39.8)
+        datum = {"address": f"{i + 1} Main St", "latitude": latitude, "longitude": longitude, "quality": "P1AAA"}
+        if i % 3 == 2:
+            datum |= {"quality": "Ambiguous", "height": None, "ubid": None, "geometry": None}
+        else:
+            geometry = shapely.box(longitude, latitude, longitude + rng.uniform(1e-4, 1e-3), latitude + rng.uniform(1e-4, 1e-3))
+            datum |= {"height": rng.uniform(3, 30), "ubid": encode_ubid(geometry), "geometry": geometry}
+        data.append(datum)
+    return data
+
+
+def write_in_two_batches(directory: Path, data: list[dict], formats: list[str], precision: Optional[int] = None):
+    directory.mkdir()
+    with CoveredBuildingsWriter(directory, "covered-buildings", COLUMNS, FLOAT_COLUMNS, formats=formats, precision=precision) as writer:
+        writer.write(data[:4])
+        writer.write(data[4:])
+
+
+@pytest.mark.parametrize("precision", [None, 6])
+def test_text_formats_match_writing_everything_at_once(tmp_path, precision):
+    data = covered_buildings(10)
+    write_in_two_batches(tmp_path / "batches", data, ["csv", "geojson"], precision)
+
+    expected = tmp_path / "expected"
+    expected.mkdir()
+    gdf = GeoDataFrame(data=data, columns=COLUMNS)
+    if precision is not None:
+        gdf[["latitude", "longitude"]] = gdf[["latitude", "longitude"]].round(precision)
+
+    csv_gdf = pd.DataFrame(gdf)
+    if precision is not None:
+        csv_gdf["geometry"] = shapely.to_wkt(gdf.geometry.to_numpy(), rounding_precision=precision)
+    csv_gdf.to_csv(expected / "covered-buildings.csv", index=False)
+
+    options = {"COORDINATE_PRECISION": precision} if precision is not None else {}
+    gdf.to_file(expected / "covered-buildings.geojson", driver="GeoJSON", **options)
+
+    with_ubid = [datum for datum in data if datum["ubid"]]
+    bounding_boxes = GeoDataFrame(
+        data=[{"UBID Bounding Box": datum["address"], "geometry": bounding_box(datum["ubid"])} for datum in with_ubid]
+    )
+    centroids = GeoDataFrame(data=[{"UBID Centroid": datum["address"], "geometry": centroid(datum["ubid"])} for datum in with_ubid])
+    gdf_ubid = pd.concat([bounding_boxes, gdf, centroids])
+    if precision is not None:
+        gdf_ubid = gdf_ubid.set_geometry(round_coordinates(gdf_ubid.geometry.to_numpy(), precision))
+    (expected / "covered-buildings-ubid.geojson").write_text(gdf_ubid.to_json(drop_id=True, na="drop"), encoding="utf-8")
+
+    for name in ["covered-buildings.csv", "covered-buildings.geojson", "covered-buildings-ubid.geojson"]:
+        assert (tmp_path / "batches" / name).read_text(encoding="utf-8") == (expected / name).read_text(encoding="utf-8"), name
+    assert sorted(path.name for path in (tmp_path / "batches").iterdir()) == sorted(path.name for path in expected.iterdir())
+
+
+@pytest.mark.parametrize("output_format", ["parquet", "fgb"])
+def test_binary_formats_match_writing_everything_at_once(tmp_path, output_format):
+    pytest.importorskip("pyarrow")
+    data = covered_buildings(10)
+    write_in_two_batches(tmp_path / "batches", data, [output_format], precision=6)
+
+    expected = tmp_path / "expected"
+    expected.mkdir()
+    # the binary formats keep the full precision
+    gdf = GeoDataFrame(data=data, columns=COLUMNS, crs="EPSG:4326")
+    gdf["height"] = gdf["height"].astype(float)
+    with_ubid = gdf[gdf["ubid"].notna()]
+    bounding_boxes = GeoDataFrame(
+        data={"address": with_ubid["address"], "ubid": with_ubid["ubid"], "geometry": [bounding_box(ubid) for ubid in with_ubid["ubid"]]},
+        crs="EPSG:4326",
+    )
+    centroids = GeoDataFrame(
+        data={"address": with_ubid["address"], "ubid": with_ubid["ubid"], "geometry": [centroid(ubid) for ubid in with_ubid["ubid"]]},
+        crs="EPSG:4326",
+    )
+
+    read = gpd.read_parquet if output_format == "parquet" else gpd.read_file
+    for name, expected_gdf in [
+        ("covered-buildings", gdf),
+        ("covered-buildings-ubid-bounding-boxes", bounding_boxes),
+        ("covered-buildings-ubid-centroids", centroids),
+    ]:
+        written = read(tmp_path / "batches" / f"{name}.{output_format}")
+        if output_format == "parquet":
+            expected_gdf.reset_index(drop=True).to_parquet(expected / f"{name}.{output_format}")
+        else:
+            # the spatial index can't contain missing geometries
+            spatial_index = "NO" if expected_gdf.geometry.isna().any() else "YES"
+            expected_gdf.reset_index(drop=True).to_file(
+                expected / f"{name}.{output_format}", driver="FlatGeobuf", SPATIAL_INDEX=spatial_index
+            )
+        assert_geodataframe_equal(written, read(expected / f"{name}.{output_format}"), check_crs=False)
+    assert sorted(path.name for path in (tmp_path / "batches").iterdir()) == sorted(path.name for path in expected.iterdir())
@@ -0,0 +1,199 @@
+# !/usr/bin/env python
+"""
+SEED Platform (TM), Copyright (c) Alliance for Sustainable Energy, LLC, and other contributors.
+See also https://github.com/SEED-platform/seed/blob/main/LICENSE.md
+"""
+
+from functools import partial
+
+import pytest
+
+from benchmarks.synthetic import generate_footprints, synthetic_area, write_quadkeys
+from utils import pipeline
+from utils.checkpoint import Checkpoint
+from utils.delta_store import DeltaStore
+from utils.geocode_addresses import Geocoder
+from utils.load_quadkey import load_quadkey
+from utils.tile_planner import QuadkeyCache
+
+
+class StubGeocoder(Geocoder):
+    provider = "stub"
+
+    def __init__(self, results: dict[str, dict]):
+        self.results = results
+        self.geocoded = []
+
+    def geocode(self, locations):
+        self.geocoded.extend(location["street"] for location in locations)
+        return [dict(self.results[location["street"].title()]) for location in locations]
+
+
+def skip_update(quadkeys, **_kwargs):
+    """Use the quadkeys that are already saved instead of downloading them"""
+
+
+def test_process_batches_passes_through_results_without_coordinates(tmp_path, monkeypatch):
+    footprints = generate_footprints(synthetic_area(span=0.01), density=200)
+    write_quadkeys(footprints, tmp_path)
+    monkeypatch.setattr(pipeline, "update_quadkeys", skip_update)
+    center = footprints.geometry.iloc[0].centroid
+
+    geocoder = StubGeocoder(
+        {
+            "100 Main St": {"quality": "P1AAA", "address": "100 Main St", "longitude": center.x, "latitude": center.y},
+            "200 Main St": {"quality": "Not Found"},
+            "300 Main St": {"quality": "Ambiguous"},
+            "400 Main St": {"quality": "A5XAX"},
+            "500 Main St": {"quality": "P1AAA", "address": "500 Main St", "longitude": center.x, "latitude": center.y},
+        }
+    )
+    locations = [{"street": f"{number}00 Main St", "city": "Denver", "state": "CO"} for number in range(1, 6)]
+    footprint_cache = QuadkeyCache(load=lambda quadkey: load_quadkey(quadkey, tmp_path))
+
+    [data] = list(pipeline.process_batches([locations], geocoder, footprint_cache=footprint_cache, normalize_workers=1))
+
+    assert [datum["quality"] for datum in data] == ["P1AAA", "Not Found", "Ambiguous", "A5XAX", "P1AAA"]
+    for datum in [data[0], data[4]]:
+        assert datum["footprint_match"] == "intersection"
+        assert datum["ubid"] is not None
+        assert datum["geometry"].contains(center)
+    for datum in data[1:4]:
+        assert "longitude" not in datum
+        assert all(datum[field] is None for field in pipeline.UNMATCHED_FIELDS)
+
+
+def test_process_batches_without_any_coordinates(monkeypatch):
+    monkeypatch.setattr(pipeline, "update_quadkeys", skip_update)
+    geocoder = StubGeocoder({"100 Main St": {"quality": "Not Found"}})
+    locations = [{"street": "100 Main St", "city": "Denver", "state": "CO"}]
+
+    [data] = list(pipeline.process_batches([locations], geocoder, normalize_workers=1))
+
+    assert data == [{"quality": "Not Found"} | dict.fromkeys(pipeline.UNMATCHED_FIELDS)]
+
+
+def test_process_batches_resumes_from_checkpoint(tmp_path, monkeypatch):
+    footprints = generate_footprints(synthetic_area(span=0.01), density=200)
+    write_quadkeys(footprints, tmp_path / "quadkeys")
+    monkeypatch.setattr(pipeline, "update_quadkeys", skip_update)
+    centers = footprints.geometry.iloc[:4].centroid
+    geocoder = StubGeocoder(
+        {
+            f"{number}00 Main St": {"quality": "P1AAA", "longitude": center.x, "latitude": center.y}
+            for number, center in enumerate(centers, start=1)
+        }
+    )
+    batches = [[{"street": f"{number}00 Main St", "city": "Denver", "state": "CO"} for number in numbers] for numbers in [[1, 2], [3, 4]]]
+    footprint_cache = QuadkeyCache(load=lambda quadkey: load_quadkey(quadkey, tmp_path / "quadkeys"))
+    fingerprint = {"max_distance": 50.0}
+
+    # the first run is interrupted after its first batch
+    first_run = pipeline.process_batches(
+        batches, geocoder, footprint_cache=footprint_cache, normalize_workers=1, checkpoint=Checkpoint(tmp_path / "checkpoint", fingerprint)
+    )
+    first = next(first_run)
+    assert all(datum["ubid"] for datum in first)
+    first_run.close()
+    assert geocoder.geocoded == ["100 main st", "200 main st"]
+
+    geocoder.geocoded.clear()
+    resumed = list(
+        pipeline.process_batches(
+            batches,
+            geocoder,
+            footprint_cache=footprint_cache,
+            normalize_workers=1,
+            checkpoint=Checkpoint(tmp_path / "checkpoint", fingerprint),
+        )
+    )
+    assert geocoder.geocoded == ["300 main st", "400 main st"]
+    assert [datum["ubid"] for datum in resumed[0]] == [datum["ubid"] for datum in first]
+
+    # a run with different settings starts over
+    geocoder.geocoded.clear()
+    list(
+        pipeline.process_batches(
+            batches,
+            geocoder,
+            footprint_cache=footprint_cache,
+            normalize_workers=1,
+            checkpoint=Checkpoint(tmp_path / "checkpoint", fingerprint | {"max_distance": 25.0}),
+        )
+    )
+    assert geocoder.geocoded == ["100 main st", "200 main st", "300 main st", "400 main st"]
+
+
+def test_process_batches_only_geocodes_new_and_failed_addresses_with_delta(tmp_path, monkeypatch):
+    footprints = generate_footprints(synthetic_area(span=0.01), density=200)
+    write_quadkeys(footprints, tmp_path / "quadkeys")
+    monkeypatch.setattr(pipeline, "update_quadkeys", skip_update)
+    center = footprints.geometry.iloc[0].centroid
+    geocoder = StubGeocoder(
+        {
+            "100 Main St": {"quality": "P1AAA", "longitude": center.x, "latitude": center.y},
+            "200 Main St": {"quality": "Not Found"},
+            "300 Main St": {"quality": "P1AAA", "longitude": center.x, "latitude": center.y},
+        }
+    )
+    footprint_cache = QuadkeyCache(load=lambda quadkey: load_quadkey(quadkey, tmp_path / "quadkeys"))
+
+    def run(numbers: list[int]) -> list[dict]:
+        locations = [{"street": f"{number}00 Main St", "city": "Denver", "state": "CO"} for number in numbers]
+        with DeltaStore(tmp_path / "delta.sqlite") as delta:
+            return [
+                datum
+                for data in pipeline.process_batches(
+                    [locations], geocoder, footprint_cache=footprint_cache, normalize_workers=1, delta=delta
+                )
+                for datum in data
+            ]
+
+    first = run([1, 2])
+    geocoder.geocoded.clear()
+    second = run([1, 2, 3])
+
+    # the address that wasn't found is geocoded again, in case it was a transient failure
+    assert geocoder.geocoded == ["200 main st", "300 main st"]
+    assert second[0]["ubid"] == first[0]["ubid"]
+    assert [datum["quality"] for datum in second] == ["P1AAA", "Not Found", "P1AAA"]
+
+
+def test_process_batches_matches_with_the_footprint_cache_loader_on_workers(tmp_path, monkeypatch):
+    footprints = generate_footprints(synthetic_area(span=0.02), density=200)
+    write_quadkeys(footprints, tmp_path)
+    monkeypatch.setattr(pipeline, "update_quadkeys", skip_update)
+    centers = footprints.geometry.iloc[::10].centroid
+    geocoder = StubGeocoder(
+        {
+            f"{number} Main St": {"quality": "P1AAA", "longitude": center.x, "latitude": center.y}
+            for number, center in enumerate(centers, start=1)
+        }
+    )
+    locations = [{"street": f"{number} Main St", "city": "Denver", "state": "CO"} for number in range(1, len(centers) + 1)]
+
+    def run(match_workers: int) -> list[dict]:
+        footprint_cache = QuadkeyCache(load=partial(load_quadkey, save_directory=tmp_path))
+        [data] = pipeline.process_batches(
+            [[dict(location) for location in locations]],
+            geocoder,
+            footprint_cache=footprint_cache,
+            normalize_workers=1,
+            match_workers=match_workers,
+            max_shard_size=5,
+        )
+        return data
+
+    serial = run(1)
+    parallel = run(2)
+
+    assert all(datum["footprint_match"] == "intersection" for datum in serial)
+    assert [datum["ubid"] for datum in parallel] == [datum["ubid"] for datum in serial]
+
+
+def test_process_batches_rejects_loaders_that_cant_be_sent_to_workers(tmp_path):
+    footprint_cache = QuadkeyCache(load=lambda quadkey: load_quadkey(quadkey, tmp_path))
+    batches = pipeline.process_batches([], StubGeocoder({}), footprint_cache=footprint_cache, match_workers=2)
+
+    with pytest.raises(ValueError, match="picklable"):
+        next(batches)
@@ -0,0 +1,92 @@
+# !/usr/bin/env python
+"""
+SEED Platform (TM), Copyright (c) Alliance for Sustainable Energy, LLC, and other contributors.
+See also https://github.com/SEED-platform/seed/blob/main/LICENSE.md
+"""
+
+import numpy as np
+import pytest
+import shapely
+from buildingid.code import decode, encode
+
+from utils.ubid import decode_ubids, encode_ubid, encode_ubids
+
+CODE_LENGTHS = [8, 10, 11, 12, 13, 15]
+
+
+def random_polygons(count: int, seed: int = 0) -> np.ndarray:
+    """Boxes of up to about 100 meters a side anywhere, with most of them against the ±180/±90 edges
+
+    Longitude 180 itself wraps around to -180, so the boxes at the east edge stop just short of it.
+    """
+    rng = np.random.default_rng(seed)
+    sizes = rng.uniform(1e-6, 1e-3, (count, 2))
+    west = rng.uniform(-180, 180 - 1e-3, count)
+    south = rng.uniform(-90, 90 - 1e-3, count)
+
+    edge = rng.integers(0, 6, count)
+    west[edge == 0] = -180
+    west[edge == 1] = 180 - 1e-9 - sizes[edge == 1, 0]
+    south[edge == 2] = -90
+    south[edge == 3] = 90 - sizes[edge == 3, 1]
+    return shapely.box(west, south, west + sizes[:, 0], south + sizes[:, 1])
+
+
+@pytest.mark.parametrize("code_length", CODE_LENGTHS)
+def test_encode_ubids_matches_buildingid(code_length):
+    polygons = random_polygons(2_000)
+
+    ubids = encode_ubids(polygons, code_length)
+
+    expected = []
+    for polygon in polygons:
+        west, south, east, north = polygon.bounds
+        centroid = polygon.centroid
+        expected.append(encode(south, west, north, east, centroid.y, centroid.x, codeLength=code_length))
+    assert ubids.tolist() == expected
+
+
+@pytest.mark.parametrize("code_length", CODE_LENGTHS)
+def test_decode_ubids_matches_buildingid(code_length):
+    ubids = encode_ubids(random_polygons(2_000, seed=1), code_length)
+
+    bounds, centroids = decode_ubids(ubids)
+
+    compared = 0
+    for ubid, ubid_bounds, centroid in zip(ubids, bounds.tolist(), centroids.tolist()):
+        try:
+            area = decode(ubid)
+        except AssertionError:
+            # the extents of some UBIDs at the edges reach a rounding error past ±180 or ±90, which buildingid rejects
+            west, south, east, north = ubid_bounds
+            assert min(west + 180, 180 - east, south + 90, 90 - north) < 1e-9
+            continue
+        assert ubid_bounds == [area.longitudeLo, area.latitudeLo, area.longitudeHi, area.latitudeHi]
+        assert centroid == [area.centroid.longitudeCenter, area.centroid.latitudeCenter]
+        compared += 1
+    assert compared > len(ubids) / 4
+
+
+def test_decode_ubids_of_missing_ubids():
+    ubid = encode_ubids(random_polygons(1))[0]
+
+    bounds, centroids = decode_ubids([None, ubid])
+
+    assert np.isnan(bounds[0]).all()
+    assert np.isnan(centroids[0]).all()
+    assert not np.isnan(bounds[1]).any()
+
+
+@pytest.mark.parametrize("ubid", ["849VQJQ6+95", "849VQJQ6+95-1-1-1", "849VQJQ6X95-0-0-0-0", "849VQJQ6+9I-0-0-0-0"])
+def test_decode_ubids_rejects_invalid_ubids(ubid):
+    with pytest.raises(ValueError, match="Invalid UBID"):
+        decode_ubids([ubid])
+
+
+def test_encode_ubids_rejects_geometries_at_longitude_180():
+    polygon = shapely.box(179.9999, 10, 180, 10.0001)
+    with pytest.raises(AssertionError):
+        encode_ubid(polygon)
+
+    with pytest.raises(ValueError, match="negative extent"):
+        encode_ubids([polygon])
@@ -0,0 +1,60 @@
+import pytest
+import requests
+
+from utils import update_quadkeys
+
+
+class StubSession:
+    """Answers with each status code in turn, with the quadkey as the body of the successful response"""
+
+    def __init__(self, status_codes: list[int], body: bytes):
+        self.status_codes = status_codes
+        self.body = body
+        self.requests = 0
+
+    def _response(self) -> requests.Response:
+        response = requests.Response()
+        response.status_code = self.status_codes[self.requests]
+        response._content = self.body if response.status_code == 200 else b""
+        response._content_consumed = True
+        response.headers["Content-Length"] = str(len(response._content))
+        self.requests += 1
+        return response
+
+    def get(self, *_args, **_kwargs) -> requests.Response:
+        return self._response()
+
+    def head(self, *_args, **_kwargs) -> requests.Response:
+        return self._response()
+
+
+def test_download_retries_rate_limited_and_server_errors(tmp_path, monkeypatch):
+    monkeypatch.setattr(update_quadkeys.time, "sleep", lambda _seconds: None)
+    session = StubSession([429, 503, 200], b"quadkey")
+
+    update_quadkeys._download(session, "https://example.com/1.geojsonl.gz", tmp_path / "1.geojsonl.gz")
+
+    assert session.requests == 3
+    assert (tmp_path / "1.geojsonl.gz").read_bytes() == b"quadkey"
+    assert list(tmp_path.iterdir()) == [tmp_path / "1.geojsonl.gz"]
+
+
+def test_download_raises_once_retries_are_used_up(tmp_path, monkeypatch):
+    monkeypatch.setattr(update_quadkeys.time, "sleep", lambda _seconds: None)
+    session = StubSession([503] * update_quadkeys.MAX_ATTEMPTS, b"")
+
+    with pytest.raises(requests.HTTPError, match="503"):
+        update_quadkeys._download(session, "https://example.com/1.geojsonl.gz", tmp_path / "1.geojsonl.gz")
+
+    assert session.requests == update_quadkeys.MAX_ATTEMPTS
+    assert not (tmp_path / "1.geojsonl.gz").exists()
+
+
+def test_head_retries_server_errors(monkeypatch):
+    monkeypatch.setattr(update_quadkeys.time, "sleep", lambda _seconds: None)
+    session = StubSession([502, 200], b"quadkey")
+
+    response = update_quadkeys._head(session, "https://example.com/1.geojsonl.gz")
+
+    assert session.requests == 2
+    assert response.headers["Content-Length"] == "7"
@@ -0,0 +1,69 @@
+# !/usr/bin/env python
+"""
+SEED Platform (TM), Copyright (c) Alliance for Sustainable Energy, LLC, and other contributors.
+See also https://github.com/SEED-platform/seed/blob/main/LICENSE.md
+"""
+
+import json
+import os
+from pathlib import Path
+from typing import Any, Optional
+
+from utils.serialize import dumps, loads
+
+CHECKPOINT_FILE = "checkpoint.json"
+
+# Stages of each batch, in the order they are completed
+STAGES = ["normalized", "geocoded", "quadkeys", "matched"]
+
+
+class Checkpoint:
+    """Persists the results of each stage of each batch, so that an interrupted run resumes where it stopped
+
+    The checkpoint only applies to runs with the same `fingerprint` (e.g. the same input file and settings),
+    and is cleared when a run with a different fingerprint starts.
+
+    Args:
+        directory (Path): Directory of the checkpoint files
+        fingerprint (dict): JSON-serializable description of the run
+    """
+
+    def __init__(self, directory: Path, fingerprint: dict):
+        self.directory = directory
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+        checkpoint_file = directory / CHECKPOINT_FILE
+        if checkpoint_file.exists():
+            with open(checkpoint_file) as f:
+                if json.load(f) == fingerprint:
+                    return
+
+        self.clear()
+        with open(checkpoint_file, "w") as f:
+            json.dump(fingerprint, f, indent=2)
+
+    def _stage_file(self, batch: int, stage: str) -> Path:
+        return self.directory / f"{batch:06d}-{stage}.json"
+
+    def load(self, batch: int, stage: str) -> Optional[Any]:
+        """Return the saved results of a stage of a batch, or None if the stage hasn't completed"""
+        stage_file = self._stage_file(batch, stage)
+        if not stage_file.exists():
+            return None
+
+        with open(stage_file) as f:
+            return loads(f.read())
+
+    def save(self, batch: int, stage: str, results: Any):
+        # write to a temporary file first so that an interrupted write is never mistaken for a completed stage
+        stage_file = self._stage_file(batch, stage)
+        temp_file = stage_file.with_suffix(".json.tmp")
+        with open(temp_file, "w") as f:
+            f.write(dumps(results))
+        os.replace(temp_file, stage_file)
+
+    def clear(self):
+        for stage in STAGES:
+            for stage_file in self.directory.glob(f"*-{stage}.json*"):
+                stage_file.unlink()
+        (self.directory / CHECKPOINT_FILE).unlink(missing_ok=True)
@@ -0,0 +1,98 @@
+# !/usr/bin/env python
+"""
+SEED Platform (TM), Copyright (c) Alliance for Sustainable Energy, LLC, and other contributors.
+See also https://github.com/SEED-platform/seed/blob/main/LICENSE.md
+"""
+
+import hashlib
+import sqlite3
+import time
+from pathlib import Path
+from typing import Optional
+
+from utils.common import Location
+from utils.geocode_cache import location_key
+from utils.serialize import dumps, loads
+
+
+def address_hash(location: Location) -> str:
+    """Hash of a location with a normalized street"""
+    return hashlib.sha1("\x1f".join(location_key(location)).encode()).hexdigest()
+
+
+class DeltaStore:
+    """SQLite store of the covered building results of previous runs, keyed by `address_hash`
+
+    Results are only reused by runs with the same `version` (e.g. the same footprint dataset and settings),
+    so that only new or changed addresses are processed again. Results of addresses that are no longer
+    in the input are removed by `prune`. Results with one of `retry_qualities` (e.g. from a transient
+    geocoding failure) aren't saved, so they're processed again by the next run, like a `GeocodeCache`.
+
+    Args:
+        path (Path, optional): SQLite database. Defaults to "data/covered-buildings.sqlite".
+        version (str, optional): Version of the results. Defaults to "".
+        retry_qualities (list[str], optional): Qualities of results to process again. Defaults to ["Not Found", "Ambiguous"].
+    """
+
+    def __init__(
+        self,
+        path: Path = Path("data/covered-buildings.sqlite"),
+        version: str = "",
+        retry_qualities: list[str] = ["Not Found", "Ambiguous"],
+    ):
+        self.version = version
+        self.retry_qualities = set(retry_qualities)
+        self.run_started = time.time()
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, version TEXT, result TEXT, seen REAL)")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def get_many(self, keys: list[str]) -> list[Optional[dict]]:
+        """Return the previous result of each key, or None if it's new, has a different version, or should be retried
+
+        The keys are marked as seen by this run, so `prune` keeps them.
+        """
+        # join against the requested keys so only their entries are read
+        self.connection.execute("CREATE TEMP TABLE IF NOT EXISTS lookup (key TEXT PRIMARY KEY)")
+        self.connection.execute("DELETE FROM lookup")
+        self.connection.executemany("INSERT OR IGNORE INTO lookup VALUES (?)", [(key,) for key in keys])
+        previous = {}
+        for key, text in self.connection.execute(
+            "SELECT r.key, r.result FROM lookup l JOIN results r ON r.key = l.key WHERE r.version = ?",
+            (self.version,),
+        ):
+            # stores written before the retried results were skipped may still have some
+            result = loads(text)
+            if result.get("quality") not in self.retry_qualities:
+                previous[key] = result
+        with self.connection:
+            self.connection.execute("UPDATE results SET seen = ? WHERE key IN (SELECT key FROM lookup)", (time.time(),))
+
+        return [previous.get(key) for key in keys]
+
+    def set_many(self, keys: list[str], results: list[dict]):
+        now = time.time()
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)",
+                [
+                    (key, self.version, dumps(result), now)
+                    for key, result in zip(keys, results)
+                    if result.get("quality") not in self.retry_qualities
+                ],
+            )
+
+    def prune(self):
+        """Remove the results of addresses that weren't seen by this run"""
+        with self.connection:
+            self.connection.execute("DELETE FROM results WHERE seen < ?", (self.run_started,))
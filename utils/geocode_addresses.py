@@ -4,10 +4,27 @@ SEED Platform (TM), Copyright (c) Alliance for Sustainable Energy, LLC, and othe
 See also https://github.com/SEED-platform/seed/blob/main/LICENSE.md
 """
 
+import random
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
 import requests
+from requests.adapters import HTTPAdapter
 
 from utils.chunk import chunk
 from utils.common import Location
+from utils.geocode_cache import GeocodeCache, location_key
+from utils.metrics import metrics
+from utils.rate_limiter import RateLimiter
+
+DEFAULT_GEOCODE_WORKERS = 4
+DEFAULT_REQUESTS_PER_SECOND = 5
+MAX_ATTEMPTS = 5
+BACKOFF_FACTOR = 1
+RETRY_STATUSES = [429, 500, 502, 503, 504]
+TIMEOUT = 60
 
 
 class MapQuestAPIKeyError(Exception):
@@ -58,22 +75,40 @@ def _process_result(result):
         return {"quality": quality}
 
 
-def geocode_addresses(locations: list[Location], mapquest_api_key: str):
-    # Alternatively, use GeoPandas: https://geopandas.org/en/stable/docs/reference/api/geopandas.tools.geocode.html
-    results = []
-
-    # MapQuest is limited to 100 locations per request
-    for location_chunk in chunk(locations):
-        response = requests.post(
-            f"https://www.mapquestapi.com/geocoding/v1/batch?key={mapquest_api_key}",
-            json={
-                "locations": location_chunk,
-                "options": {
-                    "maxResults": 2,
-                    "thumbMaps": False,
+def _geocode_batch(session: requests.Session, location_chunk: list[Location], mapquest_api_key: str, rate_limiter: RateLimiter) -> list:
+    for attempt in range(MAX_ATTEMPTS):
+        rate_limiter.acquire()
+        try:
+            response = session.post(
+                f"https://www.mapquestapi.com/geocoding/v1/batch?key={mapquest_api_key}",
+                json={
+                    "locations": location_chunk,
+                    "options": {
+                        "maxResults": 2,
+                        "thumbMaps": False,
+                    },
                 },
-            },
-        )
+                timeout=TIMEOUT,
+            )
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt == MAX_ATTEMPTS - 1:
+                raise
+            time.sleep(BACKOFF_FACTOR * 2**attempt + random.uniform(0, 1))
+            continue
+
+        metrics.count_response(response)
+
+        # Retry rate limited and server errors, waiting as long as the server asks to
+        if response.status_code in RETRY_STATUSES and attempt < MAX_ATTEMPTS - 1:
+            retry_after = response.headers.get("Retry-After", "")
+            time.sleep(float(retry_after) if retry_after.isdigit() else BACKOFF_FACTOR * 2**attempt + random.uniform(0, 1))
+            continue
+
+        # Give up on the batch once its retries are used up, rather than parsing the error response
+        if response.status_code in RETRY_STATUSES:
+            raise requests.HTTPError(
+                f"MapQuest geocoding failed with status {response.status_code} after {MAX_ATTEMPTS} attempts", response=response
+            )
 
         try:
             # Catch invalid API key error before parsing the response
@@ -81,7 +116,7 @@ def geocode_addresses(locations: list[Location], mapquest_api_key: str):
                 raise MapQuestAPIKeyError(
                     "Failed geocoding property states due to MapQuest error. " "API Key is invalid with message: {response.content}."
                 )
-            results += response.json().get("results")
+            return response.json().get("results")
         except Exception as e:
             if response.status_code == 403:
                 raise MapQuestAPIKeyError(
@@ -90,4 +125,77 @@ def geocode_addresses(locations: list[Location], mapquest_api_key: str):
             else:
                 raise e
 
+
+def _geocode_mapquest(
+    locations: list[Location],
+    mapquest_api_key: str,
+    max_workers: int = DEFAULT_GEOCODE_WORKERS,
+    requests_per_second: float = DEFAULT_REQUESTS_PER_SECOND,
+) -> list[dict]:
+    rate_limiter = RateLimiter(requests_per_second)
+
+    # MapQuest is limited to 100 locations per request, batches are sent concurrently and kept in order
+    with requests.Session() as session, ThreadPoolExecutor(max_workers=max_workers) as executor:
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        session.mount("https://", adapter)
+        batches = executor.map(
+            lambda location_chunk: _geocode_batch(session, location_chunk, mapquest_api_key, rate_limiter), chunk(locations)
+        )
+        results = [result for batch in batches for result in batch]
+
     return [_process_result(result) for result in results]
+
+
+class Geocoder(ABC):
+    """Geocodes locations in bulk, returning results in the same shape as `_process_result`, in the same order"""
+
+    # Name of the provider, which also separates its entries in a `GeocodeCache`
+    provider: str
+
+    @abstractmethod
+    def geocode(self, locations: list[Location]) -> list[dict]:
+        pass
+
+
+class MapQuestGeocoder(Geocoder):
+    provider = "mapquest"
+
+    def __init__(
+        self, mapquest_api_key: str, max_workers: int = DEFAULT_GEOCODE_WORKERS, requests_per_second: float = DEFAULT_REQUESTS_PER_SECOND
+    ):
+        self.mapquest_api_key = mapquest_api_key
+        self.max_workers = max_workers
+        self.requests_per_second = requests_per_second
+
+    def geocode(self, locations: list[Location]) -> list[dict]:
+        return _geocode_mapquest(locations, self.mapquest_api_key, self.max_workers, self.requests_per_second)
+
+
+def geocode_addresses(
+    locations: list[Location],
+    mapquest_api_key: Optional[str] = None,
+    cache: Optional[GeocodeCache] = None,
+    max_workers: int = DEFAULT_GEOCODE_WORKERS,
+    requests_per_second: float = DEFAULT_REQUESTS_PER_SECOND,
+    geocoder: Optional[Geocoder] = None,
+):
+    """Geocode the locations with `geocoder`, or with MapQuest if no geocoder is provided.
+    MapQuest sends up to `max_workers` batches at once while staying under `requests_per_second`.
+    Results are in the same order as the locations.
+    """
+    # Alternatively, use GeoPandas: https://geopandas.org/en/stable/docs/reference/api/geopandas.tools.geocode.html
+    if geocoder is None:
+        geocoder = MapQuestGeocoder(mapquest_api_key, max_workers, requests_per_second)
+
+    if cache is None:
+        return geocoder.geocode(locations)
+
+    # Only geocode the locations that aren't cached, once each
+    results = cache.get_many(locations)
+    misses = {location_key(location): location for location, result in zip(locations, results) if result is None}
+    metrics.count("geocode_cache_hits", len(locations) - len(misses))
+    metrics.count("geocode_cache_misses", len(misses))
+    geocoded = dict(zip(misses, geocoder.geocode(list(misses.values()))))
+    cache.set_many(list(misses.values()), list(geocoded.values()))
+
+    return [result if result is not None else geocoded[location_key(location)] for location, result in zip(locations, results)]
@@ -0,0 +1,94 @@
+# !/usr/bin/env python
+"""
+SEED Platform (TM), Copyright (c) Alliance for Sustainable Energy, LLC, and other contributors.
+See also https://github.com/SEED-platform/seed/blob/main/LICENSE.md
+"""
+
+import json
+import sqlite3
+import time
+from pathlib import Path
+from typing import Optional
+
+from utils.common import Location
+
+
+def location_key(location: Location) -> tuple[str, str, str]:
+    """Cache key of a location with a normalized street"""
+    return (
+        (location.get("street") or "").strip().lower(),
+        (location.get("city") or "").strip().lower(),
+        (location.get("state") or "").strip().lower(),
+    )
+
+
+class GeocodeCache:
+    """SQLite cache of geocoding results, keyed by provider and normalized location
+
+    Only use a cache if the provider's terms of service allow storing its results.
+
+    Args:
+        path (Path, optional): SQLite database. Defaults to "data/geocode-cache.sqlite".
+        provider (str, optional): Geocoding provider, each provider has separate entries. Defaults to "mapquest".
+        ttl (Optional[float], optional): Seconds before a cached result expires, None to never expire. Defaults to None.
+        retry_qualities (list[str], optional): Qualities of cached results to geocode again. Defaults to ["Ambiguous"].
+    """
+
+    def __init__(
+        self,
+        path: Path = Path("data/geocode-cache.sqlite"),
+        provider: str = "mapquest",
+        ttl: Optional[float] = None,
+        retry_qualities: list[str] = ["Ambiguous"],
+    ):
+        self.provider = provider
+        self.ttl = ttl
+        self.retry_qualities = set(retry_qualities)
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS geocodes ("
+            "provider TEXT, street TEXT, city TEXT, state TEXT, quality TEXT, result TEXT, created REAL, "
+            "PRIMARY KEY (provider, street, city, state))"
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def get_many(self, locations: list[Location]) -> list[Optional[dict]]:
+        """Return the cached result of each location, or None if it's missing, expired, or should be retried"""
+        oldest = time.time() - self.ttl if self.ttl is not None else float("-inf")
+        keys = [location_key(location) for location in locations]
+
+        # join against the requested keys so only their entries are read
+        self.connection.execute("CREATE TEMP TABLE IF NOT EXISTS lookup (street TEXT, city TEXT, state TEXT)")
+        self.connection.execute("DELETE FROM lookup")
+        self.connection.executemany("INSERT INTO lookup VALUES (?, ?, ?)", set(keys))
+        cached = {}
+        for street, city, state, quality, result, created in self.connection.execute(
+            "SELECT g.street, g.city, g.state, g.quality, g.result, g.created FROM lookup l "
+            "JOIN geocodes g ON g.provider = ? AND g.street = l.street AND g.city = l.city AND g.state = l.state",
+            (self.provider,),
+        ):
+            if created >= oldest and quality not in self.retry_qualities:
+                cached[(street, city, state)] = json.loads(result)
+
+        return [cached.get(key) for key in keys]
+
+    def set_many(self, locations: list[Location], results: list[dict]):
+        now = time.time()
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO geocodes VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (self.provider, *location_key(location), result.get("quality"), json.dumps(result), now)
+                    for location, result in zip(locations, results)
+                ],
+            )
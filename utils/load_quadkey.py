@@ -0,0 +1,63 @@
+# !/usr/bin/env python
+"""
+SEED Platform (TM), Copyright (c) Alliance for Sustainable Energy, LLC, and other contributors.
+See also https://github.com/SEED-platform/seed/blob/main/LICENSE.md
+"""
+
+import gzip
+import os
+from pathlib import Path
+from typing import Optional
+
+import geopandas as gpd
+
+from utils.metrics import metrics
+
+try:
+    import pyarrow as pa
+except ImportError:
+    # Without pyarrow the footprints are parsed from the downloaded GeoJSONL every time
+    pa = None
+
+
+def quadkey_cache_file(quadkey: int, save_directory: Path = Path("data/quadkeys")) -> Path:
+    return save_directory / f"{quadkey}.parquet"
+
+
+def load_quadkey(quadkey: int, save_directory: Path = Path("data/quadkeys")) -> Optional[gpd.GeoDataFrame]:
+    """Load the footprints of a downloaded quadkey, or None if the quadkey has no footprints
+
+    The first load of each downloaded version of a quadkey saves its geometry and height columns as
+    GeoParquet, with a bounding box column so that other readers can filter it by area. Later loads
+    memory-map that file instead of parsing the GeoJSONL. The cache is stale once the quadkey is
+    downloaded again.
+
+    The spatial index isn't persisted, since shapely can't save a packed STRtree (pickling one only
+    saves its geometries, and rebuilds it when loaded). It's built in memory the first time it's used
+    instead, which takes about a fifth of the time of reading the cache.
+    """
+    quadkey_file = save_directory / f"{quadkey}.geojsonl.gz"
+    if not quadkey_file.exists():
+        return None
+
+    print(f"Loading {quadkey}")
+    cache_file = quadkey_cache_file(quadkey, save_directory)
+    with metrics.stage("load_quadkey") as stage:
+        if pa is not None and cache_file.exists() and cache_file.stat().st_mtime_ns >= quadkey_file.stat().st_mtime_ns:
+            metrics.count("parquet_cache_hits")
+            footprints = gpd.read_parquet(cache_file, memory_map=True)
+        else:
+            metrics.count("parquet_cache_misses")
+            with gzip.open(quadkey_file, "rb") as f:
+                footprints = gpd.read_file(f)[["height", "geometry"]]
+
+            if pa is not None:
+                # write to a temporary file first so that an interrupted write is never mistaken for a valid cache,
+                # named by process since parallel matching workers can load the same quadkey at once
+                temp_file = cache_file.with_suffix(f".parquet.{os.getpid()}.tmp")
+                footprints.to_parquet(temp_file, index=False, write_covering_bbox=True)
+                os.replace(temp_file, cache_file)
+        stage.items = len(footprints)
+    print(f"  {len(footprints)} footprints in quadkey")
+
+    return footprints
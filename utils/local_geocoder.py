@@ -0,0 +1,125 @@
+# !/usr/bin/env python
+"""
+SEED Platform (TM), Copyright (c) Alliance for Sustainable Energy, LLC, and other contributors.
+See also https://github.com/SEED-platform/seed/blob/main/LICENSE.md
+"""
+
+import csv
+import os
+import sqlite3
+from pathlib import Path
+from typing import Optional
+
+from utils.common import Location
+from utils.geocode_addresses import Geocoder
+from utils.geocode_cache import location_key
+from utils.normalize_address import normalize_address
+
+# Quality of an exact address point match, in the MapQuest format of point granularity with the highest confidence
+ADDRESS_POINT_QUALITY = "P1AAA"
+
+# Rows are inserted into the index in batches of this size
+BATCH_SIZE = 10_000
+
+
+def build_address_index(addresses_file: Path, index_file: Path):
+    """Index an OpenAddresses-style csv of address points by normalized street, city, and state
+
+    The csv must have `LON`, `LAT`, `NUMBER`, and `STREET` columns, and may have `UNIT`, `CITY`,
+    `DISTRICT` (county), `REGION` (state), and `POSTCODE` columns. Addresses with a unit are indexed
+    both with and without their unit.
+    """
+    temp_file = index_file.with_name(f"{index_file.name}.tmp")
+    temp_file.unlink(missing_ok=True)
+    connection = sqlite3.connect(temp_file)
+    connection.execute(
+        "CREATE TABLE addresses "
+        "(street TEXT, city TEXT, state TEXT, address TEXT, longitude REAL, latitude REAL, postal_code TEXT, county TEXT)"
+    )
+
+    with open(addresses_file, newline="", encoding="utf-8") as f:
+        rows = []
+        for row in csv.DictReader(f):
+            number, street, unit = row["NUMBER"].strip(), row["STREET"].strip(), (row.get("UNIT") or "").strip()
+            if not number or not street:
+                continue
+
+            location = {"city": row.get("CITY"), "state": row.get("REGION")}
+            values = (f"{number} {street}", float(row["LON"]), float(row["LAT"]), row.get("POSTCODE") or None, row.get("DISTRICT") or None)
+            for address in [f"{number} {street}", f"{number} {street} {unit}"] if unit else [f"{number} {street}"]:
+                rows.append((*location_key(location | {"street": normalize_address(address)}), *values))
+
+            if len(rows) >= BATCH_SIZE:
+                connection.executemany("INSERT INTO addresses VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+                rows = []
+        connection.executemany("INSERT INTO addresses VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+    connection.execute("CREATE INDEX addresses_key ON addresses (street, city, state)")
+    connection.commit()
+    connection.close()
+    os.replace(temp_file, index_file)
+
+
+class LocalGeocoder(Geocoder):
+    """Geocodes locations offline against an indexed address point dataset, see `build_address_index`
+
+    The index is built the first time each version of `addresses_file` is used. Locations that match
+    more than one address point are "Ambiguous", and locations that don't match any are "Not Found".
+
+    Args:
+        addresses_file (Path): OpenAddresses-style csv of address points
+        index_file (Optional[Path], optional): SQLite index of the addresses. Defaults to `addresses_file` with a .sqlite suffix.
+    """
+
+    provider = "local"
+
+    def __init__(self, addresses_file: Path, index_file: Optional[Path] = None):
+        self.index_file = index_file or addresses_file.with_suffix(".sqlite")
+        if not self.index_file.exists() or self.index_file.stat().st_mtime_ns < addresses_file.stat().st_mtime_ns:
+            print(f"Indexing {addresses_file}")
+            build_address_index(addresses_file, self.index_file)
+
+    def geocode(self, locations: list[Location]) -> list[dict]:
+        keys = [location_key(location) for location in locations]
+
+        connection = sqlite3.connect(self.index_file)
+        try:
+            # join against the requested keys so that all locations are looked up in one query
+            connection.execute("CREATE TEMP TABLE lookup (street TEXT, city TEXT, state TEXT)")
+            connection.executemany("INSERT INTO lookup VALUES (?, ?, ?)", set(keys))
+            matches: dict[tuple[str, str, str], list[tuple]] = {}
+            for street, city, state, *match in connection.execute(
+                "SELECT a.street, a.city, a.state, a.address, a.longitude, a.latitude, a.postal_code, a.county FROM lookup l "
+                "JOIN addresses a ON a.street = l.street AND a.city = l.city AND a.state = l.state"
+            ):
+                matches.setdefault((street, city, state), []).append(tuple(match))
+        finally:
+            connection.close()
+
+        results = []
+        for location, key in zip(locations, keys):
+            # address points at the same coordinates (e.g. units in a building) are the same match
+            points = {}
+            for match in matches.get(key, []):
+                points.setdefault((round(match[1], 6), round(match[2], 6)), match)
+
+            if len(points) == 0:
+                results.append({"quality": "Not Found"})
+            elif len(points) > 1:
+                results.append({"quality": "Ambiguous"})
+            else:
+                address, longitude, latitude, postal_code, county = next(iter(points.values()))
+                results.append(
+                    {
+                        "quality": ADDRESS_POINT_QUALITY,
+                        "address": address,
+                        "longitude": longitude,
+                        "latitude": latitude,
+                        "postal_code": postal_code,
+                        "side_of_street": None,
+                        "city": location.get("city"),
+                        "county": county,
+                        "state": location.get("state"),
+                    }
+                )
+        return results
@@ -0,0 +1,42 @@
+# !/usr/bin/env python
+"""
+SEED Platform (TM), Copyright (c) Alliance for Sustainable Energy, LLC, and other contributors.
+See also https://github.com/SEED-platform/seed/blob/main/LICENSE.md
+"""
+
+import json
+import os
+import time
+from pathlib import Path
+from typing import Optional
+
+# How long (in seconds) a downloaded file is trusted to be up-to-date before it is checked again
+DEFAULT_TTL = 7 * 24 * 60 * 60
+
+MANIFEST_FILE = "manifest.json"
+
+
+def load_manifest(save_directory: Path = Path("data/quadkeys")) -> dict[str, dict]:
+    """Load the manifest of downloaded files, keyed by file name, with their `etag`, `size`, and `fetched` time"""
+    manifest_file = save_directory / MANIFEST_FILE
+    if not manifest_file.exists():
+        return {}
+
+    with open(manifest_file) as f:
+        return json.load(f)
+
+
+def save_manifest(manifest: dict[str, dict], save_directory: Path = Path("data/quadkeys")):
+    temp_file = save_directory / f"{MANIFEST_FILE}.tmp"
+    with open(temp_file, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(temp_file, save_directory / MANIFEST_FILE)
+
+
+def manifest_entry(path: Path, etag: Optional[str], **kwargs) -> dict:
+    return {"etag": etag, "size": path.stat().st_size, "fetched": time.time(), **kwargs}
+
+
+def is_fresh(entry: Optional[dict], path: Path, ttl: float = DEFAULT_TTL) -> bool:
+    """Whether a downloaded file is unchanged since it was recorded, and was fetched within the last `ttl` seconds"""
+    return entry is not None and path.exists() and path.stat().st_size == entry["size"] and time.time() - entry["fetched"] < ttl
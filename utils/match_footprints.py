@@ -0,0 +1,149 @@
+# !/usr/bin/env python
+"""
+SEED Platform (TM), Copyright (c) Alliance for Sustainable Energy, LLC, and other contributors.
+See also https://github.com/SEED-platform/seed/blob/main/LICENSE.md
+"""
+
+from typing import Callable, Optional
+
+import numpy as np
+import pandas as pd
+import shapely
+from geopandas import GeoDataFrame
+
+from utils.quadkey_helpers import quadkey_bounds, quadkeys_within, search_bounds
+
+# Maximum distance (in meters) from a geocoded coordinate to the closest footprint
+DEFAULT_MAX_DISTANCE = 100
+
+
+def _nearest_within(
+    bounds: np.ndarray, projected_points: np.ndarray, footprints: GeoDataFrame, crs, max_distance: float
+) -> tuple[np.ndarray, np.ndarray]:
+    """Find the position of, and distance to, the closest footprint of each point
+
+    Candidates are limited to the footprints that intersect each point's search bounds, and only
+    those candidates are projected to measure their distance in meters.
+    Points without a footprint within `max_distance` have a position of -1.
+    """
+    positions = np.full(len(projected_points), -1)
+    distances = np.full(len(projected_points), np.inf)
+
+    point_candidates, footprint_candidates = footprints.sindex.query(shapely.box(*bounds.T), predicate="intersects")
+    if len(point_candidates) == 0:
+        return positions, distances
+
+    # project each candidate footprint once, even if it is a candidate for several points
+    unique_candidates, inverse = np.unique(footprint_candidates, return_inverse=True)
+    projected_footprints = footprints.geometry.iloc[unique_candidates].to_crs(crs).to_numpy()[inverse]
+    candidate_distances = shapely.distance(projected_points[point_candidates], projected_footprints)
+
+    # keep the closest candidate of each point
+    order = np.lexsort((footprint_candidates, candidate_distances, point_candidates))
+    point_candidates, footprint_candidates, candidate_distances = (
+        point_candidates[order],
+        footprint_candidates[order],
+        candidate_distances[order],
+    )
+    first = np.unique(point_candidates, return_index=True)[1]
+    within = candidate_distances[first] <= max_distance
+    positions[point_candidates[first][within]] = footprint_candidates[first][within]
+    distances[point_candidates[first][within]] = candidate_distances[first][within]
+
+    return positions, distances
+
+
+def match_footprints(
+    points: GeoDataFrame,
+    quadkey: int,
+    load_footprints: Callable[[int], Optional[GeoDataFrame]],
+    max_distance: float = DEFAULT_MAX_DISTANCE,
+) -> pd.DataFrame:
+    """Match every point to the footprint it falls within, or to the closest footprint otherwise
+
+    All points are joined against the footprints' spatial index in a single query, and only the
+    points without an intersecting footprint fall back to the closest footprint search. Points
+    close to the edge of the quadkey also search the neighboring quadkeys.
+
+    Args:
+        points (GeoDataFrame): Geocoded coordinates to match, all within `quadkey`
+        quadkey (int): Quadkey that contains the points
+        load_footprints (Callable[[int], Optional[GeoDataFrame]]): Returns the footprints of a quadkey,
+            with `geometry` and `height` columns, or None if the quadkey has no footprints
+        max_distance (float, optional): Maximum distance in meters to the closest footprint. Defaults to 100.
+
+    Returns:
+        pd.DataFrame: `footprint_match`, `geometry`, `height`, and `proximity_to_geocoding_coord` (meters)
+            for each point, with the same index as `points`. Points without a footprint within
+            `max_distance` have no match.
+    """
+    matched = np.zeros(len(points), dtype=bool)
+    footprint_match = np.full(len(points), None, dtype=object)
+    geometry = np.full(len(points), None, dtype=object)
+    height = np.full(len(points), None, dtype=object)
+    proximity = np.full(len(points), np.inf)
+
+    footprints = load_footprints(quadkey)
+    if footprints is not None and len(footprints):
+        # intersections are returned as pairs of (point position, footprint position)
+        point_hits, footprint_hits = footprints.sindex.query(points.geometry, predicate="intersects")
+        if len(point_hits):
+            # keep the first footprint for points that intersect more than one
+            order = np.lexsort((footprint_hits, point_hits))
+            point_hits, footprint_hits = point_hits[order], footprint_hits[order]
+            first = np.unique(point_hits, return_index=True)[1]
+            point_hits, footprint_hits = point_hits[first], footprint_hits[first]
+
+            matched[point_hits] = True
+            footprint_match[point_hits] = "intersection"
+            geometry[point_hits] = footprints.geometry.to_numpy()[footprint_hits]
+            height[point_hits] = footprints["height"].to_numpy()[footprint_hits]
+            proximity[point_hits] = 0
+
+    unmatched = np.flatnonzero(~matched)
+    if len(unmatched):
+        longitudes = points.geometry.x.to_numpy()[unmatched]
+        latitudes = points.geometry.y.to_numpy()[unmatched]
+        bounds = np.column_stack(search_bounds(longitudes, latitudes, max_distance))
+
+        # measure distances in meters in the local UTM zone
+        crs = points.estimate_utm_crs()
+        projected_points = points.geometry.iloc[unmatched].to_crs(crs).to_numpy()
+
+        # points whose search bounds extend past the quadkey also search the neighboring quadkeys
+        candidate_quadkeys: dict[int, list[int]] = {quadkey: list(range(len(unmatched)))}
+        tile_west, tile_south, tile_east, tile_north = quadkey_bounds(quadkey)
+        crossing = np.flatnonzero(
+            (bounds[:, 0] < tile_west) | (bounds[:, 1] < tile_south) | (bounds[:, 2] > tile_east) | (bounds[:, 3] > tile_north)
+        )
+        for i in crossing:
+            for neighbor in quadkeys_within(*bounds[i]):
+                if neighbor != quadkey:
+                    candidate_quadkeys.setdefault(neighbor, []).append(i)
+
+        for candidate_quadkey, member_list in candidate_quadkeys.items():
+            candidates = footprints if candidate_quadkey == quadkey else load_footprints(candidate_quadkey)
+            if candidates is None or len(candidates) == 0:
+                continue
+
+            members = np.array(member_list)
+            positions, distances = _nearest_within(bounds[members], projected_points[members], candidates, crs, max_distance)
+            closer = distances < proximity[unmatched[members]]
+            targets = unmatched[members[closer]]
+            footprint_match[targets] = "closest"
+            geometry[targets] = candidates.geometry.to_numpy()[positions[closer]]
+            height[targets] = candidates["height"].to_numpy()[positions[closer]]
+            proximity[targets] = distances[closer]
+
+    height[height == -1] = None
+    proximity[np.isinf(proximity)] = np.nan
+
+    return pd.DataFrame(
+        {
+            "footprint_match": footprint_match,
+            "geometry": geometry,
+            "height": height,
+            "proximity_to_geocoding_coord": proximity,
+        },
+        index=points.index,
+    )
@@ -0,0 +1,137 @@
+# !/usr/bin/env python
+"""
+SEED Platform (TM), Copyright (c) Alliance for Sustainable Energy, LLC, and other contributors.
+See also https://github.com/SEED-platform/seed/blob/main/LICENSE.md
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from collections.abc import Iterator
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional
+
+import requests
+
+try:
+    import resource
+except ImportError:
+    # Peak RSS isn't available on Windows
+    resource = None
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Peak resident memory of this process so far, in megabytes"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / 1e6 if sys.platform == "darwin" else peak / 1e3
+
+
+class StageRecord:
+    """Items processed by the current run of a stage, which can be set once they are known"""
+
+    def __init__(self, items: int = 0):
+        self.items = items
+
+
+class Metrics:
+    """Records the wall time, items processed, counters, and peak RSS of each stage of a run
+
+    Counters (e.g. HTTP requests and bytes, and cache hits and misses) are attributed to every stage
+    that was running while they were counted, including stages running in other threads. Work done in
+    other processes is timed by the stage that waits for it, but its counters aren't recorded.
+    With `trace`, every run of a stage is also recorded as a trace event, see `save_trace`.
+    """
+
+    def __init__(self, trace: bool = False):
+        self.lock = threading.Lock()
+        self.reset(trace)
+
+    def reset(self, trace: bool = False):
+        self.started = time.perf_counter()
+        self.counters: Counter[str] = Counter()
+        self.stages: dict[str, dict] = {}
+        self.events: Optional[list[dict]] = [] if trace else None
+
+    def count(self, name: str, value: float = 1):
+        with self.lock:
+            self.counters[name] += value
+
+    def count_response(self, response: requests.Response, content_bytes: Optional[int] = None):
+        """Count an HTTP request, and the bytes of its response (unless it's streamed, then count `content_bytes` instead)"""
+        with self.lock:
+            self.counters["http_requests"] += 1
+            self.counters["http_bytes"] += content_bytes if content_bytes is not None else len(response.content)
+
+    @contextmanager
+    def stage(self, name: str, items: int = 0) -> Iterator[StageRecord]:
+        """Time a stage of the run, and record the counters that changed while it was running"""
+        record = StageRecord(items)
+        with self.lock:
+            counters = self.counters.copy()
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            end = time.perf_counter()
+            with self.lock:
+                stage = self.stages.setdefault(name, {"calls": 0, "seconds": 0.0, "items": 0, "counters": Counter()})
+                stage["calls"] += 1
+                stage["seconds"] += end - start
+                stage["items"] += record.items
+                stage["counters"].update(self.counters - counters)
+                stage["peak_rss_mb"] = peak_rss_mb()
+                if self.events is not None:
+                    self.events.append(
+                        {
+                            "name": name,
+                            "cat": "stage",
+                            "ph": "X",
+                            "ts": (start - self.started) * 1e6,
+                            "dur": (end - start) * 1e6,
+                            "pid": os.getpid(),
+                            "tid": threading.get_ident(),
+                            "args": {"items": record.items},
+                        }
+                    )
+
+    def report(self) -> dict:
+        """Totals of the run, and of each stage"""
+        with self.lock:
+            return {
+                "seconds": round(time.perf_counter() - self.started, 4),
+                "peak_rss_mb": peak_rss_mb(),
+                "counters": dict(self.counters),
+                "stages": {
+                    name: {
+                        "calls": stage["calls"],
+                        "seconds": round(stage["seconds"], 4),
+                        "items": stage["items"],
+                        "items_per_second": round(stage["items"] / stage["seconds"], 1) if stage["items"] and stage["seconds"] else None,
+                        "peak_rss_mb": stage["peak_rss_mb"],
+                        "counters": dict(stage["counters"]),
+                    }
+                    for name, stage in self.stages.items()
+                },
+            }
+
+    def save_report(self, path: Path):
+        with open(path, "w") as f:
+            json.dump(self.report(), f, indent=2)
+
+    def save_trace(self, path: Path):
+        """Save the stages as Trace Event Format JSON, which can be opened in Perfetto (https://ui.perfetto.dev) or chrome://tracing"""
+        with self.lock:
+            events = list(self.events or [])
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+
+# Metrics of the current run, shared by all modules
+metrics = Metrics()
@@ -5,48 +5,68 @@ See also https://github.com/SEED-platform/seed/blob/main/LICENSE.md
 """
 
 import re
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import Optional
 
 import usaddress
 from streetaddress.streetaddress import StreetAddressFormatter
 
+from utils.chunk import chunk
+
+# The formatter only compiles its patterns when it's created, so a single instance is shared by all calls
+STREET_ADDRESS_FORMATTER = StreetAddressFormatter()
+
+# Number of normalized addresses to remember
+MEMO_SIZE = 2**20
+
+# Batches with fewer unique addresses than this are normalized in-process
+MIN_PARALLEL_ADDRESSES = 10_000
+
+# Number of addresses sent to a worker at a time
+CHUNK_SIZE = 1_000
+
+SUBADDRESS_MAP = {
+    "bldg": "building",
+    "blg": "building",
+}
+
+OCCUPANCY_MAP = {
+    "ste": "suite",
+    "suite": "suite",
+}
+
+DIRECTION_MAP = {
+    "east": "e",
+    "west": "w",
+    "north": "n",
+    "south": "s",
+    "northeast": "ne",
+    "northwest": "nw",
+    "southeast": "se",
+    "southwest": "sw",
+}
+
+# Odd characters that we come across
+REPLACEMENTS = {
+    "\xef\xbf\xbd": "",
+    "\ufffd": "",
+}
+
 
 def _normalize_subaddress_type(subaddress_type):
     subaddress_type = subaddress_type.lower().replace(".", "")
-    subaddress_map = {
-        "bldg": "building",
-        "blg": "building",
-    }
-    if subaddress_type in subaddress_map:
-        return subaddress_map[subaddress_type]
-    return subaddress_type
+    return SUBADDRESS_MAP.get(subaddress_type, subaddress_type)
 
 
 def _normalize_occupancy_type(occupancy_id):
     occupancy_id = occupancy_id.lower().replace(".", "")
-    occupancy_map = {
-        "ste": "suite",
-        "suite": "suite",
-    }
-    if occupancy_id in occupancy_map:
-        return occupancy_map[occupancy_id]
-    return occupancy_id
+    return OCCUPANCY_MAP.get(occupancy_id, occupancy_id)
 
 
 def _normalize_address_direction(direction):
     direction = direction.lower().replace(".", "")
-    direction_map = {
-        "east": "e",
-        "west": "w",
-        "north": "n",
-        "south": "s",
-        "northeast": "ne",
-        "northwest": "nw",
-        "southeast": "se",
-        "southwest": "sw",
-    }
-    if direction in direction_map:
-        return direction_map[direction]
-    return direction
+    return DIRECTION_MAP.get(direction, direction)
 
 
 POST_TYPE_MAP = {
@@ -117,11 +137,7 @@ def normalize_address(address_val: str):
         pass
 
     # Do some string replacements to remove odd characters that we come across
-    replacements = {
-        "\xef\xbf\xbd": "",
-        "\ufffd": "",
-    }
-    for k, v in replacements.items():
+    for k, v in REPLACEMENTS.items():
         address_val = address_val.replace(k, v)
 
     # now parse the address into number, street name and street type
@@ -166,7 +182,40 @@ def normalize_address(address_val: str):
         if "OccupancyIdentifier" in addr and addr["OccupancyIdentifier"] is not None:
             normalized_address = normalized_address + " " + addr["OccupancyIdentifier"]
 
-        formatter = StreetAddressFormatter()
-        normalized_address = formatter.abbrev_street_avenue_etc(normalized_address)
+        normalized_address = STREET_ADDRESS_FORMATTER.abbrev_street_avenue_etc(normalized_address)
 
     return normalized_address.lower().strip()
+
+
+# Duplicate addresses are common, so remember recent results
+_normalize_address_memoized = lru_cache(maxsize=MEMO_SIZE)(normalize_address)
+
+
+def _normalize_chunk(addresses: list) -> list[Optional[str]]:
+    return [_normalize_address_memoized(address) for address in addresses]
+
+
+def normalize_addresses(
+    addresses: list, max_workers: Optional[int] = None, executor: Optional[ProcessPoolExecutor] = None
+) -> list[Optional[str]]:
+    """Normalize a list of addresses, see `normalize_address`
+
+    Each unique address is only normalized once. Large batches are normalized in chunks
+    on a pool of `max_workers` processes (defaults to the number of CPUs). Pass an `executor`
+    to reuse its processes across calls, instead of starting a pool for each call.
+    """
+    unique_addresses = list(dict.fromkeys(addresses))
+
+    if len(unique_addresses) < MIN_PARALLEL_ADDRESSES or max_workers == 1:
+        normalized = _normalize_chunk(unique_addresses)
+    else:
+        pool = executor or ProcessPoolExecutor(max_workers=max_workers)
+        try:
+            chunk_results = pool.map(_normalize_chunk, chunk(unique_addresses, CHUNK_SIZE))
+            normalized = [address for chunk_result in chunk_results for address in chunk_result]
+        finally:
+            if executor is None:
+                pool.shutdown()
+
+    lookup = dict(zip(unique_addresses, normalized))
+    return [lookup[address] for address in addresses]
@@ -1,20 +1,34 @@
-import requests
+from typing import Optional
+
+import numpy as np
+from geopandas import GeoSeries, points_from_xy
 from geopandas.geodataframe import GeoDataFrame
-from geopy.geocoders import Nominatim
 from shapely.geometry import Polygon
 
+from .chunk import chunk
+from .osm_client import osm_client
+from .osm_index import osm_index
+from .quadkey_helpers import quadkey_bounds, quadkeys, search_bounds, utm_crs
+from .tile_planner import plan_quadkeys
 from .ubid import bounding_box, centroid, encode_ubid
 
-OVERPASS_URL = "http://overpass-api.de/api/interpreter"
+# Number of buildings to download in each Overpass query
+OVERPASS_BATCH_SIZE = 100
+
+# Radius (in meters) of the nearest building searches
+NEAREST_BUILDING_DISTANCE = 50
+
+# Building types that the nearest building searches return
+NEAREST_BUILDING_TYPES = ["yes", "retail"]
+
+# Zoom level of the areas (about 2.4 km wide) whose buildings are downloaded at once by `find_buildings_in_bulk`
+OSM_AREA_ZOOM = 14
 
 
 def reverse_geocode(lat, lon):
     """should only call at 1 per second per user agreement, no threaded calls either. This
-    is per the license agreement"""
-    geolocator = Nominatim(user_agent="CBL")
-    location = geolocator.reverse((lat, lon), language="en", exactly_one=True)
-    # print(location)
-    return location.raw
+    is per the license agreement, and is enforced by the shared `osm_client`"""
+    return osm_client().reverse(lat, lon)
 
 
 def get_building_id_from_osm_id(place_id):
@@ -28,12 +42,11 @@ def get_building_id_from_osm_id(place_id):
     """
 
     # Send the Overpass query to the Overpass API
-    response = requests.post(OVERPASS_URL, data=overpass_query)
+    data = osm_client().overpass(overpass_query)
 
-    if response.status_code != 200:
+    if data is None:
         return "Error: Failed to retrieve building ID."
 
-    data = response.json()
     # Extract the building ID from the response
     building_id = None
     for element in data["elements"]:
@@ -58,14 +71,12 @@ def download_building(building_id):
     """
 
     # Send the Overpass query to the Overpass API
-    response = requests.post(OVERPASS_URL, data=overpass_query)
+    data = osm_client().overpass(overpass_query)
 
-    if response.status_code != 200:
+    if data is None:
         print(f"Error: Failed to download building nodes for building ID {building_id}")
         return None
 
-    data = response.json()
-
     return data["elements"][0]
 
 
@@ -89,14 +100,12 @@ def download_building_and_nodes_by_id(building_id):
     """
 
     # Send the Overpass query to the Overpass API
-    response = requests.post(OVERPASS_URL, data=overpass_query)
+    data = osm_client().overpass(overpass_query)
 
-    if response.status_code != 200:
+    if data is None:
         print(f"Error: Failed to download building nodes for building ID {building_id}")
         return None
 
-    data = response.json()
-
     # Extract the nodes from the response
     nodes = []
     for element in data["elements"]:
@@ -107,51 +116,230 @@ def download_building_and_nodes_by_id(building_id):
 
 
 def get_node_coordinates(node_ids: list[int]):
-    # Define an empty list to store the coordinates of all nodes
-    node_coordinates = {}
+    if not node_ids:
+        return None
+
+    # Define the Overpass query for all nodes at once
+    overpass_query = f"""
+    [out:json];
+    (
+      node(id:{",".join(str(node_id) for node_id in node_ids)});
+    );
+    out;
+    """
+
+    # Send the Overpass query to the Overpass API
+    data = osm_client().overpass(overpass_query)
 
-    # Iterate over each node ID
+    if data is None:
+        print(f"Error: Failed to retrieve coordinates for node IDs {node_ids}")
+        return None
+
+    nodes = {
+        element["id"]: element
+        for element in data["elements"]
+        if element.get("type") == "node" and "id" in element and "lat" in element and "lon" in element
+    }
+
+    # Extract the latitude and longitude coordinates of the nodes, in the order of `node_ids` rather than the response's
+    node_coordinates = {}
     for node_id in node_ids:
-        # Define the Overpass query for each node
+        if node_id not in nodes:
+            continue
+        lat = float(nodes[node_id]["lat"])
+        lon = float(nodes[node_id]["lon"])
+        # Check if coordinates are within valid range
+        if -90.0 <= lat <= 90.0 and -180.0 <= lon <= 180.0:
+            node_coordinates[node_id] = (lat, lon)
+        else:
+            print(f"Invalid coordinates for node ID {node_id}: Latitude {lat}, Longitude {lon}")
+
+    polygon = [(x[1], x[0]) for x in node_coordinates.values()]
+    if len(polygon) < 3:
+        return None
+    else:
+        return Polygon(polygon)
+
+
+def download_buildings(building_ids: list[int], batch_size: int = OVERPASS_BATCH_SIZE) -> dict[int, Optional[dict]]:
+    """Download the tags and full geometry of many buildings, with a single Overpass query for each batch of buildings
+
+    Args:
+        building_ids (list[int]): OpenStreetMap building (way) IDs
+        batch_size (int, optional): Number of buildings in each query. Defaults to 100.
+
+    Returns:
+        dict[int, Optional[dict]]: The way of each building that was found, keyed by ID, with its `tags` and
+            the coordinates of its nodes in `geometry`, see `way_polygon`. Buildings that weren't found are
+            missing, and the buildings of batches that failed to download are None.
+    """
+    index = osm_index()
+    if index is not None:
+        return index.buildings(building_ids)
+
+    buildings = {}
+    for batch in chunk(list(dict.fromkeys(building_ids)), batch_size):
         overpass_query = f"""
         [out:json];
         (
-          node({node_id});
+          way(id:{",".join(str(building_id) for building_id in batch)});
         );
-        out;
+        out tags geom;
         """
 
         # Send the Overpass query to the Overpass API
-        response = requests.post(OVERPASS_URL, data=overpass_query)
+        data = osm_client().overpass(overpass_query)
 
-        if response.status_code != 200:
-            print(f"Error: Failed to retrieve coordinates for node ID {node_id}")
-            return None
+        if data is None:
+            print(f"Error: Failed to download buildings {batch}")
+            buildings.update(dict.fromkeys(batch))
+            continue
 
-        data = response.json()
-
-        # Extract the latitude and longitude coordinates of the node from the response
         for element in data["elements"]:
-            if "type" in element and element["type"] == "node" and "id" in element and "lat" in element and "lon" in element:
-                lat = float(element["lat"])
-                lon = float(element["lon"])
-                # Check if coordinates are within valid range
-                if -90.0 <= lat <= 90.0 and -180.0 <= lon <= 180.0:
-                    node_coordinates[node_id] = (lat, lon)
-                else:
-                    print(f"Invalid coordinates for node ID {node_id}: Latitude {lat}, Longitude {lon}")
-                    continue
+            if element.get("type") == "way":
+                buildings[element["id"]] = element
 
-    polygon = [(x[1], x[0]) for x in node_coordinates.values()]
-    if len(polygon) < 3:
+    return buildings
+
+
+def download_buildings_within(west: float, south: float, east: float, north: float) -> Optional[dict[int, dict]]:
+    """Download the tags and full geometry of all the buildings within the bounds, with a single Overpass query
+
+    Returns:
+        Optional[dict[int, dict]]: The way of each building keyed by ID, like `download_buildings`, or None if
+            the download failed
+    """
+    index = osm_index()
+    if index is not None:
+        return index.buildings_within(west, south, east, north)
+
+    overpass_query = f"""
+    [out:json];
+    (
+      way["building"]({south},{west},{north},{east});
+    );
+    out tags geom;
+    """
+
+    # Send the Overpass query to the Overpass API
+    data = osm_client().overpass(overpass_query)
+
+    if data is None:
+        print(f"Error: Failed to download buildings within {west, south, east, north}")
         return None
+
+    return {element["id"]: element for element in data["elements"] if element.get("type") == "way"}
+
+
+def way_polygon(way: dict) -> Optional[Polygon]:
+    """Build the polygon of a way downloaded with its geometry, or None if it has fewer than 3 nodes"""
+    coordinates = [(node["lon"], node["lat"]) for node in way.get("geometry", []) if node is not None]
+    if len(coordinates) < 3:
+        return None
+    return Polygon(coordinates)
+
+
+def match_buildings(
+    buildings: dict[int, dict], longitudes: np.ndarray, latitudes: np.ndarray, max_distance: float = NEAREST_BUILDING_DISTANCE
+) -> np.ndarray:
+    """Find the building that each coordinate is in, or else the nearest building within `max_distance` meters
+
+    Like `find_nearest_building`, only buildings of the `NEAREST_BUILDING_TYPES` are matched.
+
+    Args:
+        buildings (dict[int, dict]): Ways with their geometry keyed by ID, see `download_buildings_within`
+        longitudes (np.ndarray): Longitude of each coordinate
+        latitudes (np.ndarray): Latitude of each coordinate
+        max_distance (float, optional): Maximum distance in meters to the nearest building. Defaults to 50.
+
+    Returns:
+        np.ndarray: The ID of each coordinate's building, or -1 if it doesn't have one
+    """
+    matched = np.full(len(longitudes), -1, dtype=np.int64)
+    ways = [way for way in buildings.values() if way.get("tags", {}).get("building", "") in NEAREST_BUILDING_TYPES]
+    polygons = [(way["id"], polygon) for way in ways if (polygon := way_polygon(way)) is not None]
+    if not polygons or len(longitudes) == 0:
+        return matched
+
+    # measure distances in meters in the local UTM zone
+    points = GeoSeries(points_from_xy(longitudes, latitudes), crs="epsg:4326")
+    west, south, east, north = points.total_bounds
+    crs = utm_crs((west + east) / 2, (south + north) / 2)
+    footprints = GeoSeries([polygon for _, polygon in polygons], crs="epsg:4326").to_crs(crs)
+
+    # a coordinate within a building is at a distance of 0 from it, so it matches that building
+    point_positions, footprint_positions = footprints.sindex.nearest(points.to_crs(crs), max_distance=max_distance)
+    candidate_ids = np.array([building_id for building_id, _ in polygons], dtype=np.int64)[footprint_positions]
+
+    # keep the lowest ID of the buildings that are tied for the nearest, e.g. overlapping buildings
+    order = np.lexsort((candidate_ids, point_positions))
+    point_positions, candidate_ids = point_positions[order], candidate_ids[order]
+    first = np.unique(point_positions, return_index=True)[1]
+    matched[point_positions[first]] = candidate_ids[first]
+    return matched
+
+
+def find_buildings_in_bulk(geodataframe: GeoDataFrame, method: str) -> tuple[list[dict], list, dict[int, dict], list[str]]:
+    """Find the building of each row of a dataframe, downloading the buildings of each area at once instead of row by row
+
+    The rows are grouped by the zoom `OSM_AREA_ZOOM` tile of their coordinate. All the buildings within each tile (and
+    within `NEAREST_BUILDING_DISTANCE` of it) are downloaded with a single query, so the number of queries grows with
+    the number of areas rather than rows. Each row is then matched locally, see `match_buildings`.
+
+    Args:
+        geodataframe (GeoDataFrame): Dataframe to find the buildings of.
+        method (str): 'geometry_centroid' or 'lat_long', see `process_dataframe_for_osm_buildings`.
+
+    Returns:
+        tuple[list[dict], list, dict[int, dict], list[str]]: The result and row of each row that has a building, the
+            ways of those buildings keyed by ID, and the errors of the rows that don't
+    """
+    if method == "geometry_centroid":
+        centroids = geodataframe.geometry.centroid
+        longitudes, latitudes = centroids.x.to_numpy(), centroids.y.to_numpy()
     else:
-        return Polygon(polygon)
+        longitudes = geodataframe["longitude"].to_numpy(dtype=float)
+        latitudes = geodataframe["latitude"].to_numpy(dtype=float)
+
+    building_ids = np.full(len(geodataframe), -1, dtype=np.int64)
+    failed = np.zeros(len(geodataframe), dtype=bool)
+    buildings = {}
+    areas = plan_quadkeys(quadkeys(longitudes, latitudes, OSM_AREA_ZOOM))
+    print(f"Downloading the buildings of {len(areas)} areas for {len(geodataframe)} rows")
+    for area, positions in areas:
+        # extend the area so that rows near its edges can match the buildings across them
+        west, south, east, north = quadkey_bounds(area, OSM_AREA_ZOOM)
+        west, south = search_bounds(west, south, NEAREST_BUILDING_DISTANCE)[:2]
+        east, north = search_bounds(east, north, NEAREST_BUILDING_DISTANCE)[2:]
+        area_buildings = download_buildings_within(west, south, east, north)
+        if area_buildings is None:
+            failed[positions] = True
+            continue
+
+        building_ids[positions] = match_buildings(area_buildings, longitudes[positions], latitudes[positions])
+        # only keep the buildings that were matched, rather than every building of every area
+        for building_id in np.unique(building_ids[positions]).tolist():
+            if building_id != -1:
+                buildings[building_id] = area_buildings[building_id]
+
+    results = []
+    rows = []
+    error_processing = []
+    for position, (lat, lon, building_id) in enumerate(zip(latitudes.tolist(), longitudes.tolist(), building_ids.tolist())):
+        if failed[position]:
+            error_processing.append(f"Error: Failed to download buildings for row: {lat, lon}")
+        elif building_id == -1:
+            error_processing.append(f"No building found for row: {lat, lon}")
+        else:
+            row = geodataframe.iloc[position]
+            results.append({"lat": lat, "lon": lon, "osm_type": "way", "osm_id": building_id, "orig_row_id": row["id"]})
+            rows.append(row)
+
+    return results, rows, buildings, error_processing
 
 
 def neighboring_buildings(location):
     """This doesn't appear to work, yet...."""
-    geolocator = Nominatim(user_agent="CBL-neighbors")
     # Extract address information from the location
     address = location.get("address")
 
@@ -165,7 +353,7 @@ def neighboring_buildings(location):
 
     # Perform a search query to find neighboring buildings
     print(f"Searching for neighbors to {query}")
-    search_results = geolocator.geocode(query, exactly_one=False)
+    search_results = osm_client().search(query)
 
     if not search_results:
         print("No neighboring buildings found.")
@@ -173,7 +361,8 @@ def neighboring_buildings(location):
     # search by lat long
     query = f"{location.get('lat')},{location.get('lon')}"
     print(f"Searching by {query}")
-    search_results = geolocator.reverse((), language="en", exactly_one=False)
+    result = osm_client().reverse(float(location.get("lat")), float(location.get("lon")))
+    search_results = [result] if result is not None else []
     if not search_results:
         return "No neighboring buildings found based on lat/long."
 
@@ -182,30 +371,31 @@ def neighboring_buildings(location):
         return "nothing found"
     else:
         # round new neighbors
-        buildings = [result.address for result in search_results if "building" in result.raw.get("type", "")]
+        buildings = [result["display_name"] for result in search_results if "building" in result.get("type", "")]
         return buildings
 
 
 def find_nearest_building(lat, lon):
     """Return the nearest feature of type way and tags with building"""
-    overpass_query = f"""
-    [out:json];
-    (
-      way(around:50,{lat},{lon});  // radius (50 meters)
-    );
-    out;
-    """
+    index = osm_index()
+    if index is not None:
+        data = {"elements": index.buildings_near(lat, lon)}
+    else:
+        overpass_query = f"""
+        [out:json];
+        (
+          way(around:{NEAREST_BUILDING_DISTANCE},{lat},{lon});
+        );
+        out;
+        """
 
-    # Send the Overpass query to the Overpass API
-    response = requests.post(OVERPASS_URL, data=overpass_query)
+        # Send the Overpass query to the Overpass API
+        data = osm_client().overpass(overpass_query)
 
-    if response.status_code != 200:
-        print(response.text)
+    if data is None:
         print("Error: Failed to retrieve data from Overpass API.")
         return
 
-    data = response.json()
-
     # Check if any elements of the specified type were found
     if "elements" in data and len(data["elements"]) > 0:
         # this list is already sorted by closest
@@ -218,7 +408,7 @@ def find_nearest_building(lat, lon):
             if element["type"] != "way":
                 continue
 
-            if element.get("tags", {}).get("building", "") not in ["yes", "retail"]:
+            if element.get("tags", {}).get("building", "") not in NEAREST_BUILDING_TYPES:
                 continue
 
             return element
@@ -229,7 +419,7 @@ def find_nearest_building(lat, lon):
 
 
 def process_dataframe_for_osm_buildings(
-    geodataframe: GeoDataFrame, method: str = "geometry_centroid", copy_source_columns: bool = False
+    geodataframe: GeoDataFrame, method: str = "geometry_centroid", copy_source_columns: bool = False, bulk: bool = False
 ) -> list[list, list]:
     """Process a dataframe that has a geometry column and return a list of nearest OSM buildings
     along with polygons of the building footprints.
@@ -243,10 +433,18 @@ def process_dataframe_for_osm_buildings(
     3. 'lat_long': Find the nearest building by a known latitude and longitude.  Data must be in
        the 'latitude', and 'longitude' column of the passed GeoDataFrame.
 
+    When a local index of an OpenStreetMap extract is set with `utils.osm_index.set_osm_index`, the buildings are
+    looked up in the index instead of with Nominatim and Overpass, and the results don't have address fields.
+
+    With `bulk`, the 'geometry_centroid' and 'lat_long' methods download all the buildings of each area at once and
+    match the rows to them locally, instead of looking up each row with Nominatim and Overpass (see
+    `find_buildings_in_bulk`). The results don't have address fields, and rows without a building are only errors.
+
     Args:
         geodataframe (GeoDataFrame): Dataframe to process and add results to.
         method (str, optional): Which field contains the geo data. Defaults to 'geometry_centoid'.
         copy_source_columns (bool, optional): Copy the source columns to the result. Defaults to False.
+        bulk (bool, optional): Find the buildings of whole areas at once. Defaults to False.
 
     Returns:
         list[list, list]: The results in a dictionary format and a list of errors that occurred during processing.
@@ -257,23 +455,34 @@ def process_dataframe_for_osm_buildings(
         raise ValueError(f"Invalid processing method: {method}, must be one of ['geometry_centroid', 'osm_id', 'lat_long']")
 
     results = []
+    rows = []
     error_processing = []
-    for _index, row in geodataframe.iterrows():
-        result = None
-        if method in ["geometry_centroid", "lat_long"]:
-            if method == "geometry_centroid":
-                lat = row["geometry"].centroid.y
-                lon = row["geometry"].centroid.x
-            elif method == "lat_long":
-                lat = row["latitude"]
-                lon = row["longitude"]
-
-            result = reverse_geocode(lat, lon)
-
-            if result:
+    if bulk and method in ["geometry_centroid", "lat_long"]:
+        results, rows, buildings, error_processing = find_buildings_in_bulk(geodataframe, method)
+    else:
+        for _index, row in geodataframe.iterrows():
+            result = None
+            if method in ["geometry_centroid", "lat_long"]:
+                if method == "geometry_centroid":
+                    lat = row["geometry"].centroid.y
+                    lon = row["geometry"].centroid.x
+                elif method == "lat_long":
+                    lat = row["latitude"]
+                    lon = row["longitude"]
+
+                if osm_index() is not None:
+                    # the local index doesn't have addresses, so go straight to the nearest building
+                    result = {"lat": lat, "lon": lon}
+                else:
+                    result = reverse_geocode(lat, lon)
+
+                if result is None:
+                    # the reverse geocoding failed, keep the row with only its coordinates, like rows without a building
+                    error_processing.append(f"Error: Failed to reverse geocode row: {lat, lon}")
+                    result = {"lat": lat, "lon": lon}
                 # the info about the location is good, now check if the place/osm_id and see if it
                 # is a way (building) or a node (point of interest), we only want buildings
-                if result.get("osm_type") != "way":
+                elif result.get("osm_type") != "way":
                     # Find the nearest feature of the specified type from the specified coordinates
                     result_to_add = find_nearest_building(lat, lon)
                     if result_to_add is not None:
@@ -286,32 +495,40 @@ def process_dataframe_for_osm_buildings(
                 # add in the originating row_id into the result so that we can match it up later
                 result["orig_row_id"] = row["id"]
 
-        elif method == "osm_id":
-            result = {}
-            result["osm_id"] = row["osm_id"]
-            result["orig_row_id"] = row["id"]
+            elif method == "osm_id":
+                result = {}
+                result["osm_id"] = row["osm_id"]
+                result["orig_row_id"] = row["id"]
+
+            results.append(result)
+            rows.append(row)
+
+        # download all the buildings at once, with one request for each batch of buildings
+        print(f"Downloading {len(results)} buildings")
+        # rows without a building only have their coordinates
+        buildings = download_buildings([int(result["osm_id"]) for result in results if "osm_id" in result])
 
-        print(f"Looking for building id for row: {result['orig_row_id']}")
-        building_id = get_building_id_from_osm_id(result["osm_id"])
+    for result, row in zip(results, rows):
+        osm_id = int(result["osm_id"]) if "osm_id" in result else None
+        if osm_id not in buildings:
+            building_id = "Building ID not found for the given place ID."
+        elif buildings[osm_id] is None:
+            building_id = "Error: Failed to retrieve building ID."
+        else:
+            building_id = osm_id
         # save osm_building_id to the dataframe
         result["osm_building_id"] = building_id
         result["osm_building_id_url"] = f"https://www.openstreetmap.org/way/{building_id}"
 
         if isinstance(building_id, int):
-            # get the nodes/coordinates for the building
-            print("Downloading building nodes for building_id:", building_id)
-            building, nodes = download_building_and_nodes_by_id(building_id)
-            if nodes is not None:
-                polygon = get_node_coordinates(nodes)
-
-                if polygon is not None:
-                    # convert to a polygon object
-                    result["osm_polygon"] = polygon
+            building = buildings[building_id]
+            polygon = way_polygon(building)
+            if polygon is not None:
+                result["osm_polygon"] = polygon
 
             # save the other building information of interest, that lives in the tags elements
-            if len(building["elements"]) > 0 and "tags" in building["elements"][0]:
-                for key in building["elements"][0]["tags"]:
-                    result[key] = building["elements"][0]["tags"][key]
+            for key in building.get("tags", {}):
+                result[key] = building["tags"][key]
 
         # Save all the other fields in the dataframe to the result, if the fields are not
         # yet in the result.
@@ -322,8 +539,6 @@ def process_dataframe_for_osm_buildings(
                     print(f"Adding {key} to the result which is {result}")
                     result[key] = row[key]
 
-        results.append(result)
-
     # pull out the columns in the results to useful fields
     for result in results:
         # convert boundingbox to polygon and save into results
@@ -364,7 +579,8 @@ def process_dataframe_for_osm_buildings(
             del result["address"]
 
         # force osm_id to be an integer
-        result["osm_id"] = int(result["osm_id"])
+        if "osm_id" in result:
+            result["osm_id"] = int(result["osm_id"])
 
         # convert type to unknown if it is a 'yes' -- type is the "building type", sometimes
         if result.get("type", None) == "yes":
@@ -0,0 +1,174 @@
+# !/usr/bin/env python
+"""
+SEED Platform (TM), Copyright (c) Alliance for Sustainable Energy, LLC, and other contributors.
+See also https://github.com/SEED-platform/seed/blob/main/LICENSE.md
+"""
+
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from utils.manifest import DEFAULT_TTL
+from utils.metrics import metrics
+from utils.rate_limiter import RateLimiter
+
+NOMINATIM_URL = "https://nominatim.openstreetmap.org/reverse"
+NOMINATIM_SEARCH_URL = "https://nominatim.openstreetmap.org/search"
+OVERPASS_URL = "http://overpass-api.de/api/interpreter"
+USER_AGENT = "CBL"
+
+# Nominatim's usage policy allows at most 1 request per second, and the public Overpass instance allows a
+# couple of concurrent queries per user
+DEFAULT_REQUESTS_PER_SECOND = {"nominatim": 1, "overpass": 1}
+MAX_ATTEMPTS = 5
+BACKOFF_FACTOR = 1
+TIMEOUT = 60
+
+
+class ResponseCache:
+    """SQLite cache of OpenStreetMap API responses, keyed by service and query
+
+    Args:
+        path (Path, optional): SQLite database. Defaults to "data/osm-cache.sqlite".
+        ttl (Optional[float], optional): Seconds before a cached response expires, None to never expire. Defaults to 1 week.
+    """
+
+    def __init__(self, path: Path = Path("data/osm-cache.sqlite"), ttl: Optional[float] = DEFAULT_TTL):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses (service TEXT, query TEXT, response TEXT, created REAL, PRIMARY KEY (service, query))"
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def get(self, service: str, query: str) -> Optional[dict]:
+        """Return the cached response of a query, or None if it's missing or expired"""
+        oldest = time.time() - self.ttl if self.ttl is not None else float("-inf")
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT response FROM responses WHERE service = ? AND query = ? AND created >= ?", (service, query, oldest)
+            ).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def set(self, service: str, query: str, response: dict):
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)", (service, query, json.dumps(response), time.time())
+            )
+
+
+class OSMClient:
+    """Client for the Nominatim and Overpass APIs, shared by all the OpenStreetMap requests of a process, see `osm_client`
+
+    Requests to each service are rate limited across all threads, reuse a pooled session with a timeout, and
+    are retried with backoff when the service is busy. Successful responses are cached, so repeating the
+    same queries (e.g. re-running `process_dataframe_for_osm_buildings`) doesn't make any requests.
+
+    Args:
+        cache (Optional[ResponseCache], optional): Cache of the responses, None to not cache them. Defaults to None.
+        requests_per_second (dict[str, float], optional): Rate limit of each service. Defaults to `DEFAULT_REQUESTS_PER_SECOND`.
+        timeout (float, optional): Seconds to wait for each response. Defaults to 60.
+    """
+
+    def __init__(
+        self,
+        cache: Optional[ResponseCache] = None,
+        requests_per_second: dict[str, float] = DEFAULT_REQUESTS_PER_SECOND,
+        timeout: float = TIMEOUT,
+    ):
+        self.cache = cache
+        self.timeout = timeout
+        self.rate_limiters = {service: RateLimiter(rate) for service, rate in requests_per_second.items()}
+
+        self.session = requests.Session()
+        self.session.headers["User-Agent"] = USER_AGENT
+        # Overpass queries are read-only, so POST requests are safe to retry too
+        retry = Retry(total=MAX_ATTEMPTS, backoff_factor=BACKOFF_FACTOR, status_forcelist=[429, 500, 502, 503, 504], allowed_methods=None)
+        adapter = HTTPAdapter(max_retries=retry)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def close(self):
+        self.session.close()
+        if self.cache is not None:
+            self.cache.close()
+
+    def _request(self, service: str, query: str, method: str, url: str, **kwargs) -> Optional[dict]:
+        if self.cache is not None:
+            cached = self.cache.get(service, query)
+            if cached is not None:
+                metrics.count("osm_cache_hits")
+                return cached
+            metrics.count("osm_cache_misses")
+
+        self.rate_limiters[service].acquire()
+        try:
+            response = self.session.request(method, url, timeout=self.timeout, **kwargs)
+        except (requests.exceptions.RetryError, requests.ConnectionError, requests.Timeout) as e:
+            print(f"Error: {service} is unavailable: {e}")
+            return None
+        metrics.count_response(response)
+
+        if response.status_code != 200:
+            print(f"Error: {service} responded with {response.status_code}: {response.text}")
+            return None
+
+        data = response.json()
+        if self.cache is not None:
+            self.cache.set(service, query, data)
+        return data
+
+    def reverse(self, lat: float, lon: float) -> Optional[dict]:
+        """Reverse geocode a coordinate with Nominatim, returning the raw result, or None if nothing was found"""
+        params = {"lat": f"{lat:.7f}", "lon": f"{lon:.7f}", "format": "json", "addressdetails": 1, "accept-language": "en"}
+        data = self._request("nominatim", f"reverse {params['lat']},{params['lon']}", "GET", NOMINATIM_URL, params=params)
+        if data is None or "error" in data:
+            return None
+        return data
+
+    def search(self, query: str) -> Optional[list[dict]]:
+        """Geocode a free-form query with Nominatim, returning the raw results, best first, or None if the request failed"""
+        params = {"q": query, "format": "json", "addressdetails": 1, "accept-language": "en"}
+        return self._request("nominatim", f"search {query}", "GET", NOMINATIM_SEARCH_URL, params=params)
+
+    def overpass(self, query: str) -> Optional[dict]:
+        """Run an Overpass query, returning its json response, or None if it failed"""
+        # the same query with different formatting has the same response
+        return self._request("overpass", " ".join(query.split()), "POST", OVERPASS_URL, data=query)
+
+
+# The client of this process, created the first time it's used
+_shared: dict[str, Optional[OSMClient]] = {"client": None}
+_client_lock = threading.Lock()
+
+
+def osm_client() -> OSMClient:
+    """Return the client shared by all the OpenStreetMap requests of this process, which caches responses in "data/osm-cache.sqlite" """
+    with _client_lock:
+        if _shared["client"] is None:
+            _shared["client"] = OSMClient(ResponseCache())
+        return _shared["client"]
+
+
+def set_osm_client(client: Optional[OSMClient]):
+    """Replace the shared client, e.g. with a different cache or rate limits, or None to create the default one on next use"""
+    with _client_lock:
+        _shared["client"] = client
@@ -0,0 +1,163 @@
+# !/usr/bin/env python
+"""
+SEED Platform (TM), Copyright (c) Alliance for Sustainable Energy, LLC, and other contributors.
+See also https://github.com/SEED-platform/seed/blob/main/LICENSE.md
+"""
+
+import json
+import os
+import re
+import threading
+from pathlib import Path
+from typing import Optional
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pyogrio
+import shapely
+
+from utils.chunk import chunk
+from utils.metrics import metrics
+from utils.quadkey_helpers import search_bounds, utm_crs
+
+# Layer of the OSM driver with closed ways (and multipolygon relations) as polygons, and the layer of the index
+EXTRACT_LAYER = "multipolygons"
+INDEX_LAYER = "buildings"
+
+# Columns of the extract's layer that aren't tags
+NON_TAG_COLUMNS = ["osm_id", "osm_way_id", "other_tags", "geometry"]
+
+# Radius (in meters) of the nearest building search, the same as the Overpass `around` query of `find_nearest_building`
+DEFAULT_NEAREST_DISTANCE = 50
+
+# Number of buildings to look up by ID in each query
+LOOKUP_BATCH_SIZE = 1_000
+
+OTHER_TAG = re.compile(r'"((?:[^"\\]|\\.)*)"=>"((?:[^"\\]|\\.)*)"')
+
+
+def parse_other_tags(other_tags: Optional[str]) -> dict[str, str]:
+    """Parse the `"key"=>"value",...` tags that GDAL doesn't have a column for"""
+    if not other_tags:
+        return {}
+    return {
+        key.replace('\\"', '"').replace("\\\\", "\\"): value.replace('\\"', '"').replace("\\\\", "\\")
+        for key, value in OTHER_TAG.findall(other_tags)
+    }
+
+
+def build_osm_building_index(extract_file: Path, index_file: Path):
+    """Index the building ways of an OpenStreetMap extract (.osm.pbf or .osm) by way ID and location
+
+    The index is a GeoPackage with the ID of each way as its feature ID, its tags as json, and its polygon,
+    with an R-tree of the polygons. Buildings mapped as multipolygon relations aren't indexed, since
+    the workflow only looks up ways. All the buildings of the extract are read into memory to index them.
+    """
+    buildings = pyogrio.read_dataframe(extract_file, layer=EXTRACT_LAYER, where="building IS NOT NULL AND osm_way_id IS NOT NULL")
+    tag_columns = [column for column in buildings.columns if column not in NON_TAG_COLUMNS]
+    tags = [
+        json.dumps({key: value for key, value in zip(tag_columns, values) if pd.notna(value)} | parse_other_tags(other_tags))
+        for *values, other_tags in buildings[[*tag_columns, "other_tags"]].itertuples(index=False, name=None)
+    ]
+    # a closed way is a multipolygon with a single polygon
+    polygons = np.array([geometry.geoms[0] for geometry in buildings.geometry], dtype=object)
+    index = gpd.GeoDataFrame(
+        {"osm_id": buildings["osm_way_id"].astype("int64"), "tags": tags}, geometry=polygons, crs=buildings.crs or "epsg:4326"
+    )
+
+    temp_file = index_file.with_name(f"{index_file.name}.tmp")
+    temp_file.unlink(missing_ok=True)
+    pyogrio.write_dataframe(index, temp_file, layer=INDEX_LAYER, driver="GPKG", layer_options={"FID": "osm_id"})
+    os.replace(temp_file, index_file)
+
+
+class OSMBuildingIndex:
+    """Looks up OpenStreetMap buildings offline in an index of a regional extract, see `build_osm_building_index`
+
+    The index is built the first time each version of `extract_file` is used. Buildings are returned as
+    Overpass ways with their `tags`, `center`, and the coordinates of their nodes in `geometry`, but without
+    the IDs of their nodes. Once it's set with `set_osm_index`, the functions of `utils.open_street_map`
+    that look up buildings use the index instead of the Overpass API.
+
+    Args:
+        extract_file (Path): OpenStreetMap extract, e.g. from https://download.geofabrik.de
+        index_file (Optional[Path], optional): GeoPackage index of the buildings. Defaults to `extract_file` with a .gpkg suffix.
+    """
+
+    def __init__(self, extract_file: Path, index_file: Optional[Path] = None):
+        self.index_file = index_file or extract_file.with_suffix(".gpkg")
+        if not self.index_file.exists() or self.index_file.stat().st_mtime_ns < extract_file.stat().st_mtime_ns:
+            print(f"Indexing {extract_file}")
+            with metrics.stage("build_osm_index"):
+                build_osm_building_index(extract_file, self.index_file)
+
+    def _read(self, **kwargs) -> gpd.GeoDataFrame:
+        return pyogrio.read_dataframe(self.index_file, layer=INDEX_LAYER, fid_as_index=True, **kwargs)
+
+    @staticmethod
+    def _ways(buildings: gpd.GeoDataFrame) -> list[dict]:
+        bounds = buildings.geometry.bounds.to_numpy().tolist()
+        ways = []
+        for osm_id, tags, polygon, (west, south, east, north) in zip(
+            buildings.index.tolist(), buildings["tags"], buildings.geometry, bounds
+        ):
+            ways.append(
+                {
+                    "type": "way",
+                    "id": osm_id,
+                    "center": {"lat": (south + north) / 2, "lon": (west + east) / 2},
+                    "tags": json.loads(tags),
+                    "geometry": [{"lat": latitude, "lon": longitude} for longitude, latitude in polygon.exterior.coords],
+                }
+            )
+        return ways
+
+    def buildings(self, building_ids: list[int]) -> dict[int, dict]:
+        """Look up the buildings by way ID, like `download_buildings`. Buildings that aren't in the index are missing."""
+        buildings = {}
+        with metrics.stage("osm_index_lookup") as stage:
+            for batch in chunk(list(dict.fromkeys(int(building_id) for building_id in building_ids)), LOOKUP_BATCH_SIZE):
+                found = self._read(where=f"osm_id IN ({','.join(str(building_id) for building_id in batch)})")
+                buildings.update((way["id"], way) for way in self._ways(found))
+            stage.items = len(buildings)
+        return buildings
+
+    def buildings_within(self, west: float, south: float, east: float, north: float) -> dict[int, dict]:
+        """Look up the buildings within the bounds, like `download_buildings_within`"""
+        with metrics.stage("osm_index_lookup") as stage:
+            ways = self._ways(self._read(bbox=(west, south, east, north)))
+            stage.items = len(ways)
+        return {way["id"]: way for way in ways}
+
+    def buildings_near(self, lat: float, lon: float, distance: float = DEFAULT_NEAREST_DISTANCE) -> list[dict]:
+        """Find the buildings within `distance` meters of a coordinate, closest first, like the Overpass `around` query"""
+        with metrics.stage("osm_index_lookup", items=1):
+            candidates = self._read(bbox=search_bounds(lon, lat, distance))
+            if len(candidates) == 0:
+                return []
+
+            # measure distances in meters in the local UTM zone
+            crs = utm_crs(lon, lat)
+            point = gpd.GeoSeries([shapely.Point(lon, lat)], crs="epsg:4326").to_crs(crs).iloc[0]
+            distances = shapely.distance(candidates.geometry.to_crs(crs).to_numpy(), point)
+            order = np.argsort(distances, kind="stable")
+            nearby = candidates.iloc[order[distances[order] <= distance]]
+            return self._ways(nearby)
+
+
+# The index used by the OpenStreetMap lookups of this process, if any
+_shared: dict[str, Optional[OSMBuildingIndex]] = {"index": None}
+_index_lock = threading.Lock()
+
+
+def osm_index() -> Optional[OSMBuildingIndex]:
+    """Return the index used instead of the Overpass API, or None to use the Overpass API"""
+    with _index_lock:
+        return _shared["index"]
+
+
+def set_osm_index(index: Optional[OSMBuildingIndex]):
+    """Look up buildings in a local index instead of the Overpass API, or go back to the Overpass API with None"""
+    with _index_lock:
+        _shared["index"] = index
@@ -0,0 +1,386 @@
+# !/usr/bin/env python
+"""
+SEED Platform (TM), Copyright (c) Alliance for Sustainable Energy, LLC, and other contributors.
+See also https://github.com/SEED-platform/seed/blob/main/LICENSE.md
+"""
+
+import json
+import os
+import shutil
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+import pyogrio
+import shapely
+from geopandas import GeoDataFrame
+
+from utils.ubid import ubid_geometries
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    # Without pyarrow only the text formats can be written
+    pa = None
+    pq = None
+
+# Formats that the covered building list can be written in
+SUPPORTED_OUTPUT_FORMATS = ["csv", "geojson", "parquet", "fgb"]
+
+# Columns of the covered buildings with the geocoded coordinates, which are rounded like the geometries
+COORDINATE_COLUMNS = ["latitude", "longitude"]
+
+# Line that ends the header, and starts the features, of a GeoJSON file written by GDAL
+GDAL_FEATURES_START = '"features": [\n'
+
+# GeoParquet metadata of a WKB geometry column in longitude/latitude (the default CRS of GeoParquet)
+GEOPARQUET_METADATA = {
+    "version": "1.0.0",
+    "primary_column": "geometry",
+    "columns": {"geometry": {"encoding": "WKB", "geometry_types": []}},
+}
+
+
+def round_coordinates(geometries: np.ndarray, precision: int) -> np.ndarray:
+    """Round the coordinates of geometries to `precision` decimal places"""
+    return shapely.transform(geometries, lambda coordinates: np.round(coordinates, precision))
+
+
+class CsvWriter:
+    """Appends each batch of rows to a csv file as it is processed, writing the header with the first batch"""
+
+    def __init__(self, path: Path, columns: list[str], precision: Optional[int] = None):
+        self.columns = columns
+        self.precision = precision
+        self.file = open(path, "w", newline="", encoding="utf-8")
+        self.header = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def write(self, gdf: GeoDataFrame):
+        if self.precision is not None:
+            gdf = pd.DataFrame(gdf)
+            gdf["geometry"] = shapely.to_wkt(gdf["geometry"].to_numpy(), rounding_precision=self.precision)
+        gdf.to_csv(self.file, columns=self.columns, header=self.header, index=False)
+        self.header = False
+
+    def close(self):
+        if self.header:
+            self.file.write(",".join(self.columns) + "\n")
+        self.file.close()
+
+
+class GeoJSONWriter:
+    """Appends each batch of features to a GeoJSON file as it is processed
+
+    Each batch is written by GDAL's GeoJSON driver, so the file is formatted the same as `GeoDataFrame.to_file`.
+    The file is only valid GeoJSON once the writer is closed.
+    """
+
+    def __init__(self, path: Path, precision: Optional[int] = None):
+        self.path = path
+        self.precision = precision
+        self.batch_file = path.with_name(f"{path.name}.batch")
+        self.file = open(path, "w", encoding="utf-8")
+        self.features = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _write_header(self, header: list[str]):
+        # GDAL names the collection after the file it wrote
+        name_line = f'"name": "{self.path.stem}",\n'
+        self.file.writelines(name_line if line.startswith('"name": ') else line for line in header)
+
+    def write(self, gdf: GeoDataFrame):
+        if len(gdf) == 0:
+            return
+
+        options = {"COORDINATE_PRECISION": self.precision} if self.precision is not None else {}
+        gdf.to_file(self.batch_file, driver="GeoJSON", **options)
+        with open(self.batch_file, encoding="utf-8") as f:
+            lines = f.readlines()
+        self.batch_file.unlink()
+
+        start = lines.index(GDAL_FEATURES_START) + 1
+        if self.features == 0:
+            self._write_header(lines[:start])
+        else:
+            self.file.write(",\n")
+
+        # the last two lines close the features and the collection
+        features = lines[start:-2]
+        features[-1] = features[-1].rstrip("\n")
+        self.file.writelines(features)
+        self.features += len(features)
+
+    def close(self):
+        if self.features == 0:
+            self._write_header(["{\n", '"type": "FeatureCollection",\n', '"name": "",\n', GDAL_FEATURES_START])
+        self.file.write("\n]\n}\n")
+        self.file.close()
+
+
+class LayeredGeoJSONWriter:
+    """Writes a GeoJSON feature collection made of several layers, each batch adding features to each layer
+
+    Features are appended to a separate file for each layer as they are processed, and the layers
+    are joined in order into one collection when the writer is closed. The collection is formatted the
+    same as `GeoDataFrame.to_json(drop_id=True, na="drop")`.
+    """
+
+    def __init__(self, path: Path, layers: list[str], precision: Optional[int] = None):
+        self.path = path
+        self.precision = precision
+        self.layer_files = {layer: path.with_name(f"{path.name}.{i}.part") for i, layer in enumerate(layers)}
+        self.files = {layer: open(layer_file, "w", encoding="utf-8") for layer, layer_file in self.layer_files.items()}
+        self.features = dict.fromkeys(layers, 0)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def write(self, layer: str, gdf: GeoDataFrame):
+        if self.precision is not None:
+            gdf = gdf.set_geometry(round_coordinates(gdf.geometry.to_numpy(), self.precision))
+        f = self.files[layer]
+        for feature in gdf.iterfeatures(na="drop", drop_id=True):
+            if self.features[layer]:
+                f.write(", ")
+            f.write(json.dumps(feature))
+            self.features[layer] += 1
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+
+        temp_file = self.path.with_name(f"{self.path.name}.tmp")
+        with open(temp_file, "w", encoding="utf-8") as f:
+            f.write('{"type": "FeatureCollection", "features": [')
+            written = False
+            for layer, layer_file in self.layer_files.items():
+                if self.features[layer] == 0:
+                    continue
+                if written:
+                    f.write(", ")
+                with open(layer_file, encoding="utf-8") as layer_f:
+                    shutil.copyfileobj(layer_f, f)
+                written = True
+            f.write("]}")
+
+        for layer_file in self.layer_files.values():
+            layer_file.unlink()
+        os.replace(temp_file, self.path)
+
+
+class GeoParquetWriter:
+    """Appends each batch of rows to a GeoParquet file as a row group
+
+    Columns in `float_columns` are stored as doubles, the geometry as WKB, and the other columns as strings,
+    so that every batch has the same schema. The file is moved into place once the writer is closed.
+    """
+
+    def __init__(self, path: Path, columns: list[str], float_columns: list[str] = []):
+        if pa is None:
+            raise ImportError("pyarrow is required to write GeoParquet and FlatGeobuf")
+
+        self.path = path
+        self.temp_file = path.with_name(f"{path.name}.tmp")
+        self.columns = [column for column in columns if column != "geometry"]
+        self.float_columns = set(float_columns)
+        fields = [pa.field(column, pa.float64() if column in self.float_columns else pa.string()) for column in self.columns]
+        self.schema = pa.schema(
+            [*fields, pa.field("geometry", pa.binary())],
+            metadata={"geo": json.dumps(GEOPARQUET_METADATA)},
+        )
+        self.writer = pq.ParquetWriter(self.temp_file, self.schema)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def write(self, gdf: GeoDataFrame):
+        if len(gdf) == 0:
+            return
+
+        arrays = []
+        for column in self.columns:
+            if column in self.float_columns:
+                arrays.append(pa.array(pd.to_numeric(gdf[column], errors="coerce").to_numpy(dtype=float), from_pandas=True))
+            else:
+                arrays.append(pa.array([None if pd.isna(value) else str(value) for value in gdf[column]], type=pa.string()))
+        arrays.append(pa.array(shapely.to_wkb(gdf["geometry"].to_numpy()), type=pa.binary()))
+        self.writer.write_table(pa.Table.from_arrays(arrays, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+        os.replace(self.temp_file, self.path)
+
+
+def _has_missing_geometries(parquet_file) -> bool:
+    column = parquet_file.schema_arrow.get_field_index("geometry")
+    for row_group in range(parquet_file.num_row_groups):
+        # the row group statistics count the missing geometries without reading them
+        statistics = parquet_file.metadata.row_group(row_group).column(column).statistics
+        if statistics is not None and statistics.has_null_count:
+            missing = statistics.null_count
+        else:
+            missing = parquet_file.read_row_group(row_group, columns=["geometry"]).column(0).null_count
+        if missing:
+            return True
+    return False
+
+
+class FlatGeobufWriter:
+    """Writes each batch of rows to a FlatGeobuf file
+
+    FlatGeobuf files can't be appended to efficiently, since their spatial index covers every feature, so
+    batches are appended to a GeoParquet file first, which is streamed into the FlatGeobuf file once the
+    writer is closed. The spatial index can't contain missing geometries (e.g. addresses without a
+    matching footprint), so files with any are written without one.
+    """
+
+    def __init__(self, path: Path, columns: list[str], float_columns: list[str] = []):
+        self.path = path
+        self.parquet_file = path.with_name(f"{path.name}.parquet")
+        self.parquet_writer = GeoParquetWriter(self.parquet_file, columns, float_columns)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def write(self, gdf: GeoDataFrame):
+        self.parquet_writer.write(gdf)
+
+    def close(self):
+        self.parquet_writer.close()
+
+        parquet_file = pq.ParquetFile(self.parquet_file)
+        batches = pa.RecordBatchReader.from_batches(parquet_file.schema_arrow, parquet_file.iter_batches())
+        # GDAL writes FlatGeobuf to a directory unless the path has the .fgb suffix
+        temp_file = self.path.with_name(f"{self.path.stem}.tmp{self.path.suffix}")
+        pyogrio.write_arrow(
+            batches,
+            temp_file,
+            driver="FlatGeobuf",
+            geometry_name="geometry",
+            geometry_type="Unknown",
+            crs="EPSG:4326",
+            layer_options={"SPATIAL_INDEX": "NO" if _has_missing_geometries(parquet_file) else "YES"},
+        )
+        parquet_file.close()
+        self.parquet_file.unlink()
+        os.replace(temp_file, self.path)
+
+
+class CoveredBuildingsWriter:
+    """Writes each batch of covered buildings, and their UBID bounding boxes and centroids, in each of `formats`
+
+    The csv and GeoJSON outputs are written as `{name}.csv`, `{name}.geojson`, and `{name}-ubid.geojson`
+    (with 3 layers: UBID bounding boxes, footprints, then UBID centroids). The binary outputs are
+    written as `{name}.{format}`, `{name}-ubid-bounding-boxes.{format}`, and `{name}-ubid-centroids.{format}`.
+
+    Args:
+        directory (Path): Directory of the outputs
+        name (str): Name of the outputs
+        columns (list[str]): Columns of the covered buildings, including `address`, `ubid`, and `geometry`
+        float_columns (list[str]): Numeric columns, for the binary formats
+        formats (list[str], optional): Any of `SUPPORTED_OUTPUT_FORMATS`. Defaults to csv and GeoJSON.
+        precision (Optional[int], optional): Decimal places of the coordinates in the text formats, of both the
+            geometries and the `COORDINATE_COLUMNS`. Defaults to full precision.
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        name: str,
+        columns: list[str],
+        float_columns: list[str],
+        *,
+        formats: list[str] = ["csv", "geojson"],
+        precision: Optional[int] = None,
+    ):
+        self.columns = columns
+        self.precision = precision
+        self.text_writers = []
+        self.building_writers = []
+        self.ubid_writers = []
+        if "csv" in formats:
+            self.text_writers.append(CsvWriter(directory / f"{name}.csv", columns, precision))
+        if "geojson" in formats:
+            self.text_writers.append(GeoJSONWriter(directory / f"{name}.geojson", precision))
+            self.layered_writer = LayeredGeoJSONWriter(
+                directory / f"{name}-ubid.geojson", ["bounding_boxes", "footprints", "centroids"], precision
+            )
+        else:
+            self.layered_writer = None
+
+        binary_writers = {"parquet": GeoParquetWriter, "fgb": FlatGeobufWriter}
+        ubid_columns = ["address", "ubid", "geometry"]
+        for output_format, writer in binary_writers.items():
+            if output_format in formats:
+                self.building_writers.append(writer(directory / f"{name}.{output_format}", columns, float_columns))
+                self.ubid_writers.append(
+                    (
+                        writer(directory / f"{name}-ubid-bounding-boxes.{output_format}", ubid_columns),
+                        writer(directory / f"{name}-ubid-centroids.{output_format}", ubid_columns),
+                    )
+                )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def write(self, data: list[dict]):
+        gdf = GeoDataFrame(data=data, columns=self.columns)
+        for writer in self.building_writers:
+            writer.write(gdf)
+
+        text_gdf = gdf
+        if self.precision is not None:
+            text_gdf = gdf.assign(
+                **{column: pd.to_numeric(gdf[column]).round(self.precision) for column in COORDINATE_COLUMNS if column in gdf}
+            )
+        for writer in self.text_writers:
+            writer.write(text_gdf)
+
+        # decode the UBIDs once for every output
+        with_ubid = [datum for datum in data if datum["ubid"]]
+        addresses = [datum["address"] for datum in with_ubid]
+        ubids = [datum["ubid"] for datum in with_ubid]
+        ubid_bounding_boxes, ubid_centroids = ubid_geometries(ubids)
+
+        if self.layered_writer is not None:
+            self.layered_writer.write(
+                "bounding_boxes", GeoDataFrame(data={"UBID Bounding Box": addresses, "geometry": ubid_bounding_boxes})
+            )
+            self.layered_writer.write("footprints", text_gdf)
+            self.layered_writer.write("centroids", GeoDataFrame(data={"UBID Centroid": addresses, "geometry": ubid_centroids}))
+
+        for bounding_box_writer, centroid_writer in self.ubid_writers:
+            bounding_box_writer.write(GeoDataFrame(data={"address": addresses, "ubid": ubids, "geometry": ubid_bounding_boxes}))
+            centroid_writer.write(GeoDataFrame(data={"address": addresses, "ubid": ubids, "geometry": ubid_centroids}))
+
+    def close(self):
+        writers = [*self.text_writers, *self.building_writers, *(writer for writers in self.ubid_writers for writer in writers)]
+        if self.layered_writer is not None:
+            writers.append(self.layered_writer)
+        for writer in writers:
+            writer.close()
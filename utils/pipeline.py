@@ -0,0 +1,213 @@
+# !/usr/bin/env python
+"""
+SEED Platform (TM), Copyright (c) Alliance for Sustainable Energy, LLC, and other contributors.
+See also https://github.com/SEED-platform/seed/blob/main/LICENSE.md
+"""
+
+import pickle
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable, Optional
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+
+from utils.checkpoint import Checkpoint
+from utils.common import Location
+from utils.delta_store import DeltaStore, address_hash
+from utils.geocode_addresses import Geocoder, geocode_addresses
+from utils.geocode_cache import GeocodeCache
+from utils.manifest import DEFAULT_TTL
+from utils.match_footprints import DEFAULT_MAX_DISTANCE, match_footprints
+from utils.metrics import metrics
+from utils.normalize_address import normalize_addresses
+from utils.quadkey_helpers import quadkeys, quadkeys_near
+from utils.tile_planner import DEFAULT_MAX_SHARD_SIZE, QuadkeyCache, plan_quadkeys, plan_shards
+from utils.ubid import encode_ubids
+from utils.update_quadkeys import DEFAULT_MAX_WORKERS, update_quadkeys
+
+# Fields added to each result by matching, which are empty for results that couldn't be matched
+UNMATCHED_FIELDS = ["footprint_match", "geometry", "height", "proximity_to_geocoding_coord", "ubid"]
+
+# State of a match worker process, i.e. its loaded quadkeys, see `_init_match_worker`
+_worker_state: dict[str, QuadkeyCache] = {}
+
+
+def _init_match_worker(max_loaded_quadkeys: int, load: Callable[[int], Optional[gpd.GeoDataFrame]]):
+    _worker_state["footprint_cache"] = QuadkeyCache(max_loaded_quadkeys, load)
+
+
+def _match_points(
+    quadkey: int,
+    longitudes: np.ndarray,
+    latitudes: np.ndarray,
+    load_footprints: Callable[[int], Optional[gpd.GeoDataFrame]],
+    max_distance: float,
+) -> tuple[pd.DataFrame, np.ndarray]:
+    """Match points within a quadkey to footprints, and determine the UBIDs of the matched footprints"""
+    points = gpd.GeoDataFrame(crs="epsg:4326", geometry=gpd.points_from_xy(longitudes, latitudes))
+
+    # matches have `footprint_match`, `geometry`, `height`, and `proximity_to_geocoding_coord`
+    with metrics.stage("match_footprints", len(points)):
+        matches = match_footprints(points, quadkey, load_footprints, max_distance)
+
+    # Determine UBIDs from footprints, all matches of the quadkey at once
+    with metrics.stage("encode_ubids", len(matches)):
+        ubids = encode_ubids(matches["geometry"].to_numpy())
+    return matches, ubids
+
+
+def _match_shard(quadkey: int, longitudes: np.ndarray, latitudes: np.ndarray, max_distance: float) -> tuple[pd.DataFrame, np.ndarray]:
+    return _match_points(quadkey, longitudes, latitudes, _worker_state["footprint_cache"], max_distance)
+
+
+def process_batches(
+    batches: Iterable[list[Location]],
+    geocoder: Geocoder,
+    *,
+    cache: Optional[GeocodeCache] = None,
+    footprint_cache: Optional[QuadkeyCache] = None,
+    max_distance: float = DEFAULT_MAX_DISTANCE,
+    normalize_workers: Optional[int] = None,
+    download_workers: int = DEFAULT_MAX_WORKERS,
+    download_ttl: float = DEFAULT_TTL,
+    checkpoint: Optional[Checkpoint] = None,
+    delta: Optional[DeltaStore] = None,
+    match_workers: int = 1,
+    max_shard_size: int = DEFAULT_MAX_SHARD_SIZE,
+) -> Iterator[list[dict]]:
+    """Normalize, geocode, match footprints, and generate UBIDs for each batch of locations
+
+    Batches are processed one at a time as they are consumed, so only the current batch and the
+    loaded quadkeys are in memory. Each batch yields its geocoding results, in the same order as its
+    locations, with `footprint_match`, `geometry`, `height`, `proximity_to_geocoding_coord`, and `ubid`.
+    With a `checkpoint`, the results of each stage of each batch are saved, and stages that were
+    already saved are loaded instead of being run again. With a `delta` store, only the addresses
+    without a previous result are geocoded and matched, and the results are saved to the store.
+    With more than one of `match_workers`, points are matched on a pool of processes, in shards of at
+    most `max_shard_size` points of the same quadkey. Each worker loads the footprints with the `load`
+    function of `footprint_cache`, which must be picklable (e.g. a module-level function, or a
+    `functools.partial` of one) to be sent to the workers.
+    The quadkey dataset links must be downloaded first, see `update_dataset_links`.
+    """
+    # the loaded quadkeys are shared between batches, since consecutive batches are often nearby
+    footprint_cache = footprint_cache or QuadkeyCache()
+
+    # the normalize workers only start with the first batch large enough to be normalized in parallel
+    normalize_executor = None
+    if normalize_workers != 1:
+        normalize_executor = ProcessPoolExecutor(max_workers=normalize_workers)
+
+    # each worker process loads its own quadkeys the same way, so it keeps its own cache with the same loader
+    executor = None
+    if match_workers > 1:
+        try:
+            pickle.dumps(footprint_cache.load)
+        except (pickle.PicklingError, AttributeError, TypeError) as e:
+            raise ValueError("The footprint_cache loader must be picklable to match with more than one of match_workers") from e
+        executor = ProcessPoolExecutor(
+            max_workers=match_workers, initializer=_init_match_worker, initargs=(footprint_cache.max_quadkeys, footprint_cache.load)
+        )
+
+    try:
+        for batch, locations in enumerate(batches):
+            streets = checkpoint.load(batch, "normalized") if checkpoint is not None else None
+            if streets is None:
+                with metrics.stage("normalize", len(locations)):
+                    streets = normalize_addresses([loc["street"] for loc in locations], normalize_workers, normalize_executor)
+                if checkpoint is not None:
+                    checkpoint.save(batch, "normalized", streets)
+            for loc, street in zip(locations, streets):
+                loc["street"] = street
+
+            # Only process the addresses that changed since the previous run
+            if delta is not None:
+                keys = [address_hash(loc) for loc in locations]
+                previous = delta.get_many(keys)
+                changed = [i for i, result in enumerate(previous) if result is None]
+                metrics.count("delta_hits", len(locations) - len(changed))
+                metrics.count("delta_misses", len(changed))
+            else:
+                changed = list(range(len(locations)))
+
+            matched = checkpoint.load(batch, "matched") if checkpoint is not None else None
+            if matched is not None:
+                yield matched
+                continue
+
+            if not changed:
+                yield previous
+                continue
+
+            data = checkpoint.load(batch, "geocoded") if checkpoint is not None else None
+            if data is None:
+                with metrics.stage("geocode", len(changed)):
+                    data = geocode_addresses([locations[i] for i in changed], cache=cache, geocoder=geocoder)
+                if checkpoint is not None:
+                    checkpoint.save(batch, "geocoded", data)
+
+            # Results without coordinates ("Not Found", "Ambiguous", or low quality) keep their quality and are left unmatched
+            located = [i for i, datum in enumerate(data) if datum.get("longitude") is not None and datum.get("latitude") is not None]
+            for datum in data:
+                for field in UNMATCHED_FIELDS:
+                    datum.setdefault(field, None)
+            longitudes = np.array([data[i]["longitude"] for i in located], dtype=float)
+            latitudes = np.array([data[i]["latitude"] for i in located], dtype=float)
+
+            # Find all quadkeys that the coordinates fall within, and the neighboring quadkeys within the search distance
+            assigned = checkpoint.load(batch, "quadkeys") if checkpoint is not None else None
+            if assigned is None:
+                point_quadkeys = quadkeys(longitudes, latitudes)
+                unique_quadkeys = np.unique(point_quadkeys)
+                neighboring_quadkeys = np.setdiff1d(quadkeys_near(longitudes, latitudes, max_distance), unique_quadkeys)
+
+                # Download quadkeys, neighboring quadkeys may not have any footprints
+                with metrics.stage("download_quadkeys", len(unique_quadkeys) + len(neighboring_quadkeys)):
+                    update_quadkeys(unique_quadkeys.tolist(), max_workers=download_workers, ttl=download_ttl)
+                    update_quadkeys(neighboring_quadkeys.tolist(), skip_missing=True, max_workers=download_workers, ttl=download_ttl)
+                if checkpoint is not None:
+                    checkpoint.save(batch, "quadkeys", point_quadkeys.tolist())
+            else:
+                # the quadkeys of the batch were already downloaded
+                point_quadkeys = np.array(assigned, dtype=np.int64)
+
+            with metrics.stage("match", len(located)):
+                if executor is None:
+                    # Loop quadkeys in order and match all of their properties at once, only keeping a few quadkeys loaded at a time
+                    shards = (
+                        (positions, _match_points(quadkey, longitudes[positions], latitudes[positions], footprint_cache, max_distance))
+                        for quadkey, positions in plan_quadkeys(point_quadkeys)
+                    )
+                else:
+                    # Hand out the largest shards first, and gather the results as they finish
+                    futures = {
+                        executor.submit(_match_shard, quadkey, longitudes[positions], latitudes[positions], max_distance): positions
+                        for quadkey, positions in plan_shards(point_quadkeys, max_shard_size)
+                    }
+                    shards = ((futures[future], future.result()) for future in as_completed(futures))
+
+                for positions, (matches, ubids) in shards:
+                    for i, match, ubid in zip(positions, matches.itertuples(index=False), ubids):
+                        datum = data[located[i]]
+                        datum["footprint_match"] = match.footprint_match
+                        datum["geometry"] = match.geometry
+                        datum["height"] = match.height
+                        datum["proximity_to_geocoding_coord"] = match.proximity_to_geocoding_coord
+                        datum["ubid"] = ubid
+
+            if delta is not None:
+                delta.set_many([keys[i] for i in changed], data)
+                for i, datum in zip(changed, data):
+                    previous[i] = datum
+                data = previous
+
+            if checkpoint is not None:
+                checkpoint.save(batch, "matched", data)
+
+            yield data
+    finally:
+        if normalize_executor is not None:
+            normalize_executor.shutdown(cancel_futures=True)
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
@@ -0,0 +1,70 @@
+# !/usr/bin/env python
+"""
+SEED Platform (TM), Copyright (c) Alliance for Sustainable Energy, LLC, and other contributors.
+See also https://github.com/SEED-platform/seed/blob/main/LICENSE.md
+"""
+
+import mercantile
+import numpy as np
+
+# Zoom level of the Microsoft Building Footprints quadkeys
+QUADKEY_ZOOM = 9
+
+# Length of the shortest degree of latitude, which keeps search areas from being too small
+METERS_PER_DEGREE = 110_574
+
+
+def quadkeys(longitudes: np.ndarray, latitudes: np.ndarray, zoom: int = QUADKEY_ZOOM) -> np.ndarray:
+    """Vectorized equivalent of `int(mercantile.quadkey(mercantile.tile(longitude, latitude, zoom)))`"""
+    longitudes = np.asarray(longitudes, dtype=float)
+    latitudes = np.asarray(latitudes, dtype=float)
+    tiles = 2**zoom
+
+    # same projection, rounding, and clamping as `mercantile.tile`
+    x = longitudes / 360.0 + 0.5
+    sin_latitude = np.sin(np.radians(latitudes))
+    with np.errstate(divide="ignore"):
+        y = 0.5 - 0.25 * np.log((1.0 + sin_latitude) / (1.0 - sin_latitude)) / np.pi
+    tile_x = np.clip(np.floor((x + mercantile.EPSILON) * tiles), 0, tiles - 1).astype(np.int64)
+    tile_y = np.clip(np.floor((y + mercantile.EPSILON) * tiles), 0, tiles - 1).astype(np.int64)
+
+    # interleave the bits of x and y into base 4 digits, which are stored as a base 10 integer
+    result = np.zeros(len(longitudes), dtype=np.int64)
+    for level in range(zoom - 1, -1, -1):
+        digit = ((tile_x >> level) & 1) + 2 * ((tile_y >> level) & 1)
+        result = result * 10 + digit
+    return result
+
+
+def quadkeys_near(longitudes: np.ndarray, latitudes: np.ndarray, distance: float) -> np.ndarray:
+    """Return the unique quadkeys within `distance` meters of any of the coordinates
+
+    Search distances are much smaller than a quadkey, so the quadkeys of the corners of the search bounds cover them all.
+    """
+    west, south, east, north = search_bounds(np.asarray(longitudes, dtype=float), np.asarray(latitudes, dtype=float), distance)
+    return np.unique(np.concatenate([quadkeys(west, south), quadkeys(west, north), quadkeys(east, south), quadkeys(east, north)]))
+
+
+def quadkey_bounds(quadkey: int, zoom: int = QUADKEY_ZOOM) -> mercantile.LngLatBbox:
+    # quadkeys are stored as integers, so restore any leading zeros that were dropped
+    return mercantile.bounds(mercantile.quadkey_to_tile(str(quadkey).zfill(zoom)))
+
+
+def search_bounds(longitude, latitude, distance: float):
+    """Return the (west, south, east, north) bounds in degrees that contain every point within `distance` meters
+
+    Works on scalars or numpy arrays of coordinates.
+    """
+    latitude_delta = distance / METERS_PER_DEGREE
+    longitude_delta = distance / (METERS_PER_DEGREE * np.cos(np.radians(np.minimum(np.abs(latitude) + latitude_delta, 89.9))))
+    return longitude - longitude_delta, latitude - latitude_delta, longitude + longitude_delta, latitude + latitude_delta
+
+
+def quadkeys_within(west: float, south: float, east: float, north: float) -> list[int]:
+    return [int(mercantile.quadkey(tile)) for tile in mercantile.tiles(west, south, east, north, zooms=QUADKEY_ZOOM)]
+
+
+def utm_crs(longitude: float, latitude: float) -> str:
+    """Return the WGS 84 UTM zone of a coordinate, which is much faster than `estimate_utm_crs` for small areas"""
+    zone = min(int((longitude + 180) // 6) + 1, 60)
+    return f"EPSG:{(32600 if latitude >= 0 else 32700) + zone}"
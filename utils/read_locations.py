@@ -0,0 +1,58 @@
+# !/usr/bin/env python
+"""
+SEED Platform (TM), Copyright (c) Alliance for Sustainable Energy, LLC, and other contributors.
+See also https://github.com/SEED-platform/seed/blob/main/LICENSE.md
+"""
+
+import csv
+import json
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+from typing import Optional
+
+from utils.common import Location
+
+# File suffixes of newline-delimited JSON, with one location per line
+NDJSON_SUFFIXES = [".ndjson", ".jsonl"]
+
+
+def _batched(locations: Iterable[Location], batch_size: Optional[int]) -> Iterator[list[Location]]:
+    batch = []
+    for location in locations:
+        batch.append(location)
+        if batch_size is not None and len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _iter_ndjson(locations_file: Path) -> Iterator[Location]:
+    with open(locations_file, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def _iter_csv(locations_file: Path) -> Iterator[Location]:
+    with open(locations_file, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            yield {"street": row["street"], "city": row["city"], "state": row["state"]}
+
+
+def read_locations(locations_file: Path, batch_size: Optional[int] = None) -> Iterator[list[Location]]:
+    """Read locations in batches of `batch_size`, or all at once if `batch_size` is None
+
+    NDJSON (.ndjson or .jsonl) and csv files (with `street`, `city`, and `state` columns) are streamed,
+    so only one batch is in memory at a time. Any other file is read as a JSON list of locations.
+    """
+    suffix = locations_file.suffix.lower()
+    if suffix in NDJSON_SUFFIXES:
+        locations = _iter_ndjson(locations_file)
+    elif suffix == ".csv":
+        locations = _iter_csv(locations_file)
+    else:
+        with open(locations_file) as f:
+            locations = json.load(f)
+
+    yield from _batched(locations, batch_size)
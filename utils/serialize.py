@@ -0,0 +1,37 @@
+# !/usr/bin/env python
+"""
+SEED Platform (TM), Copyright (c) Alliance for Sustainable Energy, LLC, and other contributors.
+See also https://github.com/SEED-platform/seed/blob/main/LICENSE.md
+"""
+
+import json
+from typing import Any
+
+import numpy as np
+import shapely
+from shapely.geometry.base import BaseGeometry
+
+
+def _encode(value: Any) -> Any:
+    # geometries are stored as WKB so their coordinates are restored exactly
+    if isinstance(value, BaseGeometry):
+        return {"wkb": shapely.to_wkb(value, hex=True)}
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _decode(value: dict) -> Any:
+    if value.keys() == {"wkb"}:
+        return shapely.from_wkb(value["wkb"])
+    return value
+
+
+def dumps(results: Any) -> str:
+    """Serialize results, including their geometries, to JSON"""
+    return json.dumps(results, default=_encode)
+
+
+def loads(text: str) -> Any:
+    """Deserialize results serialized by `dumps`"""
+    return json.loads(text, object_hook=_decode)
@@ -5,15 +5,88 @@ See also https://github.com/SEED-platform/seed/blob/main/LICENSE.md
 """
 
 import os
+from collections import deque
+from collections.abc import Iterator
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+from pathlib import Path
 
 import geopandas as gpd
+import pyogrio
 from pyproj import CRS
 
+from utils.output_writers import FlatGeobufWriter, GeoJSONWriter, GeoParquetWriter
 from utils.ubid import add_ubid_to_geodataframe
 
+# Formats that a shapefile can be converted to
+SHAPEFILE_OUTPUT_FORMATS = ["geojson", "parquet", "fgb"]
+
+# Number of features that are read, reprojected, and given UBIDs at a time
+DEFAULT_CHUNK_SIZE = 100_000
+
+
+def _convert_chunk(shapefile: str, rows: slice) -> gpd.GeoDataFrame:
+    """Read a window of features, reproject them to longitude/latitude, and add their UBIDs"""
+    gdf = gpd.read_file(shapefile, rows=rows).to_crs(CRS.from_epsg(4326))
+    return add_ubid_to_geodataframe(gdf, additional_ubid_columns_to_create=[])
+
+
+def _convert_chunks(shapefile: str, windows: list[slice], max_workers: int) -> Iterator[gpd.GeoDataFrame]:
+    """Convert each window of features in order, with up to 2 chunks per worker being converted or waiting to be written"""
+    if max_workers <= 1:
+        for rows in windows:
+            yield _convert_chunk(shapefile, rows)
+        return
+
+    executor = ProcessPoolExecutor(max_workers=max_workers)
+    try:
+        pending = deque()
+        for rows in windows:
+            pending.append(executor.submit(_convert_chunk, shapefile, rows))
+            if len(pending) >= 2 * max_workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        executor.shutdown(cancel_futures=True)
+
+
+def shp_to_geojson(shapefile: str, formats: list[str] = ["geojson"], chunk_size: int = DEFAULT_CHUNK_SIZE, max_workers: int = 1):
+    """Convert a shapefile to longitude/latitude, with the UBID of each feature, as `{name}.geojson` next to it
+
+    The features are converted in chunks of `chunk_size`, which are read, reprojected, and given UBIDs on a
+    pool of `max_workers` processes, and appended to the outputs in order, so only a few chunks are in memory
+    at once. The GeoJSON output is formatted the same as `GeoDataFrame.to_file`.
+
+    Args:
+        shapefile (str): Shapefile to convert
+        formats (list[str], optional): Any of `SHAPEFILE_OUTPUT_FORMATS`, written as `{name}.{format}`. Defaults to GeoJSON.
+        chunk_size (int, optional): Number of features in each chunk. Defaults to 100,000.
+        max_workers (int, optional): Number of processes converting chunks, 1 to convert them in this process. Defaults to 1.
+    """
+    for output_format in formats:
+        if output_format not in SHAPEFILE_OUTPUT_FORMATS:
+            raise ValueError(f"Invalid output format: {output_format}, must be one of {SHAPEFILE_OUTPUT_FORMATS}")
 
-def shp_to_geojson(shapefile: str):
     file_name, _ext = os.path.splitext(shapefile)
-    gdf = gpd.read_file(shapefile).to_crs(CRS.from_epsg(4326))
-    (add_ubid_to_geodataframe(gdf, additional_ubid_columns_to_create=[])
-     .to_file(f"{file_name}.geojson", driver='GeoJSON'))
+    info = pyogrio.read_info(shapefile)
+    columns = [*info["fields"], "ubid", "geometry"]
+    # the binary formats store numeric fields as doubles, and the others as strings
+    float_columns = [field for field, dtype in zip(info["fields"], info["dtypes"]) if dtype.startswith(("int", "float"))]
+    windows = [slice(start, start + chunk_size) for start in range(0, info["features"], chunk_size)]
+
+    with ExitStack() as stack:
+        writers = []
+        for output_format in formats:
+            path = Path(f"{file_name}.{output_format}")
+            if output_format == "geojson":
+                writers.append(stack.enter_context(GeoJSONWriter(path)))
+            elif output_format == "parquet":
+                writers.append(stack.enter_context(GeoParquetWriter(path, columns, float_columns)))
+            else:
+                writers.append(stack.enter_context(FlatGeobufWriter(path, columns, float_columns)))
+
+        for converted, gdf in enumerate(_convert_chunks(shapefile, windows, max_workers), start=1):
+            for writer in writers:
+                writer.write(gdf)
+            print(f"Converted {min(converted * chunk_size, info['features'])} of {info['features']} features")
@@ -0,0 +1,89 @@
+# !/usr/bin/env python
+"""
+SEED Platform (TM), Copyright (c) Alliance for Sustainable Energy, LLC, and other contributors.
+See also https://github.com/SEED-platform/seed/blob/main/LICENSE.md
+"""
+
+from collections import OrderedDict
+from typing import Callable, Optional
+
+import numpy as np
+from geopandas import GeoDataFrame
+
+from utils.load_quadkey import load_quadkey
+from utils.metrics import metrics
+
+# Number of quadkeys to keep loaded at once, enough for a quadkey and its neighbors at a corner
+DEFAULT_MAX_LOADED_QUADKEYS = 4
+
+# Maximum number of points that a matching worker processes at once
+DEFAULT_MAX_SHARD_SIZE = 5_000
+
+
+class QuadkeyCache:
+    """Loads quadkey footprints on demand, keeping only the `max_quadkeys` most recently used quadkeys in memory"""
+
+    def __init__(
+        self,
+        max_quadkeys: int = DEFAULT_MAX_LOADED_QUADKEYS,
+        load: Callable[[int], Optional[GeoDataFrame]] = load_quadkey,
+    ):
+        self.max_quadkeys = max(max_quadkeys, 1)
+        self.load = load
+        self.loaded: OrderedDict[int, Optional[GeoDataFrame]] = OrderedDict()
+
+    def __call__(self, quadkey: int) -> Optional[GeoDataFrame]:
+        if quadkey in self.loaded:
+            metrics.count("quadkey_cache_hits")
+            self.loaded.move_to_end(quadkey)
+            return self.loaded[quadkey]
+
+        metrics.count("quadkey_cache_misses")
+        footprints = self.load(quadkey)
+        self.loaded[quadkey] = footprints
+
+        # evict the least recently used quadkeys
+        while len(self.loaded) > self.max_quadkeys:
+            self.loaded.popitem(last=False)
+
+        return footprints
+
+
+def plan_quadkeys(quadkeys: np.ndarray) -> list[tuple[int, np.ndarray]]:
+    """Group the positions of the points by quadkey
+
+    Quadkeys are sorted numerically, which follows a Z-order curve, so neighboring quadkeys are usually
+    processed close together while they are still loaded. Positions are kept in their original order
+    within each quadkey so results can be written back to the input order.
+
+    Args:
+        quadkeys (np.ndarray): Quadkey of each point
+
+    Returns:
+        list[tuple[int, np.ndarray]]: Each quadkey with the positions of its points
+    """
+    order = np.argsort(quadkeys, kind="stable")
+    unique_quadkeys, starts = np.unique(quadkeys[order], return_index=True)
+    return [(int(quadkey), positions) for quadkey, positions in zip(unique_quadkeys, np.split(order, starts[1:]))]
+
+
+def plan_shards(quadkeys: np.ndarray, max_shard_size: int = DEFAULT_MAX_SHARD_SIZE) -> list[tuple[int, np.ndarray]]:
+    """Group the positions of the points by quadkey, like `plan_quadkeys`, into shards for parallel workers
+
+    Quadkeys with more than `max_shard_size` points are split into several shards, and shards are
+    ordered from largest to smallest, so that a dense quadkey (e.g. a city center) is shared by several
+    workers and is started first instead of leaving the other workers idle at the end.
+
+    Args:
+        quadkeys (np.ndarray): Quadkey of each point
+        max_shard_size (int, optional): Maximum number of points in each shard. Defaults to 5,000.
+
+    Returns:
+        list[tuple[int, np.ndarray]]: Each shard's quadkey with the positions of its points
+    """
+    shards = [
+        (quadkey, shard)
+        for quadkey, positions in plan_quadkeys(quadkeys)
+        for shard in np.array_split(positions, -(-len(positions) // max_shard_size))
+    ]
+    return sorted(shards, key=lambda shard: len(shard[1]), reverse=True)
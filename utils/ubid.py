@@ -4,11 +4,21 @@ SEED Platform (TM), Copyright (c) Alliance for Sustainable Energy, LLC, and othe
 See also https://github.com/SEED-platform/seed/blob/main/LICENSE.md
 """
 
+import numpy as np
+import pandas as pd
+import shapely
 from buildingid.code import decode, encode
 from geopandas import GeoDataFrame
+from openlocationcode import openlocationcode as olc
 from openlocationcode.openlocationcode import PAIR_CODE_LENGTH_
 from shapely.geometry import Point, Polygon
 
+OLC_ALPHABET = np.frombuffer(olc.CODE_ALPHABET_.encode(), dtype=np.uint8)
+
+# Value of each character of an Open Location Code, -1 for characters that aren't digits
+OLC_DIGITS = np.full(256, -1)
+OLC_DIGITS[OLC_ALPHABET] = np.arange(len(OLC_ALPHABET))
+
 
 def encode_ubid(geometry: Polygon, code_length: int = PAIR_CODE_LENGTH_) -> str:
     min_longitude, min_latitude, max_longitude, max_latitude = geometry.bounds
@@ -17,6 +27,237 @@ def encode_ubid(geometry: Polygon, code_length: int = PAIR_CODE_LENGTH_) -> str:
     return ubid
 
 
+def _round_to_int(values: np.ndarray) -> np.ndarray:
+    """Vectorized `int(round(value, 6))` of non-negative values
+
+    Values so close to an integer that numpy and Python could round them differently use Python's rounding.
+    """
+    result = np.floor(np.round(values, 6)).astype(np.int64)
+    close = np.abs(values - np.rint(values)) < 1e-5
+    result[close] = [int(round(float(value), 6)) for value in values[close]]
+    return result
+
+
+def _olc_values(latitudes: np.ndarray, longitudes: np.ndarray, code_length: int) -> tuple[np.ndarray, np.ndarray]:
+    """Integer latitude and longitude values at the finest precision, computed the same way as `openlocationcode.encode`"""
+    latitudes = np.clip(latitudes, -olc.LATITUDE_MAX_, olc.LATITUDE_MAX_)
+    out_of_range = (longitudes < -olc.LONGITUDE_MAX_) | (longitudes >= olc.LONGITUDE_MAX_)
+    longitudes = np.where(out_of_range, np.mod(longitudes + olc.LONGITUDE_MAX_, 360) - olc.LONGITUDE_MAX_, longitudes)
+
+    # Latitude 90 needs to be adjusted to be just less, so the returned code can also be decoded
+    latitudes = np.where(latitudes == olc.LATITUDE_MAX_, latitudes - olc.computeLatitudePrecision(code_length), latitudes)
+
+    return (
+        _round_to_int((latitudes + olc.LATITUDE_MAX_) * olc.FINAL_LAT_PRECISION_),
+        _round_to_int((longitudes + olc.LONGITUDE_MAX_) * olc.FINAL_LNG_PRECISION_),
+    )
+
+
+def _olc_cells(latitude_values: np.ndarray, longitude_values: np.ndarray, code_length: int) -> tuple[np.ndarray, np.ndarray]:
+    """Latitude and longitude indices of the code areas of length `code_length` that contain the values"""
+    if code_length > PAIR_CODE_LENGTH_:
+        latitude_size = olc.GRID_ROWS_ ** (olc.MAX_DIGIT_COUNT_ - code_length)
+        longitude_size = olc.GRID_COLUMNS_ ** (olc.MAX_DIGIT_COUNT_ - code_length)
+    else:
+        pair_size = olc.ENCODING_BASE_ ** ((PAIR_CODE_LENGTH_ - code_length) // 2)
+        latitude_size = olc.GRID_ROWS_**olc.GRID_CODE_LENGTH_ * pair_size
+        longitude_size = olc.GRID_COLUMNS_**olc.GRID_CODE_LENGTH_ * pair_size
+    return latitude_values // latitude_size, longitude_values // longitude_size
+
+
+def _olc_codes(latitude_values: np.ndarray, longitude_values: np.ndarray, code_length: int) -> np.ndarray:
+    """Vectorized `openlocationcode.encode` from the values of `_olc_values`"""
+    latitude_values = latitude_values.copy()
+    longitude_values = longitude_values.copy()
+
+    # Digits of the grid section, then of the pair section, from the least significant
+    digits = []
+    for _ in range(olc.GRID_CODE_LENGTH_):
+        digits.append((latitude_values % olc.GRID_ROWS_) * olc.GRID_COLUMNS_ + longitude_values % olc.GRID_COLUMNS_)
+        latitude_values //= olc.GRID_ROWS_
+        longitude_values //= olc.GRID_COLUMNS_
+    for _ in range(PAIR_CODE_LENGTH_ // 2):
+        digits.append(longitude_values % olc.ENCODING_BASE_)
+        digits.append(latitude_values % olc.ENCODING_BASE_)
+        latitude_values //= olc.ENCODING_BASE_
+        longitude_values //= olc.ENCODING_BASE_
+    characters = OLC_ALPHABET[np.column_stack(digits[::-1])[:, :code_length]]
+
+    # Add the separator, padding short codes
+    width = max(code_length, olc.SEPARATOR_POSITION_) + 1
+    codes = np.full((len(characters), width), ord(olc.PADDING_CHARACTER_), dtype=np.uint8)
+    codes[:, : min(code_length, olc.SEPARATOR_POSITION_)] = characters[:, : olc.SEPARATOR_POSITION_]
+    codes[:, olc.SEPARATOR_POSITION_] = ord(olc.SEPARATOR_)
+    codes[:, olc.SEPARATOR_POSITION_ + 1 :] = characters[:, olc.SEPARATOR_POSITION_ :]
+    return np.ascontiguousarray(codes).view(f"S{width}").ravel().astype(str)
+
+
+def encode_ubids(geometries, code_length: int = PAIR_CODE_LENGTH_) -> np.ndarray:
+    """Vectorized `encode_ubid` of an array of geometries
+
+    Bounds and centroids are computed for all geometries at once, and the Open Location Codes are
+    computed with integer array math, so the UBIDs are identical to those of `buildingid.code.encode`.
+    Missing or empty geometries have a UBID of None. Raises a ValueError for geometries that reach longitude 180.
+    """
+    geometries = np.asarray(geometries, dtype=object)
+    ubids = np.full(len(geometries), None, dtype=object)
+    valid = ~(shapely.is_missing(geometries) | shapely.is_empty(geometries))
+    if not valid.any():
+        return ubids
+
+    code_length = min(code_length, olc.MAX_DIGIT_COUNT_)
+    bounds = shapely.bounds(geometries[valid])
+    centroids = shapely.centroid(geometries[valid])
+
+    center_latitudes, center_longitudes = _olc_values(shapely.get_y(centroids), shapely.get_x(centroids), code_length)
+    south, west = _olc_cells(*_olc_values(bounds[:, 1], bounds[:, 0], code_length), code_length)
+    north, east = _olc_cells(*_olc_values(bounds[:, 3], bounds[:, 2], code_length), code_length)
+    center_latitude_cells, center_longitude_cells = _olc_cells(center_latitudes, center_longitudes, code_length)
+
+    # The extents are the number of code areas between the center and each edge
+    extents = np.column_stack(
+        (north - center_latitude_cells, east - center_longitude_cells, center_latitude_cells - south, center_longitude_cells - west)
+    )
+    # longitude 180 wraps around to -180, so geometries that reach it can't be encoded, as with `buildingid.code.encode`
+    if (extents < 0).any():
+        raise ValueError("Invalid geometry, its UBID has a negative extent")
+
+    codes = _olc_codes(center_latitudes, center_longitudes, code_length)
+    ubids[valid] = [
+        f"{code}-{count_north}-{count_east}-{count_south}-{count_west}"
+        for code, (count_north, count_east, count_south, count_west) in zip(codes, extents.tolist())
+    ]
+    return ubids
+
+
+def _round_14(values: np.ndarray) -> np.ndarray:
+    """`round(value, 14)` of each value, which `openlocationcode.decode` applies to its coordinates"""
+    return np.array([round(value, 14) for value in values.tolist()], dtype=float)
+
+
+def _decode_olc_digits(digits: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Vectorized `openlocationcode.decode` of codes with the same number of digits (without separator or padding)
+
+    Returns the latitude lo, longitude lo, latitude hi, and longitude hi of each code area.
+    """
+    digit_count = min(digits.shape[1], olc.MAX_DIGIT_COUNT_)
+    pair_count = min(digit_count, PAIR_CODE_LENGTH_) // 2
+
+    # the integer values are exact, so they are the same as the sums in `openlocationcode.decode`
+    pair_place_values = olc.ENCODING_BASE_ ** np.arange(PAIR_CODE_LENGTH_ // 2 - 1, PAIR_CODE_LENGTH_ // 2 - 1 - pair_count, -1)
+    normal_latitudes = -olc.LATITUDE_MAX_ * olc.PAIR_PRECISION_ + digits[:, 0 : 2 * pair_count : 2] @ pair_place_values
+    normal_longitudes = -olc.LONGITUDE_MAX_ * olc.PAIR_PRECISION_ + digits[:, 1 : 2 * pair_count : 2] @ pair_place_values
+    latitude_precision = longitude_precision = float(pair_place_values[-1]) / olc.PAIR_PRECISION_
+
+    grid_latitudes = grid_longitudes = np.zeros(len(digits), dtype=np.int64)
+    if digit_count > PAIR_CODE_LENGTH_:
+        grid_digits = digits[:, PAIR_CODE_LENGTH_:digit_count]
+        # each grid digit is a row and a column, with place values in base GRID_ROWS_ and GRID_COLUMNS_
+        exponents = np.arange(olc.GRID_CODE_LENGTH_ - 1, olc.GRID_CODE_LENGTH_ - 1 - grid_digits.shape[1], -1)
+        row_place_values = olc.GRID_ROWS_**exponents
+        column_place_values = olc.GRID_COLUMNS_**exponents
+        grid_latitudes = (grid_digits // olc.GRID_COLUMNS_) @ row_place_values
+        grid_longitudes = (grid_digits % olc.GRID_COLUMNS_) @ column_place_values
+        latitude_precision = float(row_place_values[-1]) / olc.FINAL_LAT_PRECISION_
+        longitude_precision = float(column_place_values[-1]) / olc.FINAL_LNG_PRECISION_
+
+    latitudes = normal_latitudes.astype(float) / olc.PAIR_PRECISION_ + grid_latitudes.astype(float) / olc.FINAL_LAT_PRECISION_
+    longitudes = normal_longitudes.astype(float) / olc.PAIR_PRECISION_ + grid_longitudes.astype(float) / olc.FINAL_LNG_PRECISION_
+    return (
+        _round_14(latitudes),
+        _round_14(longitudes),
+        _round_14(latitudes + latitude_precision),
+        _round_14(longitudes + longitude_precision),
+    )
+
+
+def decode_ubids(ubids) -> tuple[np.ndarray, np.ndarray]:
+    """Vectorized `buildingid.code.decode` of an array of UBIDs
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: Bounds of each UBID as (min longitude, min latitude, max longitude, max latitude),
+            and the centroid of each UBID as (longitude, latitude). Missing UBIDs have NaN bounds and centroids.
+    """
+    ubids = np.asarray(ubids, dtype=object)
+    bounds = np.full((len(ubids), 4), np.nan)
+    centroids = np.full((len(ubids), 2), np.nan)
+    valid = np.flatnonzero(pd.notna(ubids))
+    if len(valid) == 0:
+        return bounds, centroids
+
+    parts = [ubid.split("-") for ubid in ubids[valid]]
+    if any(len(part) != 5 for part in parts):
+        raise ValueError("Invalid UBID")
+    try:
+        extents = np.array([part[1:] for part in parts], dtype=np.int64)
+    except ValueError:
+        raise ValueError("Invalid UBID")
+
+    # characters of the Open Location Codes, which have the separator after the first 8 digits
+    characters = np.char.upper(np.array([part[0] for part in parts], dtype="S"))
+    characters = characters.view(np.uint8).reshape(len(parts), -1)
+    if characters.shape[1] <= olc.SEPARATOR_POSITION_ or (characters[:, olc.SEPARATOR_POSITION_] != ord(olc.SEPARATOR_)).any():
+        raise ValueError("Invalid UBID")
+    characters = np.delete(characters, olc.SEPARATOR_POSITION_, axis=1)
+    digits = OLC_DIGITS[characters]
+    padding = (characters == ord(olc.PADDING_CHARACTER_)) | (characters == 0)
+    if ((digits == -1) & ~padding).any():
+        raise ValueError("Invalid UBID")
+    digit_counts = (digits != -1).sum(axis=1)
+
+    for digit_count in np.unique(digit_counts):
+        members = np.flatnonzero(digit_counts == digit_count)
+        latitude_lo, longitude_lo, latitude_hi, longitude_hi = _decode_olc_digits(digits[members, :digit_count])
+        count_north, count_east, count_south, count_west = extents[members].T
+
+        # the UBID extends from the center code area by a number of code areas in each direction
+        height = latitude_hi - latitude_lo
+        width = longitude_hi - longitude_lo
+        bounds[valid[members]] = np.column_stack(
+            (
+                longitude_lo - count_west * width,
+                latitude_lo - count_south * height,
+                longitude_hi + count_east * width,
+                latitude_hi + count_north * height,
+            )
+        )
+        centroids[valid[members]] = np.column_stack(
+            (
+                np.minimum(longitude_lo + (longitude_hi - longitude_lo) / 2, olc.LONGITUDE_MAX_),
+                np.minimum(latitude_lo + (latitude_hi - latitude_lo) / 2, olc.LATITUDE_MAX_),
+            )
+        )
+
+    return bounds, centroids
+
+
+def ubid_geometries(ubids) -> tuple[np.ndarray, np.ndarray]:
+    """Bounding box polygons and centroid points of an array of UBIDs, decoding each UBID once
+
+    The polygons have the same vertex order as `bounding_box`. Missing UBIDs have None geometries.
+    """
+    bounds, centroids = decode_ubids(ubids)
+    west, south, east, north = bounds.T
+    valid = ~np.isnan(west)
+
+    corners = np.stack(
+        [
+            np.column_stack((west, north)),
+            np.column_stack((east, north)),
+            np.column_stack((east, south)),
+            np.column_stack((west, south)),
+            np.column_stack((west, north)),
+        ],
+        axis=1,
+    )
+    bounding_boxes = np.full(len(bounds), None, dtype=object)
+    bounding_boxes[valid] = shapely.polygons(corners[valid])
+    points = np.full(len(bounds), None, dtype=object)
+    points[valid] = shapely.points(centroids[valid])
+
+    return bounding_boxes, points
+
+
 # Return UBID bounding box as polygon
 def bounding_box(ubid: str) -> Polygon:
     code_area = decode(ubid)
@@ -65,12 +306,16 @@ def add_ubid_to_geodataframe(
             gdf[column] = None
 
     # UBID is always calculated and stored in 'ubid'
-    gdf.loc[filter_str, "ubid"] = gdf[filter_str].apply(lambda x: encode_ubid(x[footprint_column]), axis=1)
+    gdf.loc[filter_str, "ubid"] = encode_ubids(gdf.loc[filter_str, footprint_column].to_numpy())
+
+    # decode each UBID once for both of the additional columns
+    if "ubid_centroid" in additional_ubid_columns_to_create or "ubid_bbox" in additional_ubid_columns_to_create:
+        bounding_boxes, centroids = ubid_geometries(gdf.loc[filter_str, "ubid"].to_numpy())
 
-    if "ubid_centroid" in additional_ubid_columns_to_create:
-        gdf.loc[filter_str, "ubid_centroid"] = gdf[filter_str].apply(lambda x: centroid(x["ubid"]), axis=1)
+        if "ubid_centroid" in additional_ubid_columns_to_create:
+            gdf.loc[filter_str, "ubid_centroid"] = centroids
 
-    if "ubid_bbox" in additional_ubid_columns_to_create:
-        gdf.loc[filter_str, "ubid_bbox"] = gdf[filter_str].apply(lambda x: bounding_box(x["ubid"]), axis=1)
+        if "ubid_bbox" in additional_ubid_columns_to_create:
+            gdf.loc[filter_str, "ubid_bbox"] = bounding_boxes
 
     return gdf
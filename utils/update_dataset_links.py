@@ -6,28 +6,86 @@ See also https://github.com/SEED-platform/seed/blob/main/LICENSE.md
 
 import base64
 import hashlib
+import json
+import os
 from pathlib import Path
+from typing import Optional
 
+import pandas as pd
 import requests
 
+from utils.manifest import DEFAULT_TTL, is_fresh, load_manifest, manifest_entry, save_manifest
+from utils.metrics import metrics
+
 DATASET_URL = "https://minedbuildings.z5.web.core.windows.net/global-buildings/dataset-links.csv"
 
 
-def update_dataset_links(save_directory: Path = Path("data/quadkeys")):
+def update_dataset_links(save_directory: Path = Path("data/quadkeys"), ttl: float = DEFAULT_TTL):
     """
     Downloads the csv with URLs for all quadkeys
     Skip the download if it has already been downloaded, and it is up-to-date
+    Skip checking for updates if it was downloaded or checked within the last `ttl` seconds
     """
     # make sure the save directory exists
     save_directory.mkdir(parents=True, exist_ok=True)
     quadkey_links_file = save_directory / "dataset-links.csv"
 
+    manifest = load_manifest(save_directory)
+    entry = manifest.get(quadkey_links_file.name)
+    if is_fresh(entry, quadkey_links_file, ttl):
+        return
+
     download = True
     if quadkey_links_file.exists():
-        local_md5 = base64.b64encode(hashlib.md5(open(quadkey_links_file, "rb").read()).digest()).decode("UTF-8")
-        remote_md5 = requests.head(DATASET_URL).headers["Content-MD5"]
+        # only hash the local file if it wasn't recorded when it was downloaded
+        if is_fresh(entry, quadkey_links_file, float("inf")) and entry.get("content_md5"):
+            local_md5 = entry["content_md5"]
+        else:
+            local_md5 = base64.b64encode(hashlib.md5(open(quadkey_links_file, "rb").read()).digest()).decode("UTF-8")
+        response = requests.head(DATASET_URL)
+        metrics.count_response(response, 0)
+        remote_md5 = response.headers["Content-MD5"]
         download = local_md5 != remote_md5
 
     if download:
+        response = requests.get(DATASET_URL)
+        metrics.count_response(response)
         with open(quadkey_links_file, "wb") as f:
-            f.write(requests.get(DATASET_URL).content)
+            f.write(response.content)
+        local_md5 = response.headers.get("Content-MD5")
+
+    manifest[quadkey_links_file.name] = manifest_entry(quadkey_links_file, response.headers.get("ETag"), content_md5=local_md5)
+    save_manifest(manifest, save_directory)
+
+
+def load_dataset_links(save_directory: Path = Path("data/quadkeys")) -> dict[int, list[dict]]:
+    """
+    Load the URLs and sizes of all quadkeys, keyed by quadkey
+    The lookup is saved as json the first time each version of the csv is loaded
+    """
+    quadkey_links_file = save_directory / "dataset-links.csv"
+    catalog_file = save_directory / "dataset-links.json"
+
+    if catalog_file.exists() and catalog_file.stat().st_mtime_ns >= quadkey_links_file.stat().st_mtime_ns:
+        with open(catalog_file) as f:
+            return {int(quadkey): links for quadkey, links in json.load(f).items()}
+
+    df_update = pd.read_csv(save_directory / "dataset-links.csv")
+    catalog: dict[int, list[dict]] = {}
+    for quadkey, url, size in zip(df_update["QuadKey"].tolist(), df_update["Url"].tolist(), df_update["Size"].tolist()):
+        catalog.setdefault(quadkey, []).append({"url": url, "size": size})
+
+    temp_file = save_directory / "dataset-links.json.tmp"
+    with open(temp_file, "w") as f:
+        json.dump(catalog, f)
+    os.replace(temp_file, catalog_file)
+
+    return catalog
+
+
+def dataset_version(save_directory: Path = Path("data/quadkeys")) -> Optional[str]:
+    """Version of the downloaded dataset-links, which changes whenever the footprints are updated"""
+    entry = load_manifest(save_directory).get("dataset-links.csv")
+    if entry is None:
+        return None
+    return entry.get("content_md5") or entry["etag"]
@@ -4,36 +4,216 @@ SEED Platform (TM), Copyright (c) Alliance for Sustainable Energy, LLC, and othe
 See also https://github.com/SEED-platform/seed/blob/main/LICENSE.md
 """
 
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
+from typing import Optional
 
-import pandas as pd
 import requests
+from requests.adapters import HTTPAdapter
 from tqdm import tqdm
 
+from utils.load_quadkey import quadkey_cache_file
+from utils.manifest import DEFAULT_TTL, is_fresh, load_manifest, manifest_entry, save_manifest
+from utils.metrics import metrics
+from utils.update_dataset_links import load_dataset_links
 
-def update_quadkeys(quadkeys: list[int], save_directory: Path = Path("data/quadkeys")):
+DEFAULT_MAX_WORKERS = 8
+CHUNK_SIZE = 1024 * 1024
+MAX_ATTEMPTS = 5
+BACKOFF_FACTOR = 1
+RETRY_STATUSES = [429, 500, 502, 503, 504]
+TIMEOUT = 60
+
+
+def _create_session(max_workers: int) -> requests.Session:
+    """Create a session whose connection pool is shared by all workers
+
+    Failed requests are retried by `_head` and `_download` themselves, not by the adapter, so that they aren't retried twice.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def _backoff(attempt: int, response: Optional[requests.Response] = None):
+    """Wait before the next attempt, as long as the server asks to if it does"""
+    retry_after = response.headers.get("Retry-After", "") if response is not None else ""
+    time.sleep(float(retry_after) if retry_after.isdigit() else BACKOFF_FACTOR * 2**attempt + random.uniform(0, 1))
+
+
+def _head(session: requests.Session, url: str) -> requests.Response:
+    """Request the headers of a quadkey, retrying rate limited and server errors, and connection failures, with backoff"""
+    for attempt in range(MAX_ATTEMPTS):
+        try:
+            response = session.head(url, timeout=TIMEOUT)
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt == MAX_ATTEMPTS - 1:
+                raise
+            _backoff(attempt)
+            continue
+        metrics.count_response(response, 0)
+        if response.status_code in RETRY_STATUSES and attempt < MAX_ATTEMPTS - 1:
+            _backoff(attempt, response)
+            continue
+        response.raise_for_status()
+        return response
+
+
+def _validator(response: requests.Response) -> Optional[str]:
+    """The strong ETag of a response, or its Last-Modified date, which the server compares to an If-Range header"""
+    etag = response.headers.get("ETag")
+    if etag is not None and not etag.startswith("W/"):
+        return etag
+    return response.headers.get("Last-Modified")
+
+
+def _download(session: requests.Session, url: str, quadkey_file: Path) -> Optional[str]:
+    """Stream a quadkey to a partial file, resuming it if a previous download was interrupted,
+    then move it into place so that an incomplete download is never mistaken for a quadkey
+
+    The partial file is only resumed with an If-Range of the version it was started from (saved next to it),
+    so the server sends the whole quadkey instead if it changed since.
+
+    Returns the ETag of the download
+    """
+    partial_file = quadkey_file.with_name(f"{quadkey_file.name}.part")
+    validator_file = quadkey_file.with_name(f"{quadkey_file.name}.part.validator")
+    etag = None
+
+    for attempt in range(MAX_ATTEMPTS):
+        offset = partial_file.stat().st_size if partial_file.exists() else 0
+        validator = validator_file.read_text() if validator_file.exists() else None
+        # a partial file without the version it was started from can't be resumed safely
+        headers = {"Range": f"bytes={offset}-", "If-Range": validator} if offset and validator else {}
+        try:
+            with session.get(url, headers=headers, stream=True, timeout=TIMEOUT) as response:
+                # the streamed bytes are counted as they're written
+                metrics.count_response(response, 0)
+                # the partial file is as long as the quadkey, or longer, but can't be verified, so start over
+                if response.status_code == 416:
+                    partial_file.unlink()
+                    validator_file.unlink(missing_ok=True)
+                    if attempt == MAX_ATTEMPTS - 1:
+                        raise requests.ConnectionError(f"Unsatisfiable range requested from {url}")
+                    continue
+                # rate limited and server errors are retried until the last attempt, which raises them
+                if response.status_code in RETRY_STATUSES and attempt < MAX_ATTEMPTS - 1:
+                    # release the connection while waiting
+                    response.close()
+                    _backoff(attempt, response)
+                    continue
+                response.raise_for_status()
+                etag = response.headers.get("ETag")
+
+                # append if the server honored the range, otherwise start over
+                if response.status_code == 206:
+                    mode = "ab"
+                    expected_size = int(response.headers["Content-Range"].split("/")[-1])
+                else:
+                    mode = "wb"
+                    expected_size = int(response.headers.get("Content-Length", -1))
+                    # record the version being downloaded before any of it is written
+                    validator = _validator(response)
+                    if validator is not None:
+                        validator_file.write_text(validator)
+                    else:
+                        validator_file.unlink(missing_ok=True)
+
+                with open(partial_file, mode) as f:
+                    for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                        f.write(chunk)
+                        metrics.count("http_bytes", len(chunk))
+
+            if expected_size in {-1, partial_file.stat().st_size}:
+                break
+
+            # the partial file was left over from a different version of the quadkey
+            partial_file.unlink()
+            validator_file.unlink(missing_ok=True)
+            if attempt == MAX_ATTEMPTS - 1:
+                raise requests.ConnectionError(f"Incomplete download of {url}")
+        except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError):
+            if attempt == MAX_ATTEMPTS - 1:
+                raise
+            _backoff(attempt)
+
+    os.replace(partial_file, quadkey_file)
+    validator_file.unlink(missing_ok=True)
+
+    return etag
+
+
+def _update_quadkey(session: requests.Session, quadkey: int, url: str, save_directory: Path, entry: Optional[dict]) -> dict:
+    """Download a quadkey if it's missing or out-of-date, and return its manifest entry"""
+    download = True
+    quadkey_file = save_directory / f"{quadkey}.geojsonl.gz"
+
+    if quadkey_file.exists():
+        response = _head(session, url)
+        etag = response.headers.get("ETag")
+        local_size = quadkey_file.stat().st_size
+        remote_size = int(response.headers["Content-Length"])
+        # a recorded ETag also catches updates that didn't change the size
+        download = local_size != remote_size or (entry is not None and entry["etag"] is not None and entry["etag"] != etag)
+
+    if download:
+        etag = _download(session, url, quadkey_file)
+        metrics.count("quadkey_downloads")
+
+        # the preprocessed footprints are stale once a new version is downloaded
+        quadkey_cache_file(quadkey, save_directory).unlink(missing_ok=True)
+
+    return manifest_entry(quadkey_file, etag)
+
+
+def update_quadkeys(
+    quadkeys: list[int],
+    save_directory: Path = Path("data/quadkeys"),
+    skip_missing: bool = False,
+    max_workers: int = DEFAULT_MAX_WORKERS,
+    ttl: float = DEFAULT_TTL,
+):
     """Downloads a list of quadkeys.
     Skip the download if it has already been downloaded, and it is up-to-date
+    Skip checking for updates of quadkeys that were downloaded or checked within the last `ttl` seconds
+    If `skip_missing` is set, quadkeys that aren't in the dataset (e.g. no footprints) are skipped instead of raising
+    Quadkeys are checked and downloaded concurrently by `max_workers` threads
     """
     save_directory.mkdir(parents=True, exist_ok=True)
-    df_update = pd.read_csv(save_directory / "dataset-links.csv")
-
-    for quadkey in tqdm(quadkeys):
-        download = True
-        quadkey_file = save_directory / f"{quadkey}.geojsonl.gz"
-        rows = df_update[df_update["QuadKey"] == quadkey]
-        if rows.shape[0] == 1:
-            url = rows.iloc[0]["Url"]
-        elif rows.shape[0] > 1:
+    dataset_links = load_dataset_links(save_directory)
+
+    urls = {}
+    for quadkey in quadkeys:
+        links = dataset_links.get(quadkey, [])
+        if len(links) == 1:
+            urls[quadkey] = links[0]["url"]
+        elif len(links) > 1:
             raise ValueError(f"Multiple rows found for QuadKey: {quadkey}")
-        else:
+        elif not skip_missing:
             raise ValueError(f"QuadKey not found in dataset: {quadkey}")
 
-        if quadkey_file.exists():
-            local_size = quadkey_file.stat().st_size
-            remote_size = int(requests.head(url).headers["Content-Length"])
-            download = local_size != remote_size
+    manifest = load_manifest(save_directory)
+    stale = {
+        quadkey: url
+        for quadkey, url in urls.items()
+        if not is_fresh(manifest.get(f"{quadkey}.geojsonl.gz"), save_directory / f"{quadkey}.geojsonl.gz", ttl)
+    }
+    if not stale:
+        return
 
-        if download:
-            with open(quadkey_file, "wb") as f:
-                f.write(requests.get(url).content)
+    with _create_session(max_workers) as session, ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(_update_quadkey, session, quadkey, url, save_directory, manifest.get(f"{quadkey}.geojsonl.gz")): quadkey
+            for quadkey, url in stale.items()
+        }
+        try:
+            for future in tqdm(as_completed(futures), total=len(futures)):
+                manifest[f"{futures[future]}.geojsonl.gz"] = future.result()
+        finally:
+            # keep the entries of the quadkeys that finished, even if another one failed
+            save_manifest(manifest, save_directory)